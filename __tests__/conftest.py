@@ -0,0 +1,4 @@
+import os
+
+# Tests never reach Google Datastore
+os.environ.setdefault("DATASTORE_BACKEND", "memory")
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.Admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    AdmissionRule,
+    ConcurrencyLimiter,
+    Priority,
+    TokenBucket,
+)
+
+
+class TestTokenBucket(TestCase):
+    def test_take(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        now = bucket.updated
+
+        # Should allow bursts, then wait for the refill
+        self.assertEqual(bucket.take(now=now), 0)
+        self.assertEqual(bucket.take(now=now), 0)
+        self.assertAlmostEqual(bucket.take(now=now), 0.1)
+        self.assertEqual(bucket.take(now=now + 0.11), 0)
+
+
+class TestConcurrencyLimiter(TestCase):
+    def test_priority_shares(self):
+        limiter = ConcurrencyLimiter(4)
+
+        # Should shed bulk requests before reads
+        self.assertTrue(limiter.try_acquire(Priority.BULK))
+        self.assertFalse(limiter.try_acquire(Priority.BULK))
+        self.assertTrue(limiter.try_acquire(Priority.READ))
+        self.assertTrue(limiter.try_acquire(Priority.READ))
+        self.assertTrue(limiter.try_acquire(Priority.READ))
+        self.assertFalse(limiter.try_acquire(Priority.READ))
+        limiter.release()
+        self.assertTrue(limiter.try_acquire(Priority.READ))
+
+
+class TestAdmissionMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.controller = AdmissionController(
+            [
+                AdmissionRule("health", r"/health", priority=None),
+                AdmissionRule("items", r"/items", rate=1, burst=2),
+            ],
+            max_concurrency=8,
+            enabled=True,
+        )
+        app = FastAPI()
+        app.add_middleware(AdmissionMiddleware, controller=self.controller)
+        app.get("/items")(lambda: [])
+        app.get("/health")(lambda: "ok")
+        self.client = TestClient(app)
+
+    def test_rate_limit(self):
+        statuses = [self.client.get("/items").status_code for _ in range(3)]
+
+        # Should reject requests beyond the burst with a retry hint
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get("/items")
+        self.assertEqual(response.headers["retry-after"], "1")
+        self.assertEqual(self.controller.metrics()["rules"][1]["rate_limited"], 2)
+
+        # Should release every concurrency slot
+        self.assertEqual(self.controller.limiter.in_flight, 0)
+
+    def test_exempt(self):
+        statuses = {self.client.get("/health").status_code for _ in range(5)}
+        self.assertEqual(statuses, {200})
+
+    def test_shed(self):
+        self.controller.limiter.in_flight = 8
+
+        # Should shed load once the concurrency limit is reached
+        self.assertEqual(self.client.get("/items").status_code, 503)
+
+        # Should keep the tokens of shed requests for their retries
+        self.controller.limiter.in_flight = 0
+        statuses = [self.client.get("/items").status_code for _ in range(2)]
+        self.assertEqual(statuses, [200, 200])
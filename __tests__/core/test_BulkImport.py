@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from core.BulkImport import import_rows, parse_csv, parse_ndjson, parser_of
+from schemas.pydantic.AuthorSchema import Author
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def collect(rows):
+    async def run():
+        return [row async for row in rows]
+
+    return asyncio.run(run())
+
+
+class TestParsers(TestCase):
+    def test_ndjson(self):
+        data = b'{"id": 1, "name": "\xc3\xa9"}\n\n{"id": 2}\nnot json'
+        rows = collect(parse_ndjson(chunked(data, 3)))
+
+        # Should parse lines split across chunks, reporting invalid ones
+        self.assertEqual(rows[0], (1, {"id": 1, "name": "é"}))
+        self.assertEqual(rows[1], (3, {"id": 2}))
+        self.assertEqual(rows[2][0], 4)
+        self.assertIsInstance(rows[2][1], ValueError)
+
+    def test_csv(self):
+        data = 'id,name\n1,"Multi\nLine, é"\n2,B\n3\n'.encode()
+        rows = collect(parse_csv(chunked(data, 4)))
+
+        # Should keep quoted newlines and number rows by their first line
+        self.assertEqual(rows[0], (2, {"id": "1", "name": "Multi\nLine, é"}))
+        self.assertEqual(rows[1], (4, {"id": "2", "name": "B"}))
+        self.assertEqual(rows[2][0], 5)
+        self.assertIsInstance(rows[2][1], ValueError)
+
+    def test_parser_of(self):
+        self.assertIs(parser_of("text/csv; charset=utf-8"), parse_csv)
+        self.assertIs(parser_of("application/x-ndjson"), parse_ndjson)
+        self.assertIsNone(parser_of("application/json"))
+
+
+class TestImportRows(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.written = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def write(self, authors):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+            self.written.extend(authors)
+        return len(authors)
+
+    def test_import(self):
+        data = b"".join(
+            b'{"id": %d, "name": "Author"}\n' % id for id in range(25)
+        ) + b'{"id": "x", "name": "Author"}\n'
+        reports = collect(
+            import_rows(
+                parse_ndjson(chunked(data, 64)),
+                Author,
+                self.write,
+                chunk_size=5,
+                max_in_flight=2,
+            )
+        )
+
+        # Should report every chunk in order, then a summary
+        self.assertEqual([r.get("chunk") for r in reports[:-1]], list(range(6)))
+        self.assertEqual(reports[-1]["written"], 25)
+        self.assertEqual(reports[-1]["failed"], 1)
+        self.assertEqual(reports[-2]["errors"][0]["line"], 26)
+        self.assertEqual(len(self.written), 25)
+        # Should never write more than `max_in_flight` chunks at once
+        self.assertLessEqual(self.max_in_flight, 2)
+
+    def test_streamed_reports(self):
+        async def run():
+            reported = asyncio.Event()
+            sent = []
+
+            async def rows():
+                # A slow upload, ending early once a chunk was reported
+                while not reported.is_set() and len(sent) < 50:
+                    sent.append(len(sent))
+                    yield len(sent), {"id": len(sent), "name": "Author"}
+                    await asyncio.sleep(0.01)
+
+            reports = []
+            async for report in import_rows(
+                rows(), Author, self.write, chunk_size=2, max_in_flight=100
+            ):
+                if "chunk" in report and not reported.is_set():
+                    reported.set()
+                    read = len(sent)
+                reports.append(report)
+            return read, reports
+
+        read, reports = asyncio.run(run())
+
+        # Should report written chunks while the upload is still being read
+        self.assertLess(read, 50)
+        self.assertEqual(reports[-1]["written"], len(self.written))
+
+    def test_csv_lists(self):
+        data = b"id,name,books\n1,Author,3;4\n2,Author,\n"
+        reports = collect(
+            import_rows(
+                parse_csv(chunked(data, 8)), Author, self.write, csv_rows=True
+            )
+        )
+
+        # Should split list cells and drop empty ones
+        self.assertEqual(reports[-1]["written"], 2)
+        self.assertEqual(self.written[0].books, [3, 4])
+        self.assertEqual(self.written[1].books, [])
+
+    def test_write_failure(self):
+        def write(authors):
+            raise RuntimeError("unavailable")
+
+        reports = collect(
+            import_rows(
+                parse_ndjson(chunked(b'{"id": 1, "name": "A"}', 8)),
+                Author,
+                write,
+            )
+        )
+
+        # Should report the failed chunk and carry on
+        self.assertEqual(reports[0]["error"], "unavailable")
+        self.assertEqual(reports[-1]["failed"], 1)
@@ -0,0 +1,124 @@
+import asyncio
+import gzip
+import zlib
+from unittest import TestCase
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from core.Compression import (
+    CompressionMiddleware,
+    compressed_bodies,
+    negotiate,
+)
+
+
+class TestNegotiate(TestCase):
+    def test_negotiate(self):
+        codecs = {"br": None, "gzip": None}
+
+        # Should prefer the server order among equal qualities
+        self.assertEqual(negotiate("gzip, br", codecs), "br")
+        self.assertEqual(negotiate("gzip;q=1, br;q=0.5", codecs), "gzip")
+        self.assertEqual(negotiate("*", codecs), "br")
+        self.assertEqual(negotiate("*, br;q=0", codecs), "gzip")
+        self.assertIsNone(negotiate("identity", codecs))
+        self.assertIsNone(negotiate("", codecs))
+
+
+class TestCompressionMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        compressed_bodies.clear()
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware, minimum_size=100)
+        app.get("/small")(lambda: {"name": "a"})
+        app.get("/large")(lambda: [{"name": "a" * 10}] * 50)
+        app.get("/text")(
+            lambda: PlainTextResponse("x" * 1000, media_type="image/png")
+        )
+
+        def stream():
+            return StreamingResponse(
+                (b'{"id": %d}\n' % i for i in range(100)),
+                media_type="application/x-ndjson",
+            )
+
+        app.get("/stream")(stream)
+        self.client = TestClient(app)
+
+    def get(self, path: str, encoding: str = "gzip"):
+        return self.client.get(path, headers={"Accept-Encoding": encoding})
+
+    def test_threshold(self):
+        # Should send small and incompressible responses as is
+        self.assertNotIn("content-encoding", self.get("/small").headers)
+        self.assertNotIn("content-encoding", self.get("/text").headers)
+        self.assertNotIn(
+            "content-encoding", self.get("/large", "identity").headers
+        )
+
+    def test_compress(self):
+        response = self.get("/large")
+
+        # Should compress, decoded transparently by the client
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertLess(
+            int(response.headers["content-length"]), len(response.content)
+        )
+        self.assertEqual(len(response.json()), 50)
+
+    def test_cache(self):
+        first = self.get("/large")
+        second = self.get("/large")
+
+        # Should compress equal bodies once
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(compressed_bodies.hits, 1)
+        self.assertEqual(compressed_bodies.misses, 1)
+
+    def test_stream(self):
+        with self.client.stream(
+            "GET", "/stream", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+
+        # Should compress chunk by chunk without a content length
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        lines = gzip.decompress(raw).splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines[-1], b'{"id": 99}')
+
+    def test_stream_flush(self):
+        chunk = b'{"id": 1, "name": "JK Rowling"}\n' * 10
+        sent = []
+
+        async def app(scope, receive, send):
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"application/x-ndjson")],
+                }
+            )
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            # Decoded by the client while the response is still open
+            decoded = zlib.decompressobj(31).decompress(sent[1]["body"])
+            sent.append(decoded)
+            await send({"type": "http.response.body", "body": chunk})
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "headers": [(b"accept-encoding", b"gzip")],
+        }
+        asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, None, send))
+
+        # Should flush every streamed chunk
+        self.assertEqual(sent[2], chunk)
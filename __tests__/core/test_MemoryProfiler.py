@@ -0,0 +1,116 @@
+import tracemalloc
+from unittest import TestCase
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.MemoryProfiler import (
+    OPERATION,
+    REQUEST,
+    MemoryProfiler,
+    MemoryProfilerMiddleware,
+    memory_profiler,
+)
+from datastore.database import DB
+from datastore.memory import MemoryClient
+from schemas.pydantic.AuthorSchema import Author
+
+MiB = 1024 * 1024
+
+
+def allocate(size: int) -> bytearray:
+    return bytearray(size)
+
+
+class TestMemoryProfiler(TestCase):
+    profiler: MemoryProfiler
+
+    def setUp(self):
+        super().setUp()
+        self.profiler = MemoryProfiler()
+        self.profiler.start()
+
+    def tearDown(self):
+        self.profiler.stop()
+        super().tearDown()
+
+    def stats(self, name: str) -> dict:
+        return next(s for s in self.profiler.stats() if s["name"] == name)
+
+    def test_disabled(self):
+        self.profiler.stop()
+
+        # Should do nothing while stopped
+        with self.profiler.scope("ignored") as scope:
+            allocate(MiB)
+        self.assertIsNone(scope)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(self.profiler.stats(), [])
+        self.assertEqual(self.profiler.top_allocations(), [])
+
+    def test_nested_scopes(self):
+        with self.profiler.scope("outer"):
+            kept = allocate(MiB)
+            with self.profiler.scope("inner"):
+                allocate(2 * MiB)
+            allocate(MiB // 2)
+
+        outer, inner = self.stats("outer"), self.stats("inner")
+
+        # Should record peaks within each scope, the outer one including the inner one
+        self.assertGreaterEqual(inner["peak_max"], 2 * MiB)
+        self.assertLess(inner["peak_max"], 2 * MiB + MiB // 2)
+        self.assertGreaterEqual(outer["peak_max"], 3 * MiB)
+        self.assertLess(outer["peak_max"], 3 * MiB + MiB // 2)
+        # Should record what the scope left allocated
+        self.assertGreaterEqual(outer["retained_mean"], MiB)
+        self.assertLess(inner["retained_mean"], MiB // 4)
+        self.assertEqual(len(kept), MiB)
+
+    def test_top_allocations(self):
+        kept = allocate(4 * MiB)
+        top = self.profiler.top_allocations(limit=1)
+
+        # Should point at the line holding the most memory
+        self.assertIn("test_MemoryProfiler.py", top[0]["site"])
+        self.assertGreaterEqual(top[0]["size"], 4 * MiB)
+        self.assertEqual(len(kept), 4 * MiB)
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        super().setUp()
+        app = FastAPI()
+        app.add_middleware(MemoryProfilerMiddleware)
+
+        @app.get("/items/{id}")
+        def item(id: int):
+            return {"id": id, "size": len(allocate(MiB))}
+
+        self.client = TestClient(app)
+        memory_profiler.start()
+
+    def tearDown(self):
+        memory_profiler.stop()
+        memory_profiler.reset()
+        super().tearDown()
+
+    def test_requests(self):
+        self.client.get("/items/1")
+        self.client.get("/items/2")
+        self.client.get("/missing")
+        stats = {s["name"]: s for s in memory_profiler.stats(REQUEST)}
+
+        # Should record requests by route template
+        self.assertEqual(stats["GET /items/{id}"]["count"], 2)
+        self.assertGreaterEqual(stats["GET /items/{id}"]["peak_max"], MiB)
+        self.assertEqual(stats["GET unmatched"]["count"], 1)
+
+    def test_db_operations(self):
+        db = DB(Author)
+        db.client = MemoryClient(project=Author.DatastoreConfig.project)
+        db.client.put_multi(Author(id=i, name=f"Author {i}").as_entity for i in range(100))
+        db.list(limit=100)
+
+        # Should record DB operations by name and kind
+        self.assertIn("db.list Author", [s["name"] for s in memory_profiler.stats(OPERATION)])
@@ -0,0 +1,77 @@
+import json
+from unittest import TestCase
+
+import strawberry
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from config import config
+from core.PersistedQueries import (
+    DocumentCache,
+    PersistedQueryRouter,
+    documents,
+    query_hash,
+)
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def hello(self) -> str:
+        return "world"
+
+
+class TestPersistedQueryRouter(TestCase):
+    def setUp(self):
+        super().setUp()
+        schema = strawberry.Schema(query=Query, extensions=[DocumentCache])
+        app = FastAPI()
+        app.include_router(PersistedQueryRouter(schema), prefix="/graphql")
+        self.client = TestClient(app)
+        self.query = "{ hello }"
+        self.extensions = {
+            "persistedQuery": {"version": 1, "sha256Hash": query_hash(self.query)}
+        }
+
+    def get(self):
+        return self.client.get(
+            "/graphql",
+            params={"extensions": json.dumps(self.extensions)},
+            headers={"Accept": "application/json"},
+        )
+
+    def test_persisted_query(self):
+        # Should ask for the query of an unknown hash
+        response = self.get()
+        self.assertEqual(
+            response.json()["errors"][0]["extensions"]["code"],
+            "PERSISTED_QUERY_NOT_FOUND",
+        )
+        self.assertNotIn("cache-control", response.headers)
+
+        # Should register the query, then answer by hash only
+        self.client.post(
+            "/graphql", json={"query": self.query, "extensions": self.extensions}
+        )
+        response = self.get()
+        self.assertEqual(response.json(), {"data": {"hello": "world"}})
+        self.assertTrue(response.headers["cache-control"].startswith("public"))
+        # Should be cached per tenant
+        self.assertIn(config.TENANT_HEADER, response.headers["vary"])
+
+    def test_hash_mismatch(self):
+        response = self.client.post(
+            "/graphql", json={"query": "{ __typename }", "extensions": self.extensions}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_document_cache(self):
+        query = "{ hello __typename }"
+        for _ in range(2):
+            response = self.client.post("/graphql", json={"query": query})
+            self.assertEqual(response.json()["data"]["hello"], "world")
+
+        # Should keep the parsed document and its validation result
+        document, _, errors = documents.get(query_hash(query))
+        self.assertEqual(errors, [])
+        self.assertEqual(document.loc.source.body, query)
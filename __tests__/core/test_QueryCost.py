@@ -0,0 +1,96 @@
+import asyncio
+from typing import List, Optional
+from unittest import TestCase
+from unittest.mock import AsyncMock, patch
+
+import strawberry
+
+from config import config
+from core.QueryCost import QueryCostExtension
+from schemas.graphql.Query import Query as AuthorQuery
+
+
+@strawberry.type
+class Book:
+    id: int
+    title: str
+
+
+@strawberry.type
+class Writer:
+    id: int
+
+    @strawberry.field
+    def books(self, page_size: Optional[int] = 10) -> List[Book]:
+        return []
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def writers(self, page_size: Optional[int] = 100) -> List[Writer]:
+        return []
+
+
+class TestQueryCostExtension(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.schema = strawberry.Schema(query=Query, extensions=[QueryCostExtension])
+
+    def cost(self, query: str, **variables) -> int:
+        result = self.schema.execute_sync(query, variable_values=variables)
+        self.assertIsNone(result.errors)
+        return result.extensions["cost"]["requested"]
+
+    def test_list_cost(self):
+        # Should cost the field plus each of the requested items
+        self.assertEqual(self.cost("{ writers { id } }"), 1 + 100)
+        self.assertEqual(self.cost("{ writers(pageSize: 5) { id } }"), 1 + 5)
+        self.assertEqual(
+            self.cost(
+                "query ($n: Int) { writers(pageSize: $n) { books { title } } }",
+                n=2,
+            ),
+            1 + 2 * (1 + 1 + 10),
+        )
+
+    def test_aliases_and_fragments(self):
+        self.assertEqual(
+            self.cost(
+                "fragment W on Writer { id } "
+                "{ a: writers(pageSize: 1) { ...W } b: writers(pageSize: 1) { ...W } }"
+            ),
+            2 * (1 + 1),
+        )
+
+    def test_budget(self):
+        result = self.schema.execute_sync(
+            "{ writers(pageSize: 100) { books(pageSize: 100) { id } } }"
+        )
+
+        # Should reject before execution
+        self.assertIsNone(result.data)
+        self.assertEqual(result.errors[0].extensions["cost"], 1 + 100 * (1 + 1 + 100))
+
+    def test_batched_relationships(self):
+        query = "{ writers(pageSize: 5) { id books { title } } }"
+
+        # Should cost a batched relationship once for the whole list
+        with patch.dict("core.QueryCost.BATCHED_FIELDS", {"Writer.books": 1}):
+            self.assertEqual(self.cost(query), 1 + 5 * (1 + 0) + 1)
+        self.assertEqual(self.cost(query), 1 + 5 * (1 + 1 + 10))
+
+    def test_authors_with_books(self):
+        schema = strawberry.Schema(query=AuthorQuery, extensions=[QueryCostExtension])
+        authorService = AsyncMock()
+        authorService.list_async.return_value = []
+        result = asyncio.run(
+            schema.execute(
+                "{ authors { id name books { id name } } }",
+                context_value={"authorService": authorService},
+            )
+        )
+
+        # Should accept the default page of authors with their books
+        self.assertIsNone(result.errors)
+        self.assertLessEqual(result.extensions["cost"]["requested"], config.GRAPHQL_MAX_COST)
@@ -0,0 +1,131 @@
+import asyncio
+from unittest import TestCase
+
+import httpx
+from fastapi import FastAPI
+
+from core.ResponseCache import (
+    CacheRule,
+    ResponseCache,
+    ResponseCacheMiddleware,
+    cache_key,
+)
+from datastore.namespace import use_namespace
+
+
+class TestResponseCacheMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = 0
+        self.cache = ResponseCache(100)
+        self.rule = CacheRule(
+            "items", r"/items/?$", ttl=60, stale=60, tags=("items",)
+        )
+        app = FastAPI()
+        app.add_middleware(
+            ResponseCacheMiddleware,
+            rules=[self.rule],
+            cache=self.cache,
+            enabled=True,
+        )
+
+        @app.get("/items/")
+        async def items(size: int = 1):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return [self.calls] * size
+
+        @app.get("/other")
+        async def other():
+            self.calls += 1
+            return self.calls
+
+        self.app = app
+
+    def run_requests(self, *paths: str, concurrent: bool = False):
+        async def run():
+            async with httpx.AsyncClient(
+                app=self.app, base_url="http://test"
+            ) as client:
+                if concurrent:
+                    return await asyncio.gather(
+                        *(client.get(path) for path in paths)
+                    )
+                return [await client.get(path) for path in paths]
+
+        return asyncio.run(run())
+
+    def test_cache_key(self):
+        # Should not depend on the order of query parameters
+        self.assertEqual(
+            cache_key("/items/", b"a=1&b=2"),
+            cache_key("/items/", b"b=2&a=1"),
+        )
+
+    def test_hit(self):
+        first, second, other = self.run_requests(
+            "/items/?size=2", "/items/?size=2", "/other"
+        )
+
+        # Should replay the response of matching routes only
+        self.assertEqual(first.headers["x-cache"], "MISS")
+        self.assertEqual(second.headers["x-cache"], "HIT")
+        self.assertEqual(second.json(), [1, 1])
+        self.assertNotIn("x-cache", other.headers)
+        self.assertEqual(self.calls, 2)
+
+    def test_coalescing(self):
+        responses = self.run_requests(*["/items/"] * 10, concurrent=True)
+
+        # Should run concurrent identical misses once
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({r.json()[0] for r in responses}, {1})
+        self.assertEqual(self.cache.coalesced, 9)
+
+    def test_stale_while_revalidate(self):
+        self.rule.ttl = 0
+
+        async def run():
+            async with httpx.AsyncClient(
+                app=self.app, base_url="http://test"
+            ) as client:
+                first = await client.get("/items/")
+                stale = await client.get("/items/")
+                # Let the background refresh finish
+                await asyncio.sleep(0.05)
+                self.rule.ttl = 60
+                fresh = await client.get("/items/")
+                return first, stale, fresh
+
+        first, stale, fresh = asyncio.run(run())
+
+        # Should serve the stale entry while refreshing it
+        self.assertEqual(stale.headers["x-cache"], "STALE")
+        self.assertEqual(stale.json(), [1])
+        self.assertEqual(fresh.headers["x-cache"], "HIT")
+        self.assertEqual(fresh.json(), [2])
+
+    def test_invalidate(self):
+        self.run_requests("/items/")
+        self.cache.invalidate("items")
+        (response,) = self.run_requests("/items/")
+
+        # Should drop the tagged responses
+        self.assertEqual(response.headers["x-cache"], "MISS")
+        self.assertEqual(response.json(), [2])
+
+    def test_tenants(self):
+        self.run_requests("/items/")
+        (tenant,) = self.run_requests_as("acme", "/items/")
+        self.cache.invalidate("items")
+        (default,) = self.run_requests("/items/")
+
+        # Should cache and invalidate the responses of each tenant apart
+        self.assertEqual(tenant.headers["x-cache"], "MISS")
+        self.assertEqual(default.headers["x-cache"], "MISS")
+        (tenant,) = self.run_requests_as("acme", "/items/")
+        self.assertEqual(tenant.headers["x-cache"], "HIT")
+
+    def run_requests_as(self, tenant: str, *paths: str):
+        with use_namespace(tenant):
+            return self.run_requests(*paths)
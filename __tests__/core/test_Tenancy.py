@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.Tenancy import TenantMiddleware, metrics
+from datastore.namespace import current_namespace
+
+
+class TestTenantMiddleware(TestCase):
+    def setUp(self):
+        super().setUp()
+        app = FastAPI()
+        app.add_middleware(TenantMiddleware, path_prefix="/tenants", required=True)
+        app.get("/items")(lambda: current_namespace())
+        app.get("/v1/admin/health")(lambda: current_namespace())
+        self.client = TestClient(app)
+
+    def test_header(self):
+        response = self.client.get("/items", headers={"X-Tenant-ID": "acme"})
+
+        # Should run the request in the tenant namespace
+        self.assertEqual(response.json(), "acme")
+        self.assertGreaterEqual(metrics()["acme"]["requests"], 1)
+
+    def test_path(self):
+        response = self.client.get("/tenants/globex/items")
+
+        # Should strip the tenant prefix before routing
+        self.assertEqual(response.json(), "globex")
+
+    def test_rejected(self):
+        # Should reject missing and invalid tenants, except on exempt paths
+        self.assertEqual(self.client.get("/items").status_code, 400)
+        self.assertEqual(
+            self.client.get(
+                "/items", headers={"X-Tenant-ID": "__reserved"}
+            ).status_code,
+            400,
+        )
+        self.assertIsNone(self.client.get("/v1/admin/health").json())
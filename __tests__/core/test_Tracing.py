@@ -0,0 +1,100 @@
+import asyncio
+from unittest import TestCase
+
+from core.Tracing import (
+    INVALID_SPAN,
+    InMemorySpanExporter,
+    Tracer,
+    traced,
+    tracer,
+)
+
+
+class TestTracer(TestCase):
+    exporter: InMemorySpanExporter
+    tracer: Tracer
+
+    def setUp(self):
+        super().setUp()
+        self.exporter = InMemorySpanExporter()
+        self.tracer = Tracer(self.exporter, sample_rate=1.0)
+
+    def test_child_spans(self):
+        with self.tracer.start_as_current_span("root") as root:
+            with self.tracer.start_as_current_span(
+                "child", {"db.datastore.kind": "Author"}
+            ) as child:
+                pass
+
+        # Should export children before their parent
+        spans = self.exporter.get_finished_spans()
+        self.assertEqual([s.name for s in spans], ["child", "root"])
+
+        # Should link the child to its parent within one trace
+        self.assertEqual(child.trace_id, root.trace_id)
+        self.assertEqual(child.parent_id, root.span_id)
+        self.assertEqual(
+            child.attributes["db.datastore.kind"], "Author"
+        )
+
+    def test_unsampled_trace(self):
+        self.tracer.configure(sample_rate=0.0)
+
+        with self.tracer.start_as_current_span("root") as root:
+            with self.tracer.start_as_current_span("child") as child:
+                child.set_attribute("ignored", True)
+
+        # Should hand out non recording spans and export nothing
+        self.assertIs(root, INVALID_SPAN)
+        self.assertIs(child, INVALID_SPAN)
+        self.assertEqual(self.exporter.get_finished_spans(), [])
+
+    def test_record_exception(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.start_as_current_span("root"):
+                raise ValueError("boom")
+
+        # Should mark the span as failed
+        (span,) = self.exporter.get_finished_spans()
+        self.assertEqual(span.status, "ERROR")
+        self.assertEqual(span.attributes["exception.type"], "ValueError")
+
+
+class TestTraced(TestCase):
+    exporter: InMemorySpanExporter
+
+    def setUp(self):
+        super().setUp()
+        self.exporter = InMemorySpanExporter()
+        self.sample_rate = tracer.sample_rate
+        self.previous_exporter = tracer.exporter
+        tracer.configure(exporter=self.exporter, sample_rate=1.0)
+
+    def tearDown(self):
+        tracer.exporter = self.previous_exporter
+        tracer.sample_rate = self.sample_rate
+        super().tearDown()
+
+    def test_sync(self):
+        @traced("service.test")
+        def handler(value):
+            return value * 2
+
+        self.assertEqual(handler(2), 4)
+
+        # Should wrap the call in a span
+        (span,) = self.exporter.get_finished_spans()
+        self.assertEqual(span.name, "service.test")
+
+    def test_async(self):
+        @traced("router.test")
+        async def handler():
+            await asyncio.sleep(0)
+            return "done"
+
+        self.assertEqual(asyncio.run(handler()), "done")
+
+        # Should keep the span open across awaits
+        (span,) = self.exporter.get_finished_spans()
+        self.assertEqual(span.name, "router.test")
+        self.assertIsNotNone(span.duration_ms)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from core import Warmup
+from core.PersistedQueries import persisted_queries
+from datastore import entitycache
+from datastore.memory import MemoryClient
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+
+
+class TestWarmup(TestCase):
+    def setUp(self):
+        super().setUp()
+        entitycache.clear_all()
+        persisted_queries.clear()
+        Warmup.progress = Warmup.WarmupProgress()
+        self.client = MemoryClient(project=Author.DatastoreConfig.project)
+        self.client.put_multi(
+            [Author(id=id, name=f"Author {id}").as_entity for id in range(10)]
+        )
+        for patcher in (
+            patch("datastore.database.base_client", self.client),
+            patch.object(Warmup.config, "ENTITY_CACHE_ENABLED", True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.path = os.path.join(tempfile.mkdtemp(), "snapshot.json")
+
+    def warm_up(self):
+        asyncio.run(
+            Warmup.warm_up(None, [Author, Book], dict, snapshot_path=self.path)
+        )
+
+    def cache(self):
+        return entitycache.get_cache(Author.DatastoreConfig)
+
+    def test_top_n(self):
+        with patch.object(Warmup.config, "WARMUP_TOP_N", 4):
+            self.warm_up()
+
+        # Should load the first keys of cached kinds without snapshot
+        self.assertTrue(Warmup.progress.ready)
+        self.assertEqual(Warmup.progress.keys_loaded, 4)
+        self.assertEqual(len(self.cache()), 4)
+
+    def test_snapshot(self):
+        self.cache().set_many(
+            [Author(id=id, name="Author").as_entity for id in (7, 8)]
+        )
+        persisted_queries.set("hash", "mutation { deleteAuthor(authorId: 1) }")
+        self.assertEqual(Warmup.save_snapshot(self.path), 2)
+        entitycache.clear_all()
+        persisted_queries.clear()
+
+        self.warm_up()
+
+        # Should restore the hot keys and persisted queries, never running mutations
+        self.assertEqual(Warmup.progress.keys_total, 2)
+        self.assertIsNotNone(self.cache().get(Author.make_key(id=8)))
+        self.assertEqual(len(persisted_queries), 1)
+        self.assertEqual(Warmup.progress.errors, 0)
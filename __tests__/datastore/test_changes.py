@@ -0,0 +1,98 @@
+import asyncio
+from unittest import TestCase
+
+from datastore.changes import ChangeBus, Operation, TooManySubscribers
+from datastore.namespace import use_namespace
+
+
+class TestChangeBus(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.bus = ChangeBus(history=10, max_subscribers=2)
+
+    def run_async(self, coroutine):
+        return asyncio.run(asyncio.wait_for(coroutine, 1))
+
+    def test_no_subscribers(self):
+        # Should keep the changes of kinds without subscribers for later resumes
+        self.assertEqual(self.bus.publish("Author", Operation.UPSERT, "1").sequence, 1)
+        self.assertEqual(self.bus.metrics()["history"], 1)
+
+    def test_resume_after_disconnect(self):
+        async def run():
+            with self.bus.subscribe("Author") as subscription:
+                self.bus.publish("Author", Operation.UPSERT, "1")
+                last_event_id = (await subscription.get()).sequence
+            # Written while the only subscriber is disconnected
+            self.bus.publish("Author", Operation.UPSERT, "2")
+            self.bus.publish("Author", Operation.DELETE, "1")
+            with self.bus.subscribe("Author", since=last_event_id) as subscription:
+                return [(await subscription.get()).id for _ in range(2)]
+
+        # Should replay the changes made during the gap
+        self.assertEqual(self.run_async(run()), ["2", "1"])
+
+    def test_filters(self):
+        async def run():
+            with self.bus.subscribe(
+                "Author", ids=[1], operations=[Operation.DELETE]
+            ) as subscription:
+                self.bus.publish("Author", Operation.UPSERT, "1")
+                self.bus.publish("Author", Operation.DELETE, "2")
+                self.bus.publish("Book", Operation.DELETE, "1")
+                with use_namespace("acme"):
+                    self.bus.publish("Author", Operation.DELETE, "1")
+                self.bus.publish("Author", Operation.DELETE, "1")
+                return await subscription.get(), len(subscription._events)
+
+        event, buffered = self.run_async(run())
+
+        # Should deliver the matching changes of the same tenant only
+        self.assertEqual((event.id, event.operation, event.sequence), ("1", "delete", 5))
+        self.assertEqual(buffered, 0)
+
+    def test_bounded_buffer(self):
+        async def run():
+            with self.bus.subscribe("Author", maxsize=3) as subscription:
+                for id in range(5):
+                    self.bus.publish("Author", Operation.UPSERT, id)
+                return [(await subscription.get()).id for _ in range(3)], subscription
+
+        ids, subscription = self.run_async(run())
+
+        # Should drop the oldest events of slow subscribers
+        self.assertEqual(ids, [2, 3, 4])
+        self.assertEqual(subscription.dropped, 2)
+        self.assertFalse(self.bus.has_subscribers("Author"))
+
+    def test_threads(self):
+        async def run():
+            with self.bus.subscribe("Author") as subscription:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, self.bus.publish, "Author", Operation.UPSERT, "1"
+                )
+                return await subscription.get()
+
+        # Should wake subscribers for changes published by other threads
+        self.assertEqual(self.run_async(run()).id, "1")
+
+    def test_resume(self):
+        async def run():
+            with self.bus.subscribe("Author"):
+                for id in range(3):
+                    self.bus.publish("Author", Operation.UPSERT, id)
+            with self.bus.subscribe("Author", since=1) as subscription:
+                return [(await subscription.get()).sequence for _ in range(2)]
+
+        # Should replay the kept events following `since`
+        self.assertEqual(self.run_async(run()), [2, 3])
+
+    def test_max_subscribers(self):
+        async def run():
+            self.bus.subscribe("Author")
+            self.bus.subscribe("Book")
+            self.bus.subscribe("Author")
+
+        with self.assertRaises(TooManySubscribers):
+            self.run_async(run())
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from threading import Thread
+from unittest import TestCase
+
+from google.api_core.exceptions import Aborted
+
+from datastore.counter import (
+    GROWTH_CONFLICTS,
+    SHARD_KIND,
+    CounterError,
+    ShardedCounter,
+)
+from datastore.memory import MemoryClient
+from datastore.namespace import use_namespace
+
+
+class ContendedClient(MemoryClient):
+    """Memory client whose next `conflicts` transactions abort"""
+
+    conflicts = 0
+
+    @contextmanager
+    def transaction(self, **kwargs):
+        with super().transaction():
+            if self.conflicts:
+                self.conflicts -= 1
+                raise Aborted("too much contention")
+            yield self
+
+
+class TestShardedCounter(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = ContendedClient(project="test")
+        self.counter = ShardedCounter(
+            "test.views", self.client, shards=4, max_shards=16, cache_ttl=60
+        )
+
+    def shards(self):
+        return list(self.client.query(kind=SHARD_KIND).fetch())
+
+    def test_increment(self):
+        threads = [
+            Thread(target=lambda: [self.counter.increment(1) for _ in range(50)])
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.counter.increment(2, 5)
+
+        # Should spread increments over the shards and sum them on read
+        self.assertEqual(self.counter.values([1, 2, 3]), {1: 200, 2: 5, 3: 0})
+        self.assertLessEqual(len(self.shards()), 5)
+        self.assertGreater(len(self.shards()), 2)
+
+    def test_cache(self):
+        self.counter.increment(1)
+        self.assertEqual(self.counter.value(1), 1)
+        self.counter.increment(1, 2)
+
+        # Should serve cached sums, updated by local increments
+        self.assertEqual(self.counter.value(1), 3)
+        self.assertEqual(self.counter.reads, 1)
+        self.assertEqual(self.counter.cache_hits, 1)
+
+    def test_growth(self):
+        self.client.conflicts = GROWTH_CONFLICTS
+        self.counter.increment(1)
+
+        # Should double the shard count of contended items
+        self.assertEqual(self.counter.shard_count(1), 8)
+        self.assertEqual(self.counter.growths, 1)
+
+        # Should pick up shard counts grown by other processes
+        other = ShardedCounter("test.views", self.client, shards=4)
+        for index in range(8):
+            other._add(other._key(None, "1", index), "1", 1)
+        self.assertEqual(other.value(1), 9)
+        self.assertEqual(other.shard_count(1), 8)
+
+    def test_conflicts(self):
+        self.client.conflicts = 100
+
+        # Should give up after every attempt conflicted
+        with self.assertRaises(CounterError):
+            self.counter.increment(1)
+        self.assertEqual(self.counter.value(1), 0)
+
+    def test_namespace(self):
+        with use_namespace("acme"):
+            self.counter.increment(1)
+
+        # Should count each tenant apart
+        self.assertEqual(self.counter.value(1), 0)
+        with use_namespace("acme"):
+            self.assertEqual(self.counter.value(1), 1)
@@ -0,0 +1,138 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+
+from config import config
+from datastore import entitycache
+from datastore.changes import change_bus
+from datastore.database import DB, DatabaseError
+from datastore.memory import MemoryClient
+from datastore.namespace import use_namespace
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+
+
+class TestDB(TestCase):
+    db: DB
+
+    def setUp(self):
+        super().setUp()
+        entitycache.clear_all()
+        self.db = DB(Author)
+        self.db.client = self.client = MemoryClient(
+            project=Author.DatastoreConfig.project
+        )
+        self.db.create(Author(id=1, name="JK Rowling", books=[1, 2]))
+        self.db.create(Author(id=2, name="Ray Dalio", books=[2, 3]))
+        self.db.client.put_multi(
+            [Book(id=id, name=f"Book {id}").as_entity for id in (1, 2)]
+        )
+
+    def test_exists(self):
+        # Should look up keys without fetching the entity
+        self.assertTrue(self.db.exists(Author.make_key(id=1)))
+        self.assertFalse(self.db.exists(Author.make_key(id=3)))
+
+    def test_exists_many(self):
+        keys = [Author.make_key(id=id) for id in (1, 2, 3)]
+
+        with patch.object(self.db.client, "query", wraps=self.db.client.query) as query:
+            found = self.db.exists_many(keys)
+
+        # Should report every key, from a single keys only query
+        self.assertEqual(list(found.values()), [True, True, False])
+        query.assert_called_once()
+
+    def test_include(self):
+        with patch.object(
+            self.db.client, "get_multi", wraps=self.db.client.get_multi
+        ) as get_multi:
+            authors = self.db.list(include=["books"])
+
+        # Should load every referred book in a single lookup
+        get_multi.assert_called_once()
+        self.assertEqual(len(get_multi.call_args.args[0]), 3)
+        self.assertEqual(
+            [[book.name for book in author.books] for author in authors],
+            [["Book 1", "Book 2"], ["Book 2"]],
+        )
+
+    def test_include_get(self):
+        author = self.db.get(Author.make_key(id=1), include=["books"])
+
+        # Should store the foreign keys of included entities
+        self.assertIsInstance(author.books[0], Book)
+        self.assertEqual(author.as_entity["books"], [1, 2])
+
+    def test_include_unknown(self):
+        with self.assertRaises(DatabaseError):
+            self.db.list(include=["publisher"])
+
+    def test_namespace(self):
+        with use_namespace("acme"):
+            self.db.create(Author(id=1, name="Acme Author"))
+            tenant_authors = self.db.list()
+            tenant_key = Author.make_key(id=1)
+
+        # Should keep the records of each tenant apart
+        self.assertEqual([a.name for a in tenant_authors], ["Acme Author"])
+        self.assertEqual(tenant_key.namespace, "acme")
+        self.assertEqual(self.db.get(Author.make_key(id=1)).name, "JK Rowling")
+        self.assertEqual(len(self.db.list()), 2)
+
+    def test_upsert_many(self):
+        authors = [Author(id=id, name="Author") for id in range(3, 1203)]
+        with patch.object(
+            self.db.client, "put_multi", wraps=self.db.client.put_multi
+        ) as put_multi:
+            written = self.db.upsert_many(authors)
+
+        # Should write in commits of at most 500 entities
+        self.assertEqual(written, 1200)
+        self.assertEqual(
+            [len(c.args[0]) for c in put_multi.call_args_list], [500, 500, 200]
+        )
+        self.assertEqual(self.db.get(id=1202).name, "Author")
+
+    def test_changes(self):
+        async def run():
+            with change_bus.subscribe("Author") as subscription:
+                self.db.upsert(Author(id=3, name="Adam Smith"))
+                self.db.delete(Author.make_key(id=3))
+                return [await subscription.get() for _ in range(2)]
+
+        upsert, delete = asyncio.run(run())
+
+        # Should publish the writes of the kind
+        self.assertEqual(upsert.record.name, "Adam Smith")
+        self.assertEqual((delete.operation, delete.id), ("delete", "3"))
+
+    def test_entity_cache(self):
+        # Should read through to Datastore unless enabled
+        self.assertIsNone(self.db.entity_cache)
+
+        with patch.object(config, "ENTITY_CACHE_ENABLED", True):
+            self.db = DB(Author)
+        self.db.client = self.client
+        key = Author.make_key(id=1)
+        self.db.get(key)
+        with patch.object(self.db.client, "get") as get:
+            cached = self.db.get(key)
+
+        # Should serve key lookups from the entity cache
+        get.assert_not_called()
+        self.assertEqual(cached.name, "JK Rowling")
+
+        # Should write through and drop deleted entities
+        self.db.upsert(Author(id=1, name="Rowling"))
+        self.assertEqual(self.db.get(key).name, "Rowling")
+        self.db.delete(key)
+        self.assertIsNone(self.db.get(key))
+
+    def test_get_many(self):
+        keys = [Author.make_key(id=id) for id in (2, 5, 1)]
+        records = self.db.get_many(keys)
+
+        # Should return the records found in the order of their keys
+        self.assertEqual([r.id for r in records], [2, 1])
+        self.assertEqual(len(self.db.list_keys(limit=1)), 1)
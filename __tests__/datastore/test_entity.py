@@ -0,0 +1,57 @@
+from typing import List
+from unittest import TestCase
+
+from google.cloud.datastore import Entity
+
+from datastore import DatastoreEntity
+
+
+class Chapter(DatastoreEntity):
+    title: str
+    notes: List[str] = []
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Chapter"
+        key_pattern = "{title}"
+        compressed_fields = ["notes"]
+
+
+class Novel(DatastoreEntity):
+    id: int
+    name: str
+    chapters: List[Chapter] = []
+    foreword: Chapter = None
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Novel"
+        key_pattern = "{id}"
+        embedded_entity_fields = ["chapters", "foreword"]
+
+
+class TestEmbeddedEntities(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.novel = Novel(
+            id=1,
+            name="Dune",
+            chapters=[
+                Chapter(title=f"Chapter {i}", notes=["draft"]) for i in range(3)
+            ],
+            foreword=Chapter(title="Foreword"),
+        )
+
+    def test_as_entity(self):
+        entity = self.novel.as_entity
+        chapter = entity["chapters"][0]
+
+        # Should embed key-less entities with their own encoding
+        self.assertEqual(entity.key.name, "1")
+        self.assertIsInstance(chapter, Entity)
+        self.assertIsNone(chapter.key)
+        self.assertIsInstance(chapter["notes"], bytes)
+        self.assertIn("notes", chapter.exclude_from_indexes)
+        self.assertEqual(entity["foreword"]["title"], "Foreword")
+
+    def test_from_entity(self):
+        # Should decode what `as_entity` encodes
+        self.assertEqual(Novel.from_entity(self.novel.as_entity), self.novel)
@@ -0,0 +1,136 @@
+import io
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from unittest import TestCase, skipUnless
+
+from datastore import DatastoreEntity, export
+from datastore.database import DB
+from datastore.memory import MemoryClient
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+
+if export.is_available():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+
+class Review(DatastoreEntity):
+    title: str
+    score: float
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Review"
+        key_pattern = "{title}"
+
+
+class Edition(DatastoreEntity):
+    id: int
+    published: datetime
+    reviews: List[Review] = []
+    notes: List[str] = []
+    tags: Dict[str, str] = {}
+    summary: Optional[str] = None
+    token: str = ""
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Edition"
+        key_pattern = "{id}"
+        compressed_fields = ["notes"]
+        embedded_entity_fields = ["reviews"]
+        private_fields = ["token"]
+
+
+@skipUnless(export.is_available(), "pyarrow is not installed")
+class TestExport(TestCase):
+    db: DB
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(Edition)
+        self.db.client = MemoryClient(project=Edition.DatastoreConfig.project)
+        self.published = datetime(2020, 1, 1, tzinfo=timezone.utc)
+        self.db.client.put_multi(
+            Edition(
+                id=i,
+                published=self.published,
+                reviews=[Review(title="Good", score=4.5)],
+                notes=[f"note {i}"],
+                tags={"lang": "en"},
+                token="secret",
+            ).as_entity
+            for i in range(25)
+        )
+
+    def test_arrow_schema(self):
+        schema = export.arrow_schema(Edition)
+
+        # Should map fields to Arrow types, JSON for mappings, without private fields
+        self.assertEqual(schema.field("id").type, pa.int64())
+        self.assertFalse(schema.field("id").nullable)
+        self.assertEqual(schema.field("published").type, pa.timestamp("us", tz="UTC"))
+        self.assertEqual(
+            schema.field("reviews").type,
+            pa.list_(
+                pa.struct(
+                    [
+                        pa.field("title", pa.string(), nullable=False),
+                        pa.field("score", pa.float64(), nullable=False),
+                    ]
+                )
+            ),
+        )
+        self.assertEqual(schema.field("notes").type, pa.list_(pa.string()))
+        self.assertEqual(schema.field("tags").type, pa.string())
+        self.assertTrue(schema.field("summary").nullable)
+        self.assertNotIn("token", schema.names)
+        self.assertEqual(schema.metadata[b"kind"], b"Edition")
+
+    def test_foreign_keys(self):
+        batch = next(
+            export.record_batches(
+                Author, [Author(id=1, name="Herbert", books=[Book(id=2, name="Dune"), 3])]
+            )
+        )
+
+        # Should export foreign keys as the ids they hold
+        self.assertEqual(batch.schema.field("books").type, pa.list_(pa.int64()))
+        self.assertEqual(batch.column("books").to_pylist(), [[2, 3]])
+
+    def test_record_batches(self):
+        batches = list(export.record_batches(Edition, self.db.scan(), batch_size=10))
+
+        # Should bound batches to batch_size
+        self.assertEqual([batch.num_rows for batch in batches], [10, 10, 5])
+
+    def test_write_parquet(self):
+        sink = io.BytesIO()
+        written = export.write(Edition, self.db.scan(), sink, batch_size=10)
+        sink.seek(0)
+        parquet = pq.ParquetFile(sink)
+        table = parquet.read()
+
+        # Should write one row group per batch, with compressed fields decoded
+        self.assertEqual(written, 25)
+        self.assertEqual(parquet.num_row_groups, 3)
+        row = table.filter(pa.compute.equal(table["id"], 7)).to_pylist()[0]
+        self.assertEqual(row["notes"], ["note 7"])
+        self.assertEqual(row["reviews"], [{"title": "Good", "score": 4.5}])
+        self.assertEqual(row["tags"], '{"lang":"en"}')
+        self.assertEqual(row["published"], self.published)
+
+    def test_stream_arrow(self):
+        chunks = list(export.stream(Edition, self.db.scan(), export.ARROW, batch_size=10))
+        table = pa.ipc.open_stream(b"".join(chunks)).read_all()
+
+        # Should yield a chunk per batch, then the end of the stream
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(sorted(table["id"].to_pylist()), list(range(25)))
+
+    def test_stream_parquet(self):
+        data = b"".join(export.stream(Edition, self.db.scan(), batch_size=10))
+
+        self.assertEqual(pq.read_table(pa.BufferReader(data)).num_rows, 25)
+
+    def test_unknown_format(self):
+        with self.assertRaises(export.ExportError):
+            export.write(Edition, [], io.BytesIO(), format="csv")
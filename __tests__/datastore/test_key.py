@@ -0,0 +1,59 @@
+import pickle
+from unittest import TestCase
+
+from google.cloud.datastore import Key
+
+from datastore.key import DatastoreKey
+
+
+class TestDatastoreKey(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.key = DatastoreKey.from_path("Author", 1, project="local")
+
+    def test_compatible_with_key(self):
+        key = Key("Author", 1, project="local")
+
+        # Should compare and hash like the client library key
+        self.assertEqual(self.key, key)
+        self.assertEqual(key, self.key)
+        self.assertEqual(hash(self.key), hash(key))
+        self.assertEqual(self.key.path, key.path)
+        self.assertEqual(DatastoreKey(key), self.key)
+
+    def test_urlsafe(self):
+        parsed = DatastoreKey.from_urlsafe(str(self.key))
+
+        # Should round trip and intern parsed keys
+        self.assertEqual(parsed, self.key)
+        self.assertIs(DatastoreKey.from_urlsafe(str(self.key)), parsed)
+        self.assertIs(pickle.loads(pickle.dumps(parsed)), parsed)
+        with self.assertRaises(ValueError):
+            DatastoreKey.from_urlsafe("not a key")
+
+    def test_protobuf(self):
+        key = DatastoreKey.from_path(
+            "Author", 1, "Book", "b1", project="local", namespace="tenant"
+        )
+        pb = key.to_protobuf()
+
+        # Should match the client library serialization
+        self.assertEqual(pb, Key(*key.flat_path, project="local", namespace="tenant").to_protobuf())
+        self.assertEqual(DatastoreKey.from_protobuf(pb), key)
+        self.assertEqual(key.parent, DatastoreKey.from_path("Author", 1, project="local", namespace="tenant"))
+
+    def test_partial(self):
+        partial = DatastoreKey.from_path("Author", project="local")
+
+        self.assertTrue(partial.is_partial)
+        self.assertNotEqual(partial, DatastoreKey.from_path("Author", project="local"))
+        self.assertEqual(partial.completed_key(1), self.key)
+
+    def test_kind_class(self):
+        # Should cache subclasses per kind
+        self.assertIs(DatastoreKey["Author"], DatastoreKey["Author"])
+        self.assertEqual(DatastoreKey["Author"]({"id": 1, "project": "local"}), self.key)
+
+        # Should keep the kind class when pickled
+        key = DatastoreKey["Author"]({"id": 2, "project": "local"})
+        self.assertEqual(type(pickle.loads(pickle.dumps(key)))._kind, "Author")
@@ -0,0 +1,95 @@
+from unittest import TestCase
+
+from google.cloud.datastore import Entity, Key
+
+from datastore.memory import MemoryClient
+
+
+class TestMemoryClient(TestCase):
+    client: MemoryClient
+
+    def setUp(self):
+        super().setUp()
+        self.client = MemoryClient(project="test")
+        self.client.put_multi(
+            self.entity(id, name, tags)
+            for id, name, tags in [
+                (1, "JK Rowling", ["fantasy"]),
+                (2, "Ray Dalio", ["finance"]),
+                (3, "Stephen King", ["horror", "fantasy"]),
+                (4, "Adam Smith", ["finance"]),
+            ]
+        )
+
+    def entity(self, id, name, tags):
+        entity = Entity(key=Key("Author", id, project="test"))
+        entity.update(id=id, name=name, tags=tags)
+        return entity
+
+    def ids(self, query, **kwargs):
+        return [e["id"] for e in query.fetch(**kwargs)]
+
+    def test_get_put_delete(self):
+        key = Key("Author", 2, project="test")
+        self.assertEqual(self.client.get(key)["name"], "Ray Dalio")
+
+        self.client.put(self.entity(2, "Ray", ["finance"]))
+
+        # Should overwrite the entity and its index entries
+        self.assertEqual(self.client.get(key)["name"], "Ray")
+        self.assertEqual(
+            self.ids(self.client.query(kind="Author", filters=[("name", "=", "Ray Dalio")])),
+            [],
+        )
+
+        self.client.delete(key)
+
+        # Should drop the entity
+        self.assertIsNone(self.client.get(key))
+
+    def test_filters(self):
+        query = self.client.query(kind="Author", filters=[("id", ">", 1), ("id", "<=", 3)])
+
+        # Should apply range filters in key order
+        self.assertEqual(self.ids(query), [2, 3])
+
+        query = self.client.query(kind="Author", filters=[("tags", "=", "fantasy")])
+
+        # Should match any element of list properties
+        self.assertEqual(self.ids(query), [1, 3])
+
+        keys = [Key("Author", id, project="test") for id in (4, 2, 9)]
+        query = self.client.query(kind="Author", filters=[("__key__", "IN", keys)])
+
+        # Should match any of the values of an IN filter
+        self.assertEqual(self.ids(query), [2, 4])
+
+    def test_order_and_cursor(self):
+        query = self.client.query(kind="Author")
+        query.order = ["-name"]
+
+        page = query.fetch(limit=3)
+
+        # Should order results and hand out a cursor for the next page
+        self.assertEqual([e["id"] for e in page], [3, 2, 1])
+        self.assertEqual(
+            self.ids(query, start_cursor=page.next_page_token), [4]
+        )
+
+    def test_keys_only(self):
+        query = self.client.query(kind="Author", filters=[("tags", "=", "finance")])
+        query.keys_only()
+
+        # Should return entities without properties
+        results = list(query.fetch())
+        self.assertEqual([e.key.id for e in results], [2, 4])
+        self.assertEqual([dict(e) for e in results], [{}, {}])
+
+    def test_namespaces(self):
+        key = Key("Author", 1, project="test", namespace="tenant")
+
+        # Should keep namespaces apart
+        self.assertIsNone(self.client.get(key))
+        self.assertEqual(
+            self.ids(self.client.query(kind="Author", namespace="tenant")), []
+        )
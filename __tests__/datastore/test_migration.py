@@ -0,0 +1,118 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from google.cloud.datastore import Entity
+
+from datastore.memory import MemoryClient
+from datastore.namespace import use_namespace
+from datastore.migration import Checkpoint, Migration, MigrationRunner, rewrite_with
+from schemas.pydantic.AuthorSchema import Author
+
+
+def add_country(entity):
+    if "country" in entity:
+        return None
+    entity["country"] = "UK"
+    return entity
+
+
+def upper_name(entity):
+    entity["name"] = entity["name"].upper()
+    return entity
+
+
+class TestMigrationRunner(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, "Author.json")
+        self.client = MemoryClient(project=Author.DatastoreConfig.project)
+        self.client.put_multi(
+            Author(id=i, name=f"Author {i}").as_entity for i in range(25)
+        )
+        self.migrations = [
+            Migration("Author", 1, add_country),
+            Migration("Author", 2, upper_name),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def runner(self, **kwargs) -> MigrationRunner:
+        return MigrationRunner(
+            self.client,
+            "Author",
+            self.migrations,
+            checkpoint_path=self.checkpoint,
+            batch_size=10,
+            **kwargs,
+        )
+
+    def entity(self, id: int) -> Entity:
+        return self.client.get(Author.make_key(id=id))
+
+    def test_run(self):
+        progress = self.runner().run(to_version=1)
+
+        # Should migrate every entity and record the version
+        self.assertEqual((progress.processed, progress.written), (25, 25))
+        self.assertEqual(self.entity(3)["country"], "UK")
+        self.assertEqual(Checkpoint.load(self.checkpoint, "Author").version, 1)
+
+        # Should only apply newer migrations afterwards
+        progress = self.runner().run()
+        self.assertEqual(progress.target_version, 2)
+        self.assertEqual(self.entity(3)["name"], "AUTHOR 3")
+        self.assertEqual(self.runner().run().processed, 25)
+
+    def test_namespace(self):
+        with use_namespace("acme"):
+            self.client.put(Author(id=1, name="Acme Author").as_entity)
+        runner = self.runner(namespace="acme")
+        runner.migrations = [
+            Migration("Author", 1, rewrite_with(Author)),
+            Migration("Author", 2, upper_name),
+        ]
+        progress = runner.run()
+        migrated = list(self.client.query(kind="Author", namespace="acme").fetch())
+
+        # Should rewrite the entity in its own namespace, leaving the default one alone
+        self.assertEqual((progress.processed, progress.written), (1, 1))
+        self.assertEqual([e["name"] for e in migrated], ["ACME AUTHOR"])
+        self.assertEqual(migrated[0].key.namespace, "acme")
+        self.assertEqual(self.entity(1)["name"], "Author 1")
+        self.assertEqual(len(list(self.client.query(kind="Author").fetch())), 25)
+
+    def test_resume(self):
+        Checkpoint("Author", target_version=2, cursor=None).save(self.checkpoint)
+        runner = self.runner()
+        runner._fetch = _interrupt_after(runner._fetch, pages=1)
+        with self.assertRaises(KeyboardInterrupt):
+            runner.run()
+
+        # Should continue from the stored cursor
+        checkpoint = Checkpoint.load(self.checkpoint, "Author")
+        self.assertEqual((checkpoint.version, checkpoint.processed), (0, 10))
+        progress = self.runner().run()
+        self.assertEqual((progress.processed, progress.written), (25, 25))
+        self.assertEqual(self.entity(20)["name"], "AUTHOR 20")
+
+    def test_dry_run(self):
+        self.runner(dry_run=True).run()
+
+        # Should neither write nor checkpoint
+        self.assertNotIn("country", self.entity(3))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+
+def _interrupt_after(fetch, pages: int):
+    calls = iter(range(pages + 1))
+
+    def interrupted(cursor):
+        if next(calls) == pages:
+            raise KeyboardInterrupt
+        return fetch(cursor)
+
+    return interrupted
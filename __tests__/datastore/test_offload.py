@@ -0,0 +1,113 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+from unittest import TestCase
+from unittest.mock import patch
+
+from datastore import DatastoreEntity
+from datastore.database import DB
+from datastore.memory import MemoryClient
+from datastore.offload import Offloader, parse_batch
+
+
+class Manuscript(DatastoreEntity):
+    id: int
+    title: str
+    pages: Optional[List[str]] = []
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Manuscript"
+        key_pattern = "{id}"
+        compressed_fields = ["pages"]
+
+
+def title_of(manuscript: Manuscript) -> str:
+    return manuscript.title
+
+
+def segments() -> set:
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+class TestOffloader(TestCase):
+    offloader: Offloader
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Every batch is offloaded, the pool is shared by the tests to spawn it once
+        cls.offloader = Offloader(processes=2, min_bytes=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.offloader.shutdown()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.records = [
+            Manuscript(id=i, title=f"Manuscript {i}", pages=[f"page {p}" for p in range(i)])
+            for i in range(1, 6)
+        ]
+        self.records.append(Manuscript(id=6, title="Untitled", pages=None))
+
+    def test_encode_many(self):
+        before = segments()
+        entities = self.offloader.encode_many(self.records)
+
+        # Should encode as `as_entity` does, without leaking shared memory
+        self.assertEqual(entities, [record.as_entity for record in self.records])
+        self.assertEqual([e.key for e in entities], [r.key for r in self.records])
+        self.assertEqual(segments(), before)
+        self.assertGreater(self.offloader.offloaded, 0)
+
+    def test_decode_many(self):
+        entities = [record.as_entity for record in self.records]
+        entities.append({"id": "invalid", "title": "Invalid"})
+        before = segments()
+
+        # Should parse as `parse_batch` does, skipping and logging invalid entities
+        with self.assertLogs("datastore.offload", "WARNING") as logs:
+            parsed = parse_batch(Manuscript, entities)
+        self.assertIn("Skipped invalid Manuscript entity", logs.output[0])
+        self.assertEqual(self.offloader.decode_many(Manuscript, entities), parsed)
+        self.assertEqual(
+            self.offloader.decode_many(Manuscript, entities, lambda record: record.id),
+            [1, 2, 3, 4, 5, 6],
+        )
+        self.assertEqual(segments(), before)
+
+    def test_below_threshold(self):
+        offloader = Offloader(processes=2, min_bytes=1024 * 1024)
+        entities = offloader.encode_many(self.records)
+        offloader.decode_many(Manuscript, entities)
+
+        # Should process small batches inline, without starting the pool
+        self.assertEqual(offloader.metrics()["inline"], 2)
+        self.assertFalse(offloader.metrics()["running"])
+
+    def test_broken_pool(self):
+        offloader = Offloader(processes=2, min_bytes=0)
+        entities = [record.as_entity for record in self.records]
+        with patch.object(offloader, "_get_pool", side_effect=BrokenProcessPool()):
+            decoded = offloader.decode_many(Manuscript, entities)
+            encoded = offloader.encode_many(self.records)
+
+        # Should fall back to inline processing
+        self.assertEqual(decoded, self.records)
+        self.assertEqual(encoded, entities)
+        self.assertEqual(offloader.fallbacks, 2)
+
+    def test_db(self):
+        db = DB(Manuscript)
+        db.client = MemoryClient(project=Manuscript.DatastoreConfig.project)
+        offloaded = self.offloader.offloaded
+        with patch("datastore.database.offloader", self.offloader):
+            db.upsert_many(self.records)
+
+            # Should offload bulk writes and reads
+            self.assertEqual(db.get_many([r.key for r in self.records]), self.records)
+            self.assertEqual(sorted(db.scan(shards=2, transform=title_of)), sorted(
+                record.title for record in self.records
+            ))
+            self.assertGreaterEqual(self.offloader.offloaded, offloaded + 3)
@@ -0,0 +1,69 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from datastore.profiler import QueryProfiler
+
+
+class TestQueryProfiler(TestCase):
+    profiler: QueryProfiler
+
+    def setUp(self):
+        super().setUp()
+        self.profiler = QueryProfiler(
+            slow_threshold_ms=50, buffer_size=3
+        )
+        self.query = MagicMock(
+            kind="Author",
+            filters=[("name", "=", "JK Rowling"), ("id", ">", 3)],
+            order=["-id"],
+        )
+
+    def test_record(self):
+        profile = self.profiler.record(
+            self.query, duration_ms=10, fetched=10, returned=9, limit=10
+        )
+
+        # Should normalize filters to their shape
+        self.assertEqual(profile.filters, ["id>", "name="])
+        self.assertEqual((profile.fetched, profile.returned), (10, 9))
+        self.assertFalse(profile.slow)
+        self.assertFalse(profile.offset_scan)
+
+    def test_flags(self):
+        profile = self.profiler.record(
+            self.query, duration_ms=75, fetched=1, returned=1, offset=200
+        )
+
+        # Should flag slow queries and offset scans
+        self.assertTrue(profile.slow)
+        self.assertTrue(profile.offset_scan)
+        self.assertEqual(
+            self.profiler.profiles(slow_only=True), [profile]
+        )
+
+    def test_ring_buffer(self):
+        for duration in range(5):
+            self.profiler.record(
+                self.query, duration_ms=duration, fetched=1, returned=1
+            )
+
+        # Should only keep the most recent profiles, newest first
+        self.assertEqual(
+            [p.duration_ms for p in self.profiler.profiles()], [4, 3, 2]
+        )
+
+    def test_summary(self):
+        self.profiler.record(
+            self.query, duration_ms=10, fetched=5, returned=5
+        )
+        self.query.filters = [("name", "=", "Ray Dalio"), ("id", ">", 7)]
+        self.profiler.record(
+            self.query, duration_ms=30, fetched=5, returned=4
+        )
+
+        # Should aggregate queries of the same shape
+        (entry,) = self.profiler.summary()
+        self.assertEqual(entry["count"], 2)
+        self.assertEqual(entry["total_ms"], 40)
+        self.assertEqual(entry["max_ms"], 30)
+        self.assertEqual(entry["returned"], 9)
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from datastore.database import DB
+from datastore.memory import MemoryClient
+from datastore.scan import ParallelScan, key_ranges, split_points
+from schemas.pydantic.AuthorSchema import Author
+
+
+def author_id(author: Author) -> int:
+    return author.id
+
+
+class TestParallelScan(TestCase):
+    db: DB
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(Author)
+        self.db.client = MemoryClient(project=Author.DatastoreConfig.project)
+        self.db.client.put_multi(
+            Author(id=i, name=f"Author {i}").as_entity for i in range(1000)
+        )
+
+    def test_split_points(self):
+        points = split_points(self.db.client, "Author", shards=4)
+
+        # Should split into ascending, open ended ranges
+        self.assertEqual(len(points), 3)
+        self.assertEqual(len(key_ranges(points)), 4)
+        self.assertIsNone(key_ranges(points)[0][0])
+        self.assertEqual(split_points(self.db.client, "Book", shards=4), [])
+
+    def test_scan(self):
+        scan = ParallelScan(self.db.client, "Author", shards=4, batch_size=64)
+        ids = [entity["id"] for entity in scan]
+
+        # Should return every entity exactly once
+        self.assertEqual(sorted(ids), list(range(1000)))
+
+    def test_scan_stops_early(self):
+        scan = ParallelScan(
+            self.db.client, "Author", shards=4, workers=2, batch_size=10
+        )
+        batches = scan.batches()
+        next(batches)
+
+        # Should let the consumer stop without draining the shards
+        batches.close()
+
+    def test_db_scan(self):
+        self.assertEqual(
+            sorted(self.db.scan(shards=4, transform=author_id)),
+            list(range(1000)),
+        )
+        self.assertEqual(
+            sorted(self.db.scan(shards=4, transform=author_id, processes=2)),
+            list(range(1000)),
+        )
@@ -0,0 +1,89 @@
+import threading
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from google.cloud.datastore import Entity, Key
+
+from datastore.writebehind import WriteBehindBuffer
+
+
+class TestWriteBehindBuffer(TestCase):
+    buffer: WriteBehindBuffer
+
+    def setUp(self):
+        super().setUp()
+        self.client = MagicMock()
+        self.buffer = WriteBehindBuffer(
+            self.client, "Author", window=60, max_batch=2
+        )
+
+    def tearDown(self):
+        self.buffer.stop()
+        super().tearDown()
+
+    def entity(self, id, name):
+        entity = Entity(key=Key("Author", id, project="test"))
+        entity.update(id=id, name=name)
+        return entity
+
+    def test_coalesce(self):
+        self.buffer.enqueue(self.entity(1, "JK"))
+        self.buffer.enqueue(self.entity(1, "JK Rowling"))
+
+        # Should keep only the latest write per key
+        self.assertEqual(self.buffer.queue_depth, 1)
+        self.assertEqual(self.buffer.coalesced, 1)
+        self.assertEqual(
+            self.buffer.get(Key("Author", 1, project="test"))["name"],
+            "JK Rowling",
+        )
+
+    def test_flush_batches(self):
+        for id in range(3):
+            self.buffer.enqueue(self.entity(id, "Author"))
+        self.buffer.stop()
+
+        # Should commit in batches of at most `max_batch`
+        self.assertEqual(
+            [len(c.args[0]) for c in self.client.put_multi.call_args_list],
+            [2, 1],
+        )
+        self.assertEqual(self.buffer.queue_depth, 0)
+        self.assertEqual(self.buffer.metrics()["flushed"], 3)
+
+    def test_flush_failure(self):
+        self.client.put_multi.side_effect = RuntimeError("unavailable")
+        self.buffer.enqueue(self.entity(1, "JK Rowling"))
+
+        self.assertEqual(self.buffer.flush(), 0)
+
+        # Should requeue writes which were not committed
+        self.assertEqual(self.buffer.queue_depth, 1)
+        self.assertEqual(self.buffer.errors, 1)
+
+    def test_read_during_flush(self):
+        committing, commit = threading.Event(), threading.Event()
+
+        def slow_put_multi(entities):
+            committing.set()
+            commit.wait(5)
+
+        self.client.put_multi.side_effect = slow_put_multi
+        self.buffer.enqueue(self.entity(1, "JK Rowling"))
+        flusher = threading.Thread(target=self.buffer.flush)
+        flusher.start()
+        committing.wait(5)
+        key = Key("Author", 1, project="test")
+
+        # Should keep reading the write until its commit succeeds
+        self.assertEqual(self.buffer.get(key)["name"], "JK Rowling")
+        commit.set()
+        flusher.join()
+        self.assertIsNone(self.buffer.get(key))
+
+    def test_discard(self):
+        self.buffer.enqueue(self.entity(1, "JK Rowling"))
+        self.buffer.discard(Key("Author", 1, project="test"))
+
+        # Should drop the pending write
+        self.assertEqual(self.buffer.flush(), 0)
@@ -0,0 +1,46 @@
+import asyncio
+from unittest import TestCase
+
+import strawberry
+
+from datastore import entitycache
+from datastore.memory import MemoryClient
+from repositories.AuthorRepository import AuthorRepository
+from schemas.graphql.Mutation import Mutation
+from schemas.graphql.Query import Query
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+from services.AuthorService import AuthorService
+
+
+class TestMutation(TestCase):
+    def setUp(self):
+        super().setUp()
+        entitycache.clear_all()
+        repository = AuthorRepository()
+        repository.client = MemoryClient(project=Author.DatastoreConfig.project)
+        repository.client.put_multi(
+            [
+                Author(id=1, name="JK Rowling", books=[1, 2]).as_entity,
+                Book(id=1, name="Book 1").as_entity,
+                Book(id=2, name="Book 2").as_entity,
+            ]
+        )
+        self.schema = strawberry.Schema(query=Query, mutation=Mutation)
+        self.context = {"authorService": AuthorService(repository)}
+
+    def execute(self, query: str):
+        return asyncio.run(self.schema.execute(query, context_value=self.context))
+
+    def test_update_author_books(self):
+        result = self.execute(
+            'mutation { updateAuthor(authorId: 1, author: {name: "Robert Galbraith"}) '
+            "{ name books { name } } }"
+        )
+
+        # Should load the books of the written author
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            result.data["updateAuthor"],
+            {"name": "Robert Galbraith", "books": [{"name": "Book 1"}, {"name": "Book 2"}]},
+        )
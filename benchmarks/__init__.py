@@ -0,0 +1,8 @@
+import os
+
+# Benchmarks measure application overhead, never Datastore network latency
+os.environ.setdefault("DATASTORE_BACKEND", "memory")
+# Load scenarios come from a single client, which per client rate limits would throttle
+os.environ.setdefault("ADMISSION_ENABLED", "false")
+# Cached responses would hide regressions of the request path
+os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
@@ -0,0 +1,70 @@
+"""
+Benchmark runner.
+
+    $ python -m benchmarks micro --output micro.json
+    $ python -m benchmarks load --requests 5000 --concurrency 64
+    $ python -m benchmarks resolvers --latency 0.05
+    $ python -m benchmarks memory --memory-authors 100000
+    $ python -m benchmarks all --baseline previous.json
+
+Exits with status 1 when `--baseline` is given and any benchmark's p50 latency
+regressed by more than `--threshold`, or when a memory benchmark exceeds its budget.
+"""
+import argparse
+import asyncio
+import sys
+
+from benchmarks import harness
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("suite", choices=["micro", "load", "resolvers", "memory", "all"], nargs="?", default="all")
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--authors", type=int, default=1000)
+    parser.add_argument("--memory-authors", type=int, default=100_000)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated Datastore round trip in seconds")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = []
+    if args.suite in ("micro", "all"):
+        from benchmarks import micro
+
+        results += micro.run(args.iterations)
+    if args.suite in ("load", "all"):
+        from benchmarks import load
+
+        results += asyncio.run(load.run(args.requests, args.concurrency, args.authors))
+    if args.suite in ("resolvers", "all"):
+        from benchmarks import resolvers
+
+        results += asyncio.run(resolvers.run(latency=args.latency))
+    memory_results = []
+    if args.suite in ("memory", "all"):
+        from benchmarks import memory
+
+        memory_results = memory.run(args.memory_authors)
+
+    for result in results + memory_results:
+        print(result)
+    harness.save(results + memory_results, args.output)
+
+    over_budget = [result.name for result in memory_results if result.over_budget]
+    if over_budget:
+        print(f"Over memory budget: {', '.join(over_budget)}")
+        return 1
+    if args.baseline:
+        regressions = harness.compare(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Timing, reporting and regression comparison helpers shared by the benchmark suites.
+"""
+import asyncio
+import platform
+import statistics
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import orjson
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    total_s: float
+    mean_us: float
+    p50_us: float
+    p95_us: float
+    p99_us: float
+    ops_per_s: float
+    errors: int = 0
+
+    @classmethod
+    def from_samples(
+        cls, name: str, samples_ns: List[int], total_s: float, errors: int = 0
+    ) -> "BenchmarkResult":
+        samples = sorted(samples_ns)
+
+        def percentile(p: float) -> float:
+            index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+            return samples[index] / 1000
+
+        return cls(
+            name=name,
+            iterations=len(samples),
+            total_s=round(total_s, 6),
+            mean_us=round(statistics.fmean(samples) / 1000, 3),
+            p50_us=round(percentile(50), 3),
+            p95_us=round(percentile(95), 3),
+            p99_us=round(percentile(99), 3),
+            ops_per_s=round(len(samples) / total_s, 1) if total_s else 0.0,
+            errors=errors,
+        )
+
+    def __str__(self):
+        return (
+            f"{self.name:<40} {self.ops_per_s:>12,.1f} ops/s  "
+            f"p50 {self.p50_us:>10,.1f}us  p95 {self.p95_us:>10,.1f}us  "
+            f"p99 {self.p99_us:>10,.1f}us"
+            + (f"  errors {self.errors}" if self.errors else "")
+        )
+
+
+def bench(
+    name: str, func: Callable[[], object], iterations: int = 10_000, warmup: int = 100
+) -> BenchmarkResult:
+    """Time `func` call by call.
+    Args:
+        name (str): Benchmark name, used as key in the results file
+        func (Callable): Zero argument callable to measure
+        iterations (int): Number of measured calls
+        warmup (int): Number of unmeasured calls made first
+    Returns:
+        BenchmarkResult: Latency distribution and throughput
+    """
+    for _ in range(warmup):
+        func()
+
+    samples = [0] * iterations
+    clock = time.perf_counter_ns
+    started = clock()
+    for i in range(iterations):
+        call_started = clock()
+        func()
+        samples[i] = clock() - call_started
+    return BenchmarkResult.from_samples(name, samples, (clock() - started) / 1e9)
+
+
+async def load(
+    name: str,
+    request: Callable[[], Awaitable[bool]],
+    requests: int = 2000,
+    concurrency: int = 32,
+) -> BenchmarkResult:
+    """Issue `requests` calls of `request` from `concurrency` concurrent workers.
+    Args:
+        name (str): Scenario name, used as key in the results file
+        request (Callable): Coroutine function returning whether the request succeeded
+        requests (int): Total number of requests
+        concurrency (int): Number of concurrent workers
+    Returns:
+        BenchmarkResult: Latency distribution and requests per second
+    """
+    samples: List[int] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter_ns()
+            ok = await request()
+            samples.append(time.perf_counter_ns() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return BenchmarkResult.from_samples(
+        name, samples, time.perf_counter() - started, errors
+    )
+
+
+def save(results: List[BenchmarkResult], path: str) -> None:
+    """Store results as JSON, keyed by benchmark name"""
+    document = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+        },
+        "results": {result.name: asdict(result) for result in results},
+    }
+    with open(path, "wb") as file:
+        file.write(orjson.dumps(document, option=orjson.OPT_INDENT_2))
+
+
+def compare(
+    results: List[BenchmarkResult], baseline_path: str, threshold: float = 0.1
+) -> Dict[str, float]:
+    """Compare p50 latencies against a stored baseline.
+    Args:
+        results (List[BenchmarkResult]): Fresh results
+        baseline_path (str): Results file written by `save`
+        threshold (float): Relative slowdown above which a benchmark counts as regressed
+    Returns:
+        dict: Relative p50 change of every regressed benchmark
+    """
+    with open(baseline_path, "rb") as file:
+        baseline = orjson.loads(file.read())["results"]
+
+    regressions = {}
+    for result in results:
+        previous: Optional[dict] = baseline.get(result.name)
+        if not previous or not previous["p50_us"]:
+            continue
+        change = (result.p50_us - previous["p50_us"]) / previous["p50_us"]
+        print(f"{result.name:<40} p50 {change:+.1%}")
+        if change > threshold:
+            regressions[result.name] = change
+    return regressions
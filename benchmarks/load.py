@@ -0,0 +1,81 @@
+"""
+Macro load scenarios running the full FastAPI application, REST and GraphQL,
+in-process against the in-memory Datastore backend.
+"""
+import itertools
+import random
+from typing import List
+
+import httpx
+
+from benchmarks.harness import BenchmarkResult, load
+from datastore import database
+from datastore.memory import MemoryClient
+from schemas.pydantic.AuthorSchema import Author
+
+
+def install_memory_client(authors: int) -> MemoryClient:
+    """Route every DB instance to a freshly seeded in-memory client"""
+    client = database.create_client("memory")
+    client.put_multi(
+        Author(id=i, name=f"Author {i}", books=list(range(5))).as_entity
+        for i in range(authors)
+    )
+    database.base_client = client
+    return client
+
+
+async def run(
+    requests: int = 2000, concurrency: int = 32, authors: int = 1000
+) -> List[BenchmarkResult]:
+    install_memory_client(authors)
+
+    # Imported late so the application binds to the seeded client
+    from main import app
+
+    ids = itertools.count(authors)
+
+    async with httpx.AsyncClient(app=app, base_url="http://benchmark") as client:
+
+        async def rest_list() -> bool:
+            response = await client.get("/v1/authors/", params={"pageSize": 100})
+            return response.status_code == 200
+
+        async def rest_get() -> bool:
+            response = await client.get(f"/v1/authors/{random.randrange(authors)}")
+            return response.status_code == 200
+
+        async def rest_create() -> bool:
+            author_id = next(ids)
+            response = await client.post(
+                "/v1/authors/", json={"id": author_id, "name": f"Author {author_id}"}
+            )
+            return response.status_code == 201
+
+        async def graphql_authors() -> bool:
+            response = await client.post(
+                "/graphql", json={"query": "{ authors { id name } }"}
+            )
+            return response.status_code == 200 and "errors" not in response.json()
+
+        async def graphql_author() -> bool:
+            response = await client.post(
+                "/graphql",
+                json={
+                    "query": "query ($id: Int!) { author(id: $id) { id name } }",
+                    "variables": {"id": random.randrange(authors)},
+                },
+            )
+            return response.status_code == 200 and "errors" not in response.json()
+
+        scenarios = {
+            "rest.list": rest_list,
+            "rest.get": rest_get,
+            "rest.create": rest_create,
+            "graphql.authors": graphql_authors,
+            "graphql.author": graphql_author,
+        }
+        return [
+            await load(name, scenario, requests, concurrency)
+            for name, scenario in scenarios.items()
+        ]
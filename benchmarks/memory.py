@@ -0,0 +1,89 @@
+"""
+Memory benchmarks, peak bytes allocated while listing and exporting many authors.
+
+Peaks are measured by `core.MemoryProfiler` against the in-memory Datastore backend and
+checked against `BUDGETS`, so a change holding extra copies of result sets fails the run:
+
+    $ python -m benchmarks memory --authors 100000
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from core.MemoryProfiler import memory_profiler
+from datastore import export
+from datastore.database import DB
+from datastore.memory import MemoryClient
+from schemas.pydantic.AuthorSchema import Author
+
+# Peak bytes allowed per scenario: a fixed allowance plus bytes per author. Listing holds
+# the records it returns, about 600 bytes per author, exports one record batch at a time
+BUDGETS: Dict[str, Tuple[int, int]] = {
+    "memory.list": (2 * 1024 * 1024, 750),
+    "memory.export.parquet": (12 * 1024 * 1024, 10),
+    "memory.export.arrow": (12 * 1024 * 1024, 10),
+}
+
+
+@dataclass
+class MemoryResult:
+    name: str
+    authors: int
+    peak_bytes: int
+    budget_bytes: int
+
+    @property
+    def over_budget(self) -> bool:
+        return self.peak_bytes > self.budget_bytes
+
+    def __str__(self):
+        return (
+            f"{self.name:<40} peak {self.peak_bytes / 2**20:>10,.1f}MiB  "
+            f"{self.peak_bytes / max(self.authors, 1):>8,.0f}B/author  "
+            f"budget {self.budget_bytes / 2**20:>8,.1f}MiB"
+            + ("  OVER BUDGET" if self.over_budget else "")
+        )
+
+
+def measure(name: str, func: Callable[[], object], authors: int) -> MemoryResult:
+    """Peak bytes allocated by `func` above what was allocated before"""
+    with memory_profiler.scope(name):
+        func()
+    peak = next(s["peak_max"] for s in memory_profiler.stats() if s["name"] == name)
+    fixed, per_author = BUDGETS[name]
+    return MemoryResult(name, authors, peak, fixed + per_author * authors)
+
+
+def run(authors: int = 100_000) -> List[MemoryResult]:
+    db = DB(Author)
+    db.client = MemoryClient(project=Author.DatastoreConfig.project)
+    db.client.put_multi(
+        Author(id=i, name=f"Author {i}", books=list(range(5))).as_entity
+        for i in range(authors)
+    )
+
+    def list_authors() -> None:
+        db.list(limit=authors)
+
+    def export_authors(format: str) -> Callable[[], None]:
+        # Streamed from a single query, key range scans of the in-memory backend are
+        # quadratic and would dominate the run
+        def run_export() -> None:
+            records = map(Author.from_entity, db.client.query(kind="Author").fetch())
+            for _ in export.stream(Author, records, format):
+                pass
+
+        return run_export
+
+    scenarios = [("memory.list", list_authors)]
+    if export.is_available():
+        scenarios += [
+            ("memory.export.parquet", export_authors(export.PARQUET)),
+            ("memory.export.arrow", export_authors(export.ARROW)),
+        ]
+
+    memory_profiler.start()
+    try:
+        return [measure(name, func, authors) for name, func in scenarios]
+    finally:
+        memory_profiler.stop()
+        memory_profiler.reset()
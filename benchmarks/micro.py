@@ -0,0 +1,93 @@
+"""
+Micro-benchmarks of the entity conversion hot paths in `datastore`.
+"""
+import base64
+from typing import List
+
+from benchmarks.harness import BenchmarkResult, bench
+from datastore.database import DB
+from datastore.key import DatastoreKey
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+
+
+class CompressedAuthor(Author):
+    """Author storing its books compressed, to exercise the compression paths"""
+
+    class DatastoreConfig(Author.DatastoreConfig):
+        compressed_fields = ["books"]
+
+
+class EmbeddingAuthor(Author):
+    """Author storing its books as embedded entities"""
+
+    books: List[Book] = []
+
+    class DatastoreConfig(Author.DatastoreConfig):
+        embedded_entity_fields = ["books"]
+        foreign_keys = {}
+
+
+def run(iterations: int = 10_000) -> List[BenchmarkResult]:
+    books = [{"id": i, "name": f"Book {i}"} for i in range(50)]
+    author = Author(id=1, name="JK Rowling", books=list(range(10)))
+    compressed_author = CompressedAuthor(id=1, name="JK Rowling", books=books)
+    compressed_data = compressed_author.compressed_dict()
+    compressed_data["books"] = base64.b64encode(compressed_data["books"])
+    entity = author.as_entity
+    page = [Author(id=i, name=f"Author {i}").as_entity for i in range(100)]
+    db = DB(Author)
+    embedding_author = EmbeddingAuthor(
+        id=1,
+        name="JK Rowling",
+        books=[Book(id=i, name=f"Book {i}") for i in range(500)],
+    )
+    embedding_entity = embedding_author.as_entity
+    key = DatastoreKey.from_path("Author", 1)
+    urlsafe = key.urlsafe
+    key_pb = key.to_protobuf()
+
+    def create_and_hash_keys() -> int:
+        return len({hash(DatastoreKey.from_path("Author", i)) for i in range(1_000_000)})
+
+    return [
+        bench("key.create", lambda: DatastoreKey.from_path("Author", 1), iterations),
+        bench("key.hash", lambda: hash(key), iterations),
+        bench("key.to_protobuf", key.to_protobuf, iterations),
+        bench("key.from_protobuf", lambda: DatastoreKey.from_protobuf(key_pb), iterations),
+        bench("key.from_urlsafe", lambda: DatastoreKey.from_urlsafe(urlsafe), iterations),
+        bench("key.create_hash[1M]", create_and_hash_keys, 1, warmup=0),
+        bench("entity.key", lambda: author.key, iterations),
+        bench("entity.as_entity", lambda: author.as_entity, iterations),
+        bench(
+            "entity.compressed_dict",
+            compressed_author.compressed_dict,
+            iterations,
+        ),
+        bench(
+            "entity.decompress_values",
+            lambda: compressed_author.decompress_values(dict(compressed_data)),
+            iterations,
+        ),
+        bench("db.parse_to_model", lambda: db.parse_to_model(entity), iterations),
+        bench(
+            "db.parse_to_model[100]",
+            lambda: db.parse_to_model(page),
+            max(1, iterations // 100),
+        ),
+        bench(
+            "entity.key[embedded 500]",
+            lambda: embedding_author.key,
+            iterations,
+        ),
+        bench(
+            "entity.as_entity[embedded 500]",
+            lambda: embedding_author.as_entity,
+            max(1, iterations // 100),
+        ),
+        bench(
+            "entity.from_entity[embedded 500]",
+            lambda: EmbeddingAuthor.from_entity(embedding_entity),
+            max(1, iterations // 100),
+        ),
+    ]
@@ -0,0 +1,103 @@
+"""
+Latency of a GraphQL document with several sibling fields, resolved by the async
+resolvers of the application schema and by equivalent blocking resolvers.
+
+Datastore round trips are simulated by a fixed delay on every query and key lookup,
+with the entity cache bypassed, so the async schema should take about as long as its
+slowest field and the blocking one about as long as all fields together.
+"""
+import time
+from typing import List, Optional
+
+import strawberry
+from strawberry.types import Info
+
+from benchmarks.harness import BenchmarkResult, load
+from benchmarks.load import install_memory_client
+from configs.GraphQL import get_AuthorService
+from datastore import database
+from datastore.memory import MemoryClient, MemoryQuery
+from repositories.AuthorRepository import AuthorRepository
+from schemas.graphql.Author import AuthorSchema
+from services.AuthorService import AuthorService
+
+MULTI_FIELD_QUERY = """
+{
+  a: author(id: 1) { id name }
+  b: author(id: 2) { id name }
+  c: author(id: 3) { id name }
+  d: authors(pageSize: 10) { id name }
+}
+"""
+
+
+class _SlowQuery(MemoryQuery):
+    def fetch(self, *args, **kwargs):
+        time.sleep(self._client.latency)
+        return super().fetch(*args, **kwargs)
+
+
+class LatencyClient(MemoryClient):
+    """In-memory client answering queries and lookups after a simulated round trip"""
+
+    latency = 0.0
+
+    def query(self, **kwargs) -> MemoryQuery:
+        return _SlowQuery(self, **kwargs)
+
+    def get(self, key, **kwargs):
+        time.sleep(self.latency)
+        return super().get(key, **kwargs)
+
+    def get_multi(self, keys, **kwargs):
+        # A single round trip, `MemoryClient.get_multi` would go through `get` per key
+        time.sleep(self.latency)
+        entities = (MemoryClient.get(self, key) for key in keys)
+        return [entity for entity in entities if entity is not None]
+
+
+@strawberry.type
+class BlockingQuery:
+    @strawberry.field
+    def author(self, id: int, info: Info) -> Optional[AuthorSchema]:
+        return get_AuthorService(info).get(id)
+
+    @strawberry.field
+    def authors(
+        self, info: Info, page_size: Optional[int] = 100
+    ) -> List[AuthorSchema]:
+        return get_AuthorService(info).list(pageSize=page_size)
+
+
+async def run(
+    requests: int = 50, latency: float = 0.02, authors: int = 100
+) -> List[BenchmarkResult]:
+    seeded = install_memory_client(authors)
+    client = LatencyClient(project=seeded.project, namespace=seeded.namespace)
+    client._kinds = seeded._kinds
+    client.latency = latency
+    database.base_client = client
+
+    # Imported late so the application binds to the slow client
+    from main import schema
+
+    blocking_schema = strawberry.Schema(query=BlockingQuery)
+    repository = AuthorRepository()
+    # Every read pays the round trip, cached authors would skip it after the first request
+    repository.entity_cache = None
+    context = {"authorService": AuthorService(repository)}
+
+    def scenario(schema: strawberry.Schema):
+        async def request() -> bool:
+            result = await schema.execute(MULTI_FIELD_QUERY, context_value=context)
+            return not result.errors
+
+        return request
+
+    # One request at a time, so latency is per document
+    return [
+        await load(
+            "graphql.multi_field[blocking]", scenario(blocking_schema), requests, 1
+        ),
+        await load("graphql.multi_field[async]", scenario(schema), requests, 1),
+    ]
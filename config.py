@@ -8,19 +8,128 @@ class Config(BaseSettings):
     """
 
     DATASTORE_AUTH_BASE64: str = ""
+    # Datastore backend, one of "cloud" or "memory"
+    DATASTORE_BACKEND: str = "cloud"
+    # Project used when no service account credentials are configured
+    DATASTORE_PROJECT_ID: str = "local"
+    # Namespace of requests without tenant, the default namespace when empty
+    DATASTORE_NAMESPACE: str = ""
+
+    # Tenant of a request, from this header or a "<prefix>/<tenant>/..." path.
+    # Each tenant is stored in the Datastore namespace of the same name
+    TENANT_HEADER: str = "X-Tenant-ID"
+    TENANT_PATH_PREFIX: str = "/tenants"
+    # Reject requests without tenant
+    TENANT_REQUIRED: bool = False
+
+    # Fraction of requests traced, decided once per trace at the root span
+    TRACING_SAMPLE_RATE: float = 0.01
+    # Span exporter, one of "none" or "memory"
+    TRACING_EXPORTER: str = "none"
+
+    # Query profiler ring buffer, queries slower than the threshold are logged
+    QUERY_PROFILER_ENABLED: bool = True
+    QUERY_PROFILER_BUFFER_SIZE: int = 1000
+    SLOW_QUERY_THRESHOLD_MS: float = 100.0
+
+    # Admission control, requests beyond these limits get 429 or 503 responses
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 64
+    # Default per client token bucket of each route
+    ADMISSION_RATE: float = 50.0
+    ADMISSION_BURST: int = 100
+
+    # GraphQL operations above these limits are rejected before execution
+    GRAPHQL_MAX_COST: int = 1000
+    GRAPHQL_MAX_DEPTH: int = 10
+    GRAPHQL_MAX_ALIASES: int = 15
+    # Automatic persisted queries and parsed documents kept, by query hash
+    GRAPHQL_PERSISTED_QUERIES_SIZE: int = 1000
+    GRAPHQL_DOCUMENT_CACHE_SIZE: int = 1000
+    # Cache-Control max-age of persisted query GET responses
+    GRAPHQL_PERSISTED_QUERY_MAX_AGE: int = 60
+
+    # Response compression, smaller responses are sent uncompressed
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 500
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    # Compressed bodies kept for reuse, larger bodies are never cached
+    COMPRESSION_CACHE_SIZE: int = 512
+    COMPRESSION_CACHE_MAX_BODY: int = 256 * 1024
+
+    # Micro-cache of hot GET responses, served stale while revalidating
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_TTL: float = 1.0
+    RESPONSE_CACHE_STALE: float = 5.0
+    RESPONSE_CACHE_SIZE: int = 1000
+
+    # Sharded counters, items start with COUNTER_SHARDS shards and grow under contention
+    COUNTER_SHARDS: int = 4
+    COUNTER_MAX_SHARDS: int = 64
+    # Seconds counter sums are served from the per process cache
+    COUNTER_CACHE_TTL: float = 1.0
+
+    # Bulk imports, rows are written in chunks of IMPORT_CHUNK_SIZE with at most
+    # IMPORT_MAX_IN_FLIGHT chunks being written before the upload stops being read
+    IMPORT_CHUNK_SIZE: int = 500
+    IMPORT_MAX_IN_FLIGHT: int = 4
+
+    # Change feed, events buffered per subscriber before the oldest are dropped and
+    # events kept for subscribers resuming after a reconnect
+    CHANGES_BUFFER_SIZE: int = 100
+    CHANGES_HISTORY_SIZE: int = 1000
+    CHANGES_MAX_SUBSCRIBERS: int = 1000
+    # Seconds between keep-alive comments of idle server-sent event streams
+    CHANGES_HEARTBEAT: float = 15.0
+
+    # Per process cache of entities of kinds with `DatastoreConfig.cache`. Off by default,
+    # reads may return entities up to `ENTITY_CACHE_TTL` seconds stale once enabled
+    ENTITY_CACHE_ENABLED: bool = False
+    ENTITY_CACHE_SIZE: int = 10_000
+    ENTITY_CACHE_TTL: float = 30.0
+
+    # Startup warm-up, /ready answers 503 until it completes or times out. The hot keys
+    # and persisted queries of the previous process are saved to the snapshot on shutdown
+    WARMUP_ENABLED: bool = True
+    WARMUP_SNAPSHOT_PATH: str = ".warmup/snapshot.json"
+    WARMUP_TIMEOUT: float = 60.0
+    # Keys saved per kind, and read per kind when there is no snapshot
+    WARMUP_MAX_KEYS: int = 5000
+    WARMUP_TOP_N: int = 1000
+    WARMUP_BATCH_SIZE: int = 500
+
+    # Columnar exports, rows per Arrow record batch and Parquet row group, and the
+    # codec of both formats, empty for none
+    EXPORT_BATCH_SIZE: int = 10_000
+    EXPORT_COMPRESSION: str = "zstd"
+
+    # Batches of entities whose compressed field values reach OFFLOAD_MIN_BYTES are
+    # encoded and decoded on a pool of OFFLOAD_PROCESSES processes, 0 to never offload
+    OFFLOAD_PROCESSES: int = 2
+    OFFLOAD_MIN_BYTES: int = 1024 * 1024
+
+    # Trace allocations with tracemalloc from startup, keeping MEMORY_PROFILING_FRAMES
+    # frames per allocation, see `core.MemoryProfiler`
+    MEMORY_PROFILING: bool = False
+    MEMORY_PROFILING_FRAMES: int = 1
 
     @root_validator()
     def root_validation(cls, values):
         if values.get("DATASTORE_AUTH_BASE64"):
             values["CREDENTIALS"] = json.loads(base64.b64decode(values["DATASTORE_AUTH_BASE64"]))
+        else:
+            values["CREDENTIALS"] = {}
         return values
 
     @property
     def NAMESPACE(self) -> Optional[str]:
-        return 
+        return self.DATASTORE_NAMESPACE or None
+
     @property
     def PROJECT_ID(self) -> str:
-        return self.CREDENTIALS.get("project_id")
+        return self.CREDENTIALS.get("project_id") or self.DATASTORE_PROJECT_ID
 
     @property
     def TYPE(self) -> str:
@@ -62,6 +171,8 @@ class Config(BaseSettings):
     @property
     def service_credentials(self) -> str:
         """Get Google service credentials"""
+        if not self.CREDENTIALS:
+            return None
         return service_account.Credentials.from_service_account_info(self.CREDENTIALS)
 
     class Config:
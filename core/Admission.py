@@ -0,0 +1,303 @@
+"""
+Admission control for incoming requests.
+
+Every request is matched against an ordered list of `AdmissionRule`s. A rule gives the
+request a priority class and a per client token bucket, refilled at `rate` requests per
+second up to `burst`.
+
+A request first takes a slot of the global `ConcurrencyLimiter`. Each priority class may
+only occupy a share of the slots, so bulk traffic is shed with 503 well before reads
+are. Only requests holding a slot take a token, requests of an empty bucket are rejected
+with 429 and give their slot back, so a client retrying shed requests keeps its tokens.
+
+The limiter bounds in-flight requests rather than in-flight Datastore operations: every
+limited route reaches Datastore through the service layer, so bounding requests bounds
+the concurrent Datastore work without instrumenting the client.
+
+Buckets live in a `RateLimitStore`. `MemoryRateLimitStore` limits each process on its own,
+a store shared between instances (e.g. Redis) only needs to implement `take`.
+"""
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Protocol, Sequence
+
+import orjson
+
+from config import config
+from datastore.namespace import current_namespace
+
+
+class Priority:
+    """Priority classes of requests"""
+
+    READ = "read"
+    WRITE = "write"
+    BULK = "bulk"
+
+
+# Share of the concurrency limit each priority class may occupy
+PRIORITY_SHARES: Dict[str, float] = {
+    Priority.READ: 1.0,
+    Priority.WRITE: 0.8,
+    Priority.BULK: 0.25,
+}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0, now: float = None) -> float:
+        """Take `cost` tokens.
+        Returns:
+            float: 0 when taken, otherwise the seconds until enough tokens are available
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimitStore(Protocol):
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        """Take `cost` tokens of the bucket `key`, created full on first use.
+        Returns:
+            float: 0 when taken, otherwise the seconds to wait before retrying
+        """
+
+
+class MemoryRateLimitStore:
+    """Process local buckets, the oldest buckets are dropped beyond `max_buckets`"""
+
+    def __init__(self, max_buckets: int = 100_000):
+        self.max_buckets = max_buckets
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int, cost: float = 1.0) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    del self._buckets[next(iter(self._buckets))]
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+            return bucket.take(cost)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class ConcurrencyLimiter:
+    """Global limit of in-flight requests with per priority class shares"""
+
+    def __init__(self, limit: int, shares: Dict[str, float] = None):
+        self.limit = limit
+        self.shares = shares or PRIORITY_SHARES
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def limit_of(self, priority: str) -> int:
+        return max(1, int(self.limit * self.shares.get(priority, 1.0)))
+
+    def try_acquire(self, priority: str) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit_of(priority):
+                return False
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+@dataclass
+class AdmissionRule:
+    """Limits of the requests matching `pattern`, a regular expression on the path.
+    Rules without `priority` are exempt from admission control.
+    """
+
+    name: str
+    pattern: str
+    methods: Optional[Sequence[str]] = None
+    priority: Optional[str] = Priority.READ
+    rate: float = field(default_factory=lambda: config.ADMISSION_RATE)
+    burst: int = field(default_factory=lambda: config.ADMISSION_BURST)
+    cost: float = 1.0
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern)
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.methods is None or method in self.methods) and bool(
+            self._regex.match(path)
+        )
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    rate_limited: int = 0
+    shed: int = 0
+
+
+class Decision:
+    """Outcome of admitting a request"""
+
+    __slots__ = ("rule", "status", "retry_after", "acquired")
+
+    def __init__(
+        self,
+        rule: Optional[AdmissionRule],
+        status: int = 200,
+        retry_after: float = 0.0,
+        acquired: bool = False,
+    ):
+        self.rule = rule
+        self.status = status
+        self.retry_after = retry_after
+        self.acquired = acquired
+
+    @property
+    def admitted(self) -> bool:
+        return self.status == 200
+
+
+class AdmissionController:
+    """Applies rate limits and the concurrency limit to requests"""
+
+    def __init__(
+        self,
+        rules: List[AdmissionRule],
+        store: RateLimitStore = None,
+        max_concurrency: int = None,
+        enabled: bool = None,
+    ):
+        """
+        Args:
+            rules (List[AdmissionRule]): Checked in order, the first match applies.
+                Requests matching no rule are admitted unlimited.
+            store (RateLimitStore): Token buckets, process local by default
+            max_concurrency (int): Global in-flight request limit
+            enabled (bool): Admit everything when disabled
+        """
+        self.rules = rules
+        self.store = store or MemoryRateLimitStore()
+        self.limiter = ConcurrencyLimiter(
+            max_concurrency or config.ADMISSION_MAX_CONCURRENCY
+        )
+        self.enabled = config.ADMISSION_ENABLED if enabled is None else enabled
+        self.stats: Dict[str, AdmissionStats] = {
+            rule.name: AdmissionStats() for rule in rules
+        }
+
+    def match(self, method: str, path: str) -> Optional[AdmissionRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def admit(self, method: str, path: str, client: str) -> Decision:
+        rule = self.match(method, path)
+        if not self.enabled or rule is None or rule.priority is None:
+            return Decision(rule)
+
+        stats = self.stats[rule.name]
+        # Per tenant, a busy tenant never drains the buckets of another
+        tenant = current_namespace() or ""
+        # Slot first, a shed request must not spend a token
+        if not self.limiter.try_acquire(rule.priority):
+            stats.shed += 1
+            return Decision(rule, 503, 1.0)
+        retry_after = self.store.take(
+            f"{rule.name}:{tenant}:{client}", rule.rate, rule.burst, rule.cost
+        )
+        if retry_after:
+            self.limiter.release()
+            stats.rate_limited += 1
+            return Decision(rule, 429, retry_after)
+        stats.admitted += 1
+        return Decision(rule, acquired=True)
+
+    def release(self, decision: Decision) -> None:
+        if decision.acquired:
+            self.limiter.release()
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.limiter.in_flight,
+            "peak_in_flight": self.limiter.peak,
+            "max_concurrency": self.limiter.limit,
+            "rules": [
+                {
+                    "name": rule.name,
+                    "priority": rule.priority,
+                    "rate": rule.rate,
+                    "burst": rule.burst,
+                    **vars(self.stats[rule.name]),
+                }
+                for rule in self.rules
+            ],
+        }
+
+
+_messages = {
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+
+class AdmissionMiddleware:
+    """ASGI middleware rejecting requests the `AdmissionController` does not admit"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        client = scope.get("client")
+        decision = self.controller.admit(
+            scope["method"], scope["path"], client[0] if client else ""
+        )
+        if not decision.admitted:
+            return await self._reject(decision, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(decision)
+
+    @staticmethod
+    async def _reject(decision: Decision, send) -> None:
+        body = orjson.dumps({"detail": _messages[decision.status]})
+        await send(
+            {
+                "type": "http.response.start",
+                "status": decision.status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(decision.retry_after)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,250 @@
+"""
+Streaming bulk import of NDJSON and CSV uploads.
+
+The request body is consumed as it arrives: rows are parsed incrementally, validated in
+chunks of `chunk_size` and each valid chunk is written in a single batched commit on the
+threadpool. At most `max_in_flight` chunks are being written at any time, past that the
+body is not read any further until the oldest write completes, so slow commits push back
+on the client instead of buffering the upload. Memory stays bounded by the in-flight
+chunks whatever the size of the upload.
+
+Every chunk yields a report once written, in upload order, followed by a summary.
+"""
+import asyncio
+import codecs
+import csv
+import io
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from pydantic.fields import SHAPE_SINGLETON
+
+from config import config
+
+# Media types of the supported formats
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+# Separator of list values in CSV cells, e.g. "1;2;3"
+CSV_LIST_SEPARATOR = ";"
+
+# A parsed row: its line number and its values, or the reason it could not be parsed
+Row = Tuple[int, Any]
+
+
+async def parse_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    """Rows of a newline delimited JSON stream, one object per line"""
+    line_number = 0
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, _loads(line)
+    if pending.strip():
+        yield line_number + 1, _loads(pending)
+
+
+def _loads(line: bytes) -> Any:
+    try:
+        return orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+
+class _CsvParser:
+    """Incremental CSV parser, fed with complete records only"""
+
+    def __init__(self):
+        self.columns: Optional[List[str]] = None
+        self.lines = 0
+
+    def feed(self, text: str) -> List[Row]:
+        rows = []
+        reader = csv.reader(io.StringIO(text))
+        start = 0
+        for values in reader:
+            line_number, start = self.lines + start + 1, reader.line_num
+            if not values:
+                continue
+            if self.columns is None:
+                self.columns = [column.strip() for column in values]
+            elif len(values) != len(self.columns):
+                rows.append(
+                    (
+                        line_number,
+                        ValueError(
+                            f"Expected {len(self.columns)} values, got {len(values)}"
+                        ),
+                    )
+                )
+            else:
+                rows.append((line_number, dict(zip(self.columns, values))))
+        self.lines += reader.line_num
+        return rows
+
+
+def _last_record_end(text: str) -> int:
+    """End of the last complete CSV record, newlines within quotes do not end one"""
+    end = text.rfind("\n")
+    # Quotes are escaped by doubling them, an odd count means a field is still open
+    while end != -1 and text.count('"', 0, end) % 2:
+        end = text.rfind("\n", 0, end)
+    return end + 1
+
+
+async def parse_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    """Rows of a UTF-8 CSV stream whose first line names the columns"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    parser = _CsvParser()
+    pending = ""
+    async for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        end = _last_record_end(text)
+        pending = text[end:]
+        for row in parser.feed(text[:end]):
+            yield row
+    for row in parser.feed(pending + decoder.decode(b"", final=True)):
+        yield row
+
+
+PARSERS = {NDJSON: parse_ndjson, CSV: parse_csv}
+
+
+def parser_of(content_type: str) -> Optional[Callable]:
+    """Row parser of a media type, None when not supported"""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type in ("application/jsonl", "application/json-seq"):
+        media_type = NDJSON
+    return PARSERS.get(media_type)
+
+
+def _csv_values(model: Type[BaseModel], values: Dict[str, str]) -> Dict[str, Any]:
+    """Values of a CSV row, empty cells dropped and list cells split"""
+    parsed = {}
+    for name, value in values.items():
+        if value == "":
+            continue
+        field = model.__fields__.get(name)
+        if field is not None and field.shape != SHAPE_SINGLETON:
+            value = [item for item in value.split(CSV_LIST_SEPARATOR) if item]
+        parsed[name] = value
+    return parsed
+
+
+def validate(
+    model: Type[BaseModel], rows: Sequence[Row]
+) -> Tuple[List[BaseModel], List[dict]]:
+    """Valid records of a chunk of rows, and the errors of the invalid ones"""
+    records, errors = [], []
+    for line_number, values in rows:
+        if isinstance(values, Exception):
+            errors.append({"line": line_number, "error": str(values)})
+            continue
+        if not isinstance(values, dict):
+            errors.append({"line": line_number, "error": "Expected an object"})
+            continue
+        try:
+            records.append(model(**values))
+        except ValidationError as e:
+            errors.append({"line": line_number, "error": e.errors()})
+    return records, errors
+
+
+def _import_chunk(
+    model: Type[BaseModel],
+    write: Callable[[List[BaseModel]], int],
+    chunk: List[Row],
+    csv_rows: bool,
+) -> dict:
+    """Validate and write a chunk of rows, returning its report"""
+    if csv_rows:
+        chunk = [
+            (line, values if isinstance(values, Exception) else _csv_values(model, values))
+            for line, values in chunk
+        ]
+    records, errors = validate(model, chunk)
+    report = {"rows": len(chunk), "written": 0, "errors": errors}
+    try:
+        report["written"] = write(records) if records else 0
+    except Exception as e:
+        report["error"] = str(e)
+    return report
+
+
+async def import_rows(
+    rows: AsyncIterator[Row],
+    model: Type[BaseModel],
+    write: Callable[[List[BaseModel]], int],
+    csv_rows: bool = False,
+    chunk_size: int = None,
+    max_in_flight: int = None,
+) -> AsyncIterator[dict]:
+    """Validate and write rows in chunks, yielding the report of every chunk.
+    Args:
+        rows: Parsed rows, see `parse_ndjson` and `parse_csv`
+        model: Model rows are validated against
+        write: Blocking batched write of a chunk of records returning the number
+            written. Chunks are validated and written on the threadpool
+        csv_rows (bool): Rows are CSV strings, split list cells
+        chunk_size (int): Rows per chunk, one commit each
+        max_in_flight (int): Chunks written concurrently before reading stops
+    """
+    chunk_size = chunk_size or config.IMPORT_CHUNK_SIZE
+    max_in_flight = max_in_flight or config.IMPORT_MAX_IN_FLIGHT
+    in_flight: Deque[asyncio.Future] = deque()
+    summary = {"chunks": 0, "rows": 0, "written": 0, "failed": 0}
+
+    def start(chunk: List[Row]) -> None:
+        in_flight.append(
+            asyncio.ensure_future(
+                run_in_threadpool(_import_chunk, model, write, chunk, csv_rows)
+            )
+        )
+
+    async def finish() -> dict:
+        report = {"chunk": summary["chunks"], **await in_flight.popleft()}
+        summary["chunks"] += 1
+        summary["rows"] += report["rows"]
+        summary["written"] += report["written"]
+        summary["failed"] += report["rows"] - report["written"]
+        return report
+
+    try:
+        chunk: List[Row] = []
+        async for row in rows:
+            # Report the writes completed so far without waiting for the backlog
+            while in_flight and in_flight[0].done():
+                yield await finish()
+            chunk.append(row)
+            if len(chunk) < chunk_size:
+                continue
+            start(chunk)
+            chunk = []
+            # Backpressure, stop reading until the oldest write completes
+            while len(in_flight) >= max_in_flight:
+                yield await finish()
+        if chunk:
+            start(chunk)
+        while in_flight:
+            yield await finish()
+    finally:
+        # The client went away, writes already running complete unreported
+        for future in in_flight:
+            future.cancel()
+    yield {"done": True, **summary}
@@ -0,0 +1,366 @@
+"""
+Response compression negotiated with `Accept-Encoding`.
+
+`CompressionMiddleware` compresses responses of compressible media types with the
+best content coding the client accepts: brotli and zstd when the `brotli` and
+`zstandard` packages are installed, gzip otherwise. Responses below
+`COMPRESSION_MINIMUM_SIZE` bytes are sent as is, the saving would not pay for the
+compression.
+
+Complete bodies are compressed in one go. Compressed bodies are kept in an LRU cache
+by digest of the uncompressed body, so a hot payload (the same page of authors, a
+cached response) is compressed once rather than on every request. Streamed bodies,
+e.g. a `StreamingResponse` export, are compressed chunk by chunk as they are sent and
+never buffered: each chunk is flushed, so the client can decode it before the next one
+arrives.
+"""
+import gzip
+import hashlib
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Protocol, Tuple
+
+from anyio import to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import config
+from core.PersistedQueries import LRUCache
+
+# Media types compressed besides text/*, +json and +xml
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "application/graphql-response+json",
+}
+# Bodies above this size are compressed off the event loop
+THREADPOOL_THRESHOLD = 64 * 1024
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def flush(self) -> bytes:
+        """Output everything compressed so far, keeping the stream open"""
+        ...
+
+    def finish(self) -> bytes:
+        ...
+
+
+@dataclass(frozen=True)
+class Codec:
+    """A content coding, `compress` for whole bodies and `compressor` for streams"""
+
+    name: str
+    compress: Callable[[bytes], bytes]
+    compressor: Callable[[], Compressor]
+
+
+class _ZlibCompressor:
+    def __init__(self, level: int):
+        # wbits 31 writes a gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _gzip() -> Codec:
+    level = config.COMPRESSION_GZIP_LEVEL
+    return Codec(
+        "gzip",
+        # mtime 0 keeps the output of equal bodies identical
+        lambda data: gzip.compress(data, level, mtime=0),
+        lambda: _ZlibCompressor(level),
+    )
+
+
+def _brotli() -> Optional[Codec]:
+    try:
+        import brotli
+    except ImportError:
+        return None
+
+    quality = config.COMPRESSION_BROTLI_QUALITY
+
+    class BrotliCompressor:
+        def __init__(self):
+            self._compressor = brotli.Compressor(quality=quality)
+
+        def compress(self, data: bytes) -> bytes:
+            return self._compressor.process(data)
+
+        def flush(self) -> bytes:
+            return self._compressor.flush()
+
+        def finish(self) -> bytes:
+            return self._compressor.finish()
+
+    return Codec(
+        "br",
+        lambda data: brotli.compress(data, quality=quality),
+        BrotliCompressor,
+    )
+
+
+def _zstd() -> Optional[Codec]:
+    try:
+        import zstandard
+    except ImportError:
+        return None
+
+    level = config.COMPRESSION_ZSTD_LEVEL
+
+    class ZstdCompressor:
+        def __init__(self):
+            self._compressor = zstandard.ZstdCompressor(
+                level=level
+            ).compressobj()
+
+        def compress(self, data: bytes) -> bytes:
+            return self._compressor.compress(data)
+
+        def flush(self) -> bytes:
+            return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+        def finish(self) -> bytes:
+            return self._compressor.flush()
+
+    return Codec(
+        "zstd",
+        zstandard.ZstdCompressor(level=level).compress,
+        ZstdCompressor,
+    )
+
+
+# Available codings, in order of preference when the client accepts several
+CODECS: Dict[str, Codec] = {
+    codec.name: codec
+    for codec in (_brotli(), _zstd(), _gzip())
+    if codec is not None
+}
+
+# Compressed bodies by coding and digest of the uncompressed body
+compressed_bodies: LRUCache[bytes] = LRUCache(config.COMPRESSION_CACHE_SIZE)
+
+
+@dataclass
+class CompressionStats:
+    responses: Dict[str, int] = field(default_factory=dict)
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+    def record(self, bytes_in: int, bytes_out: int) -> None:
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def count(self, encoding: str) -> None:
+        self.responses[encoding] = self.responses.get(encoding, 0) + 1
+
+
+stats = CompressionStats()
+
+
+def metrics() -> dict:
+    return {
+        "codecs": list(CODECS),
+        "responses": dict(stats.responses),
+        "bytes_in": stats.bytes_in,
+        "bytes_out": stats.bytes_out,
+        "cache": compressed_bodies.metrics(),
+    }
+
+
+def negotiate(
+    accept_encoding: str, codecs: Dict[str, Codec] = None
+) -> Optional[str]:
+    """Pick the coding of a response.
+    Args:
+        accept_encoding (str): `Accept-Encoding` header of the request
+        codecs (Dict[str, Codec]): Available codings, by preference
+    Returns:
+        Optional[str]: The accepted coding of highest quality, None for identity
+    """
+    codecs = CODECS if codecs is None else codecs
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for name in codecs:
+        quality = weights.get(name, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.partition(";")[0].strip().lower()
+    # Server-sent events must reach the client as they are sent
+    if media_type == "text/event-stream":
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type.endswith(("+json", "+xml"))
+        or media_type in COMPRESSIBLE_TYPES
+    )
+
+
+async def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a whole body, reusing the result for equal bodies.
+    Args:
+        body (bytes): Uncompressed body
+        encoding (str): Name of an available coding
+    Returns:
+        bytes: Compressed body
+    """
+    codec = CODECS[encoding]
+    key: Optional[Tuple[str, bytes]] = None
+    if len(body) <= config.COMPRESSION_CACHE_MAX_BODY:
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        compressed = compressed_bodies.get(key)
+        if compressed is not None:
+            return compressed
+
+    if len(body) > THREADPOOL_THRESHOLD:
+        compressed = await to_thread.run_sync(codec.compress, body)
+    else:
+        compressed = codec.compress(body)
+    if key is not None:
+        compressed_bodies.set(key, compressed)
+    return compressed
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the coding the client prefers"""
+
+    def __init__(self, app, minimum_size: int = None):
+        self.app = app
+        self.minimum_size = (
+            config.COMPRESSION_MINIMUM_SIZE
+            if minimum_size is None
+            else minimum_size
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            return await self.app(scope, receive, send)
+
+        encoding = negotiate(
+            Headers(scope=scope).get("accept-encoding", "")
+        )
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Decides on the first body message whether and how to compress a response"""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[dict] = None
+        self.started = False
+        self.compressor: Optional[Compressor] = None
+
+    async def send(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            return await self._send(message)
+        if self.started:
+            return await self._send_body(message)
+
+        self.started = True
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self._should_compress(headers, body, more_body):
+            await self._send(self.start)
+            return await self._send(message)
+
+        headers["content-encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The compressed representation is not byte equal
+            headers["etag"] = f"W/{etag}"
+        self.start["headers"] = headers.raw
+
+        if not more_body:
+            compressed = await compress(body, self.encoding)
+            stats.count(self.encoding)
+            stats.record(len(body), len(compressed))
+            headers["content-length"] = str(len(compressed))
+            self.start["headers"] = headers.raw
+            await self._send(self.start)
+            return await self._send(
+                {"type": "http.response.body", "body": compressed}
+            )
+
+        # Streamed, the final length is unknown
+        if "content-length" in headers:
+            del headers["content-length"]
+        stats.count(self.encoding)
+        self.compressor = CODECS[self.encoding].compressor()
+        await self._send(self.start)
+        await self._send_body(message)
+
+    async def _send_body(self, message: dict) -> None:
+        if self.compressor is None:
+            return await self._send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        compressed = self.compressor.compress(body)
+        # Flushed so every chunk can be decoded as soon as it is received
+        if more_body:
+            compressed += self.compressor.flush()
+        else:
+            compressed += self.compressor.finish()
+        stats.record(len(body), len(compressed))
+        await self._send(
+            {
+                "type": "http.response.body",
+                "body": compressed,
+                "more_body": more_body,
+            }
+        )
+
+    def _should_compress(
+        self, headers: MutableHeaders, body: bytes, more_body: bool
+    ) -> bool:
+        if "content-encoding" in headers or self.start["status"] in (
+            204,
+            304,
+        ):
+            return False
+        if not is_compressible(headers.get("content-type", "")):
+            return False
+        if more_body:
+            length = headers.get("content-length")
+            return length is None or int(length) >= self.minimum_size
+        return len(body) >= self.minimum_size
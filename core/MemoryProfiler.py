@@ -0,0 +1,203 @@
+"""
+Opt-in memory profiling of requests and `DB` operations.
+
+Enabled with `MEMORY_PROFILING`, or at runtime from `/v1/admin/memory/start`, allocations
+are traced with `tracemalloc`. Every request and `DB` operation runs in a `scope` which
+records the peak of traced memory above what was allocated when it started, and what it
+left allocated when done. The allocation sites holding the most memory are reported by
+`top_allocations`. Tracing makes allocations several times slower, only enable it to
+investigate.
+
+Scopes nest, the peak of a request includes the peaks of the `DB` operations it ran.
+`tracemalloc` only tracks one process wide peak though, so the peaks of concurrent scopes
+include each other's allocations: profile under low concurrency to attribute them exactly.
+"""
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from config import config
+
+# Categories of scopes
+REQUEST = "request"
+OPERATION = "operation"
+
+# Allocations of tracemalloc and of the import system, hidden from `top_allocations`
+_IGNORED_SITES = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+@dataclass
+class MemoryStats:
+    """Allocations of the scopes sharing a name"""
+
+    category: str
+    name: str
+    count: int = 0
+    peak_max: int = 0
+    peak_total: int = 0
+    retained_total: int = 0
+
+    def record(self, peak: int, retained: int) -> None:
+        self.count += 1
+        self.peak_max = max(self.peak_max, peak)
+        self.peak_total += peak
+        self.retained_total += retained
+
+    def dict(self) -> dict:
+        return {
+            "category": self.category,
+            "name": self.name,
+            "count": self.count,
+            "peak_max": self.peak_max,
+            "peak_mean": self.peak_total // self.count if self.count else 0,
+            "retained_mean": self.retained_total // self.count if self.count else 0,
+        }
+
+
+class Scope:
+    """A profiled block, renamed before it ends when its name is only known then"""
+
+    __slots__ = ("category", "name", "start", "peak")
+
+    def __init__(self, category: str, name: str, start: int):
+        self.category = category
+        self.name = name
+        self.start = start
+        self.peak = start
+
+
+class MemoryProfiler:
+    """Peak allocations by scope name, while `tracemalloc` is tracing"""
+
+    def __init__(self):
+        self._stats: Dict[tuple, MemoryStats] = {}
+        self._open: List[Scope] = []
+        self._lock = threading.Lock()
+        self._peak = 0
+        self.enabled = False
+
+    def start(self, frames: int = None) -> None:
+        """Start tracing allocations, keeping `frames` frames of each traceback"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames or config.MEMORY_PROFILING_FRAMES)
+            self._peak = tracemalloc.get_traced_memory()[0]
+            self.enabled = True
+
+    def stop(self) -> None:
+        """Stop tracing, recorded stats are kept until `reset`"""
+        with self._lock:
+            self.enabled = False
+            self._open.clear()
+            tracemalloc.stop()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def _fold(self) -> int:
+        """Carry the peak since the last call over to the open scopes and reset it,
+        returning the memory currently allocated"""
+        current, peak = tracemalloc.get_traced_memory()
+        for scope in self._open:
+            scope.peak = max(scope.peak, peak)
+        self._peak = max(self._peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def _scope(self, category: str, name: str) -> Iterator[Scope]:
+        with self._lock:
+            scope = Scope(category, name, self._fold())
+            self._open.append(scope)
+        try:
+            yield scope
+        finally:
+            with self._lock:
+                if self.enabled and scope in self._open:
+                    current = self._fold()
+                    self._open.remove(scope)
+                    key = (scope.category, scope.name)
+                    stats = self._stats.get(key)
+                    if stats is None:
+                        stats = self._stats[key] = MemoryStats(*key)
+                    stats.record(scope.peak - scope.start, current - scope.start)
+
+    def scope(self, name: str, category: str = OPERATION):
+        """Context manager recording the allocations of the block under `name`,
+        doing nothing while profiling is disabled"""
+        if not self.enabled:
+            return nullcontext()
+        return self._scope(category, name)
+
+    def stats(self, category: Optional[str] = None) -> List[dict]:
+        """Stats of every scope name, largest peak first"""
+        with self._lock:
+            stats = [s for s in self._stats.values() if category in (None, s.category)]
+        return [
+            s.dict() for s in sorted(stats, key=lambda s: s.peak_max, reverse=True)
+        ]
+
+    def top_allocations(self, limit: int = 20, group_by: str = "lineno") -> List[dict]:
+        """Allocation sites holding the most memory.
+        Args:
+            limit (int): Number of sites returned
+            group_by (str): "lineno", "filename" or "traceback"
+        """
+        if not self.enabled:
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(_IGNORED_SITES)
+        return [
+            {
+                "site": str(stat.traceback[0]),
+                "traceback": stat.traceback.format() if group_by == "traceback" else None,
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics(group_by)[:limit]
+        ]
+
+    def metrics(self) -> dict:
+        current = peak = 0
+        if self.enabled:
+            with self._lock:
+                current = self._fold()
+                peak = self._peak
+        return {
+            "enabled": self.enabled,
+            "current": current,
+            "peak": peak,
+            "requests": self.stats(REQUEST),
+            "operations": self.stats(OPERATION),
+        }
+
+
+memory_profiler = MemoryProfiler()
+
+
+class MemoryProfilerMiddleware:
+    """ASGI middleware recording the allocations of each HTTP request by route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not memory_profiler.enabled:
+            return await self.app(scope, receive, send)
+
+        with memory_profiler.scope(scope["method"], REQUEST) as profiled:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # Named after the route template once routed, paths hold ids
+                if profiled is not None:
+                    route = scope.get("route")
+                    path = getattr(route, "path", None) or "unmatched"
+                    profiled.name = f"{scope['method']} {path}"
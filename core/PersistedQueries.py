@@ -0,0 +1,194 @@
+"""
+Automatic persisted GraphQL queries and cached query documents.
+
+`PersistedQueryRouter` implements the Apollo automatic persisted queries protocol. A
+client sends only the sha256 hash of its query in `extensions.persistedQuery`, and the
+query itself once, after being told `PersistedQueryNotFound`. Persisted queries may be
+sent with GET, successful GET responses are then cacheable by HTTP caches.
+
+`DocumentCache` keeps the parsed and validated document of recent queries by hash, so
+repeated queries skip parsing and validation.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from graphql import DocumentNode, GraphQLError
+from strawberry.extensions import SchemaExtension
+from strawberry.fastapi import GraphQLRouter
+from strawberry.http import GraphQLRequestData
+from strawberry.http.exceptions import HTTPException
+from strawberry.schema.execute import validate_document
+from strawberry.types import ExecutionResult
+from strawberry.unset import UNSET
+
+from config import config
+
+Value = TypeVar("Value")
+
+NOT_FOUND_MESSAGE = "PersistedQueryNotFound"
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+class LRUCache(Generic[Value]):
+    """Thread safe least recently used cache"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[Hashable, Value]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Value]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Value) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def items(self) -> List[Tuple[Hashable, Value]]:
+        """Cached items, least recently used first"""
+        with self._lock:
+            return list(self._items.items())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Query text by hash
+persisted_queries: LRUCache[str] = LRUCache(config.GRAPHQL_PERSISTED_QUERIES_SIZE)
+# Parsed document and validation result by query hash
+documents: LRUCache[Tuple[DocumentNode, Any, list]] = LRUCache(
+    config.GRAPHQL_DOCUMENT_CACHE_SIZE
+)
+
+
+class PersistedQueryNotFound(Exception):
+    """The hash of a persisted query is not registered"""
+
+
+class DocumentCache(SchemaExtension):
+    """Reuses parsed documents and validation results of queries seen before"""
+
+    def on_parse(self):
+        context = self.execution_context
+        self.key = query_hash(context.query) if context.query else None
+        cached = documents.get(self.key) if self.key else None
+        if cached is not None:
+            context.graphql_document = cached[0]
+        yield
+
+    def on_validate(self):
+        context = self.execution_context
+        if self.key is not None and context.errors is None:
+            cached = documents.get(self.key)
+            rules = context.validation_rules
+            if cached is None or cached[1] != rules:
+                errors = validate_document(
+                    context.schema._schema, context.graphql_document, rules
+                )
+                cached = (context.graphql_document, rules, errors)
+                documents.set(self.key, cached)
+            # Copied, other extensions may add errors
+            context.errors = list(cached[2])
+        yield
+
+
+class PersistedQueryRouter(GraphQLRouter):
+    """`GraphQLRouter` accepting automatic persisted queries, over POST and GET"""
+
+    def should_render_graphiql(self, request) -> bool:
+        return "extensions" not in request.query_params and super().should_render_graphiql(
+            request
+        )
+
+    async def parse_http_body(self, request) -> GraphQLRequestData:
+        if request.method == "GET":
+            data = self.parse_query_params(request.query_params)
+            if isinstance(data.get("extensions"), str):
+                data["extensions"] = self.parse_json(data["extensions"])
+        elif "application/json" in (request.content_type or ""):
+            data = self.parse_json(await request.get_body())
+        else:
+            return await super().parse_http_body(request)
+
+        query = data.get("query")
+        persisted = (data.get("extensions") or {}).get("persistedQuery")
+        if persisted:
+            sha256 = persisted.get("sha256Hash")
+            if query is None:
+                query = persisted_queries.get(sha256)
+                if query is None:
+                    raise PersistedQueryNotFound(sha256)
+            elif query_hash(query) != sha256:
+                raise HTTPException(400, "Provided sha256Hash does not match query")
+            else:
+                persisted_queries.set(sha256, query)
+            # Marks the response as cacheable, see `run`
+            request.request.state.persisted_query = True
+
+        return GraphQLRequestData(
+            query=query,
+            variables=data.get("variables"),
+            operation_name=data.get("operationName"),
+        )
+
+    async def execute_operation(self, request, context, root_value) -> ExecutionResult:
+        try:
+            return await super().execute_operation(request, context, root_value)
+        except PersistedQueryNotFound:
+            return ExecutionResult(
+                data=None,
+                errors=[
+                    GraphQLError(
+                        NOT_FOUND_MESSAGE,
+                        extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    )
+                ],
+            )
+
+    async def process_result(self, request, result: ExecutionResult):
+        request.state.cacheable = not result.errors
+        return await super().process_result(request, result)
+
+    async def run(self, request, context=UNSET, root_value=UNSET):
+        response = await super().run(request, context=context, root_value=root_value)
+        if (
+            request.method == "GET"
+            and getattr(request.state, "persisted_query", False)
+            and getattr(request.state, "cacheable", False)
+            and response.status_code == 200
+        ):
+            response.headers["Cache-Control"] = (
+                f"public, max-age={config.GRAPHQL_PERSISTED_QUERY_MAX_AGE}"
+            )
+            # The tenant may come from a header, shared caches must key on it
+            response.headers.add_vary_header(config.TENANT_HEADER)
+        return response
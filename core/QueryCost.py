@@ -0,0 +1,204 @@
+"""
+GraphQL query cost analysis.
+
+`QueryCostExtension` estimates the cost of an operation from its document before it
+runs and rejects operations above `GRAPHQL_MAX_COST`. Each field costs its entry in
+`FIELD_COSTS`, or 1 for object fields and 0 for scalars. List fields multiply the cost
+of their items by the requested page size, so aliasing `authors` ten times costs ten
+times as much as asking once. Relationship fields in `BATCHED_FIELDS` are loaded in a
+single lookup for every item of the enclosing list, see `DB.include`, so they are costed
+once per list rather than once per item. The estimate is reported under
+`extensions.cost` of the response.
+
+Depth and alias limits are enforced by strawberry's own validation rules, see
+`extensions()`.
+"""
+from typing import Any, Dict, List, Optional
+
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    IntValueNode,
+    OperationDefinitionNode,
+    SelectionSetNode,
+    VariableNode,
+    get_named_type,
+    get_nullable_type,
+)
+from strawberry.extensions import (
+    MaxAliasesLimiter,
+    QueryDepthLimiter,
+    SchemaExtension,
+)
+
+from config import config
+
+# Cost of resolving a field, by "Type.field"
+FIELD_COSTS: Dict[str, int] = {
+    "Query.author": 1,
+    "Query.authors": 1,
+    "Mutation.addAuthor": 10,
+    "Mutation.updateAuthor": 10,
+    "Mutation.deleteAuthor": 10,
+}
+# Cost of the single lookup loading a relationship for a whole list, by "Type.field"
+BATCHED_FIELDS: Dict[str, int] = {
+    "AuthorSchema.books": 1,
+}
+# Argument holding the requested number of items of list fields
+PAGE_SIZE_ARGUMENT = "pageSize"
+# Assumed number of items of list fields without a page size
+DEFAULT_LIST_SIZE = 100
+
+
+class QueryCostExtension(SchemaExtension):
+    """Rejects operations estimated above the cost budget before execution"""
+
+    def __init__(self, *, execution_context=None):
+        super().__init__(execution_context=execution_context)
+        self.max_cost = config.GRAPHQL_MAX_COST
+        self.cost: Optional[int] = None
+        # Cost of the batched lookups below the list field being costed
+        self._batched = 0
+
+    def on_validate(self):
+        context = self.execution_context
+        operation = self._operation()
+        if operation is not None and not context.errors:
+            root_type = context.schema._schema.get_root_type(operation.operation)
+            self._batched = 0
+            self.cost = self._selection_cost(operation.selection_set, root_type)
+            self.cost += self._batched
+            if self.cost > self.max_cost:
+                # Setting errors skips validation and returns them right away
+                context.errors = [
+                    *(context.errors or ()),
+                    GraphQLError(
+                        f"Query cost {self.cost} exceeds the budget of {self.max_cost}",
+                        extensions={"cost": self.cost, "budget": self.max_cost},
+                    ),
+                ]
+        yield
+
+    def get_results(self) -> Dict[str, Any]:
+        if self.cost is None:
+            return {}
+        return {"cost": {"requested": self.cost, "budget": self.max_cost}}
+
+    def _operation(self) -> Optional[OperationDefinitionNode]:
+        document = self.execution_context.graphql_document
+        if document is None:
+            return None
+        name = self.execution_context.operation_name
+        operations = [
+            d for d in document.definitions if isinstance(d, OperationDefinitionNode)
+        ]
+        for operation in operations:
+            if name is None or (operation.name and operation.name.value == name):
+                return operation
+        return None
+
+    @property
+    def _fragments(self) -> Dict[str, FragmentDefinitionNode]:
+        return {
+            d.name.value: d
+            for d in self.execution_context.graphql_document.definitions
+            if isinstance(d, FragmentDefinitionNode)
+        }
+
+    def _selection_cost(
+        self,
+        selection_set: Optional[SelectionSetNode],
+        parent_type: Any,
+        visited: frozenset = frozenset(),
+    ) -> int:
+        if selection_set is None or not isinstance(parent_type, GraphQLObjectType):
+            return 0
+        schema = self.execution_context.schema._schema
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                cost += self._field_cost(selection, parent_type, visited)
+            elif isinstance(selection, InlineFragmentNode):
+                fragment_type = (
+                    schema.get_type(selection.type_condition.name.value)
+                    if selection.type_condition
+                    else parent_type
+                )
+                cost += self._selection_cost(
+                    selection.selection_set, fragment_type, visited
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self._fragments.get(name)
+                # Cyclic spreads are rejected by validation, don't recurse forever
+                if fragment is not None and name not in visited:
+                    cost += self._selection_cost(
+                        fragment.selection_set,
+                        schema.get_type(fragment.type_condition.name.value),
+                        visited | {name},
+                    )
+        return cost
+
+    def _field_cost(
+        self,
+        field: FieldNode,
+        parent_type: GraphQLObjectType,
+        visited: frozenset,
+    ) -> int:
+        name = field.name.value
+        field_def = parent_type.fields.get(name)
+        if field_def is None:
+            return 0
+        field_type = get_named_type(field_def.type)
+        is_object = isinstance(field_type, GraphQLObjectType)
+        coordinate = f"{parent_type.name}.{name}"
+        if coordinate in BATCHED_FIELDS:
+            # Paid once by the enclosing list, whatever its number of items
+            children = self._selection_cost(field.selection_set, field_type, visited)
+            self._batched += BATCHED_FIELDS[coordinate] + children
+            return 0
+        cost = FIELD_COSTS.get(coordinate, int(is_object))
+        if isinstance(get_nullable_type(field_def.type), GraphQLList):
+            outer, self._batched = self._batched, 0
+            children = self._selection_cost(field.selection_set, field_type, visited)
+            batched, self._batched = self._batched, outer
+            # Every item costs its own resolution plus its children, the batched
+            # lookups of its relationships are made once for the list
+            page_size = max(0, self._page_size(field, field_def))
+            cost += page_size * (int(is_object) + children) + batched
+        else:
+            children = self._selection_cost(field.selection_set, field_type, visited)
+            cost += children
+        return cost
+
+    def _page_size(self, field: FieldNode, field_def) -> int:
+        for argument in field.arguments or ():
+            if argument.name.value != PAGE_SIZE_ARGUMENT:
+                continue
+            if isinstance(argument.value, IntValueNode):
+                return int(argument.value.value)
+            if isinstance(argument.value, VariableNode):
+                value = (self.execution_context.variables or {}).get(
+                    argument.value.name.value
+                )
+                if isinstance(value, int):
+                    return value
+        argument_def = field_def.args.get(PAGE_SIZE_ARGUMENT)
+        if argument_def is not None and isinstance(argument_def.default_value, int):
+            return argument_def.default_value
+        return DEFAULT_LIST_SIZE
+
+
+def extensions() -> List[Any]:
+    """Cost, depth and alias limiting extensions to add to the schema"""
+    return [
+        QueryCostExtension,
+        QueryDepthLimiter(max_depth=config.GRAPHQL_MAX_DEPTH),
+        MaxAliasesLimiter(max_alias_count=config.GRAPHQL_MAX_ALIASES),
+    ]
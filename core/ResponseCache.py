@@ -0,0 +1,356 @@
+"""
+Micro-cache of complete responses for hot GET endpoints.
+
+Responses of routes matching a `CacheRule` are kept for `ttl` seconds, keyed by path
+and normalized query parameters, and replayed without running the application. Past
+their ttl, entries are still served for `stale` seconds while a single background
+request refreshes them (stale-while-revalidate).
+
+Concurrent misses of the same key are coalesced: the first request runs the
+application and the others wait for and replay its response, so a spike of identical
+requests costs one Datastore query and one serialization.
+
+Entries carry the tags of their rule. Writes call `response_cache.invalidate(tag)`,
+which drops the tagged entries and discards responses still being computed from
+before the write.
+
+Keys and tags are scoped to the tenant of the request, tenants never see each other's
+responses and a write only invalidates the responses of its own tenant.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.datastructures import Headers
+
+from config import config
+from datastore.namespace import current_namespace
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheRule:
+    """Caching of the GET requests whose path matches `pattern`"""
+
+    name: str
+    pattern: str
+    ttl: float = field(default_factory=lambda: config.RESPONSE_CACHE_TTL)
+    stale: float = field(
+        default_factory=lambda: config.RESPONSE_CACHE_STALE
+    )
+    tags: Sequence[str] = ()
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern)
+
+    def matches(self, path: str) -> bool:
+        return bool(self._regex.match(path))
+
+
+class CachedResponse:
+    """Status, headers and body of a complete response"""
+
+    __slots__ = ("status", "headers", "body", "tags", "created")
+
+    def __init__(
+        self,
+        status: int,
+        headers: List[Tuple[bytes, bytes]],
+        body: bytes,
+        tags: Sequence[Hashable] = (),
+    ):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.tags = tuple(tags)
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """Thread safe LRU store of cached responses with tag invalidation"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def generations(self, tags: Sequence[Hashable]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(
+        self,
+        key: Hashable,
+        entry: CachedResponse,
+        generations: Tuple[int, ...],
+    ) -> bool:
+        """Store a response computed when its tags were at `generations`.
+        Returns:
+            bool: False when a tag was invalidated since, the response is dropped
+        """
+        with self._lock:
+            current = tuple(self._generations.get(tag, 0) for tag in entry.tags)
+            if current != generations:
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, *tags: str) -> None:
+        """Drop the responses of the current tenant tagged with any of `tags`"""
+        tags = scoped_tags(tags)
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self._entries = OrderedDict(
+                (key, entry)
+                for key, entry in self._entries.items()
+                if not set(entry.tags).intersection(tags)
+            )
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE)
+
+
+def cache_key(path: str, query_string: bytes) -> Tuple[Optional[str], str, tuple]:
+    """Key of a request of the current tenant, independent of the order of its
+    query parameters"""
+    params = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return current_namespace(), path, tuple(sorted(params))
+
+
+def scoped_tags(tags: Sequence[str]) -> Tuple[Tuple[Optional[str], str], ...]:
+    """Tags of the current tenant"""
+    namespace = current_namespace()
+    return tuple((namespace, tag) for tag in tags)
+
+
+def _is_cacheable(status: int, headers: List[Tuple[bytes, bytes]]) -> bool:
+    if status != 200:
+        return False
+    for name, value in headers:
+        name = name.lower()
+        if name == b"set-cookie":
+            return False
+        if name == b"cache-control" and (
+            b"private" in value or b"no-store" in value
+        ):
+            return False
+    return True
+
+
+class _Capture:
+    """Forwards a response while keeping a copy of it, if it can be cached"""
+
+    def __init__(self, send):
+        self._send = send
+        self.status = 0
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.body: List[bytes] = []
+        self.cacheable = False
+        self.complete = False
+
+    async def send(self, message: dict) -> None:
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+            # Copied, outer middlewares may edit the headers in place
+            self.headers = list(message.get("headers", ()))
+            self.cacheable = _is_cacheable(self.status, self.headers)
+            message = {
+                **message,
+                "headers": [*self.headers, (b"x-cache", b"MISS")],
+            }
+        elif message["type"] == "http.response.body" and self.cacheable:
+            # Streamed responses are never buffered
+            if message.get("more_body", False):
+                self.cacheable = False
+            else:
+                self.body.append(message.get("body", b""))
+                self.complete = True
+        await self._send(message)
+
+    def response(self, tags: Sequence[Hashable]) -> Optional[CachedResponse]:
+        if not (self.cacheable and self.complete):
+            return None
+        return CachedResponse(
+            self.status, self.headers, b"".join(self.body), tags
+        )
+
+
+async def _discard(message: dict) -> None:
+    pass
+
+
+def _request_receive():
+    """Receive channel of a request without body whose client never disconnects"""
+    received = False
+
+    async def receive() -> dict:
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.get_running_loop().create_future()
+
+    return receive
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving GET responses from the `ResponseCache`"""
+
+    def __init__(
+        self,
+        app,
+        rules: List[CacheRule],
+        cache: ResponseCache = None,
+        enabled: bool = None,
+    ):
+        """
+        Args:
+            rules (List[CacheRule]): Checked in order, the first match applies.
+                Requests matching no rule are never cached.
+            cache (ResponseCache): Shared `response_cache` by default
+            enabled (bool): Pass every request through when disabled
+        """
+        self.app = app
+        self.rules = rules
+        self.cache = response_cache if cache is None else cache
+        self.enabled = (
+            config.RESPONSE_CACHE_ENABLED if enabled is None else enabled
+        )
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._tasks = set()
+
+    def match(self, path: str) -> Optional[CacheRule]:
+        for rule in self.rules:
+            if rule.matches(path):
+                return rule
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not self.enabled
+            or scope["type"] != "http"
+            or scope["method"] != "GET"
+        ):
+            return await self.app(scope, receive, send)
+        rule = self.match(scope["path"])
+        if rule is None or "authorization" in Headers(scope=scope):
+            return await self.app(scope, receive, send)
+
+        key = cache_key(scope["path"], scope["query_string"])
+        entry = self.cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.created
+            if age < rule.ttl:
+                self.cache.hits += 1
+                return await self._replay(entry, send, b"HIT")
+            if age < rule.ttl + rule.stale:
+                self.cache.stale_hits += 1
+                self._revalidate(key, rule, scope)
+                return await self._replay(entry, send, b"STALE")
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.cache.coalesced += 1
+            entry = await asyncio.shield(future)
+            if entry is not None:
+                return await self._replay(entry, send, b"HIT")
+            # The response could not be cached, compute our own
+            return await self.app(scope, receive, send)
+
+        self.cache.misses += 1
+        await self._fetch(key, rule, scope, receive, send)
+
+    async def _fetch(
+        self, key: Hashable, rule: CacheRule, scope, receive, send
+    ) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        tags = scoped_tags(rule.tags)
+        generations = self.cache.generations(tags)
+        capture = _Capture(send)
+        entry = None
+        try:
+            await self.app(scope, receive, capture.send)
+            entry = capture.response(tags)
+            if entry is not None:
+                self.cache.set(key, entry, generations)
+        finally:
+            del self._inflight[key]
+            future.set_result(entry)
+
+    def _revalidate(self, key: Hashable, rule: CacheRule, scope) -> None:
+        if key in self._inflight:
+            return
+        scope = {**scope, "state": dict(scope.get("state", {}))}
+        task = asyncio.create_task(self._refresh(key, rule, scope))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable, rule: CacheRule, scope) -> None:
+        try:
+            await self._fetch(
+                key, rule, scope, _request_receive(), _discard
+            )
+        except Exception:
+            # The stale entry expires on its own
+            logger.exception("Revalidation of %s failed", scope["path"])
+
+    @staticmethod
+    async def _replay(entry: CachedResponse, send, state: bytes) -> None:
+        age = int(time.monotonic() - entry.created)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": entry.status,
+                # A new list, outer middlewares may edit the headers in place
+                "headers": [
+                    *entry.headers,
+                    (b"x-cache", state),
+                    (b"age", str(age).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": entry.body})
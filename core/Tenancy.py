@@ -0,0 +1,165 @@
+"""
+Tenant resolution per request.
+
+`TenantMiddleware` reads the tenant of a request from the `TENANT_HEADER` header or a
+`TENANT_PATH_PREFIX/<tenant>/...` path, whose prefix is stripped before routing, and runs
+the request as that tenant. Datastore operations then use the tenant's namespace, see
+`datastore.namespace`, and caches and metrics are kept apart per tenant.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+
+import orjson
+from starlette.datastructures import Headers
+
+from config import config
+from datastore.namespace import is_valid_namespace, use_namespace
+
+# Tenant reported for requests without tenant
+DEFAULT_TENANT = "default"
+# Tenants tracked separately, later ones are reported together
+MAX_TRACKED_TENANTS = 10_000
+OTHER_TENANTS = "other"
+
+
+@dataclass
+class TenantStats:
+    requests: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+
+
+_stats: Dict[str, TenantStats] = {}
+_stats_lock = threading.Lock()
+
+
+def stats_of(tenant: Optional[str]) -> TenantStats:
+    name = tenant or DEFAULT_TENANT
+    stats = _stats.get(name)
+    if stats is None:
+        with _stats_lock:
+            if name not in _stats and len(_stats) >= MAX_TRACKED_TENANTS:
+                name = OTHER_TENANTS
+            stats = _stats.setdefault(name, TenantStats())
+    return stats
+
+
+def metrics() -> Dict[str, dict]:
+    return {
+        tenant: {**vars(stats), "total_ms": round(stats.total_ms, 3)}
+        for tenant, stats in list(_stats.items())
+    }
+
+
+class InvalidTenant(Exception):
+    """The tenant of a request is not a valid namespace name"""
+
+
+class TenantMiddleware:
+    """ASGI middleware running each request as the tenant it names"""
+
+    def __init__(
+        self,
+        app,
+        header: str = None,
+        path_prefix: str = None,
+        required: bool = None,
+        exempt: Sequence[str] = (
+            r"/v1/admin/",
+            r"/ready",
+            r"/docs",
+            r"/openapi.json",
+        ),
+    ):
+        """
+        Args:
+            header (str): Header naming the tenant
+            path_prefix (str): Prefix of paths naming the tenant, disabled when empty
+            required (bool): Reject requests without tenant with 400
+            exempt (List[str]): Patterns of paths served without tenant when required
+        """
+        self.app = app
+        self.header = (header or config.TENANT_HEADER).lower()
+        prefix = config.TENANT_PATH_PREFIX if path_prefix is None else path_prefix
+        self._path_regex = None
+        if prefix:
+            self._path_regex = re.compile(
+                re.escape(prefix.rstrip("/")) + r"/(?P<tenant>[^/]+)(?P<path>/.*)?"
+            )
+        self.required = config.TENANT_REQUIRED if required is None else required
+        self._exempt = [re.compile(pattern) for pattern in exempt]
+
+    def resolve(self, scope) -> Tuple[Optional[str], dict]:
+        """Tenant of a request and its scope, with the tenant path prefix stripped"""
+        tenant = None
+        if self._path_regex is not None:
+            match = self._path_regex.fullmatch(scope["path"])
+            if match:
+                tenant = match["tenant"]
+                path = match["path"] or "/"
+                prefix = scope["path"][: len(scope["path"]) - len(path)]
+                scope = {
+                    **scope,
+                    "path": path,
+                    "raw_path": path.encode(),
+                    "root_path": scope.get("root_path", "") + prefix,
+                }
+        if tenant is None:
+            tenant = Headers(scope=scope).get(self.header) or None
+        if tenant is not None and not is_valid_namespace(tenant):
+            raise InvalidTenant(tenant)
+        return tenant, scope
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        try:
+            tenant, scope = self.resolve(scope)
+        except InvalidTenant:
+            return await self._reject("Invalid tenant", scope, send)
+        if (
+            tenant is None
+            and self.required
+            and not any(regex.match(scope["path"]) for regex in self._exempt)
+        ):
+            return await self._reject("Tenant required", scope, send)
+
+        stats = stats_of(tenant)
+        stats.requests += 1
+        # Unhandled errors never start a response
+        status = 500 if scope["type"] == "http" else 101
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            with use_namespace(tenant):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            stats.errors += status >= 500
+            stats.total_ms += (time.perf_counter() - started) * 1000
+
+    @staticmethod
+    async def _reject(detail: str, scope, send) -> None:
+        if scope["type"] != "http":
+            return await send({"type": "websocket.close", "code": 1008})
+        body = orjson.dumps({"detail": detail})
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
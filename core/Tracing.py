@@ -0,0 +1,382 @@
+"""
+Lightweight, OpenTelemetry compatible request tracing.
+
+Spans follow the OpenTelemetry data model (128 bit trace ids, 64 bit span ids,
+parent links, attributes named after the semantic conventions) so exported spans
+can be forwarded to any OTel collector, but the tracer itself has no dependency
+on the OpenTelemetry SDK.
+
+Sampling is decided once per trace at the root span. Spans of an unsampled trace
+are a shared non recording span, which keeps the cost of instrumentation to a
+context variable lookup per span.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isawaitable, iscoroutinefunction
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+)
+
+from strawberry.extensions import SchemaExtension
+
+from config import config
+from datastore.namespace import current_namespace
+
+
+class Span:
+    """A single timed operation within a trace"""
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "start_time",
+        "end_time",
+        "status",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: int,
+        parent_id: Optional[int] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.status = "UNSET"
+
+    @property
+    def is_recording(self) -> bool:
+        return self.end_time is None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self.end_time is None:
+            return None
+        return (self.end_time - self.start_time) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.status = "ERROR"
+        self.attributes["exception.type"] = type(exception).__name__
+        self.attributes["exception.message"] = str(exception)
+
+    def end(self) -> None:
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+
+    def to_dict(self) -> dict:
+        """Span in the OTLP/JSON field layout"""
+        return {
+            "name": self.name,
+            "traceId": f"{self.trace_id:032x}",
+            "spanId": f"{self.span_id:016x}",
+            "parentSpanId": f"{self.parent_id:016x}" if self.parent_id else "",
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+    def __repr__(self):
+        return f"Span('{self.name}', {self.duration_ms}ms)"
+
+
+class _NonRecordingSpan(Span):
+    """Span handed out for unsampled traces, every operation is a no-op"""
+
+    def __init__(self):
+        self.name = ""
+        self.trace_id = 0
+        self.span_id = 0
+        self.parent_id = None
+        self.attributes = {}
+        self.start_time = 0
+        self.end_time = 0
+        self.status = "UNSET"
+
+    @property
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+
+INVALID_SPAN = _NonRecordingSpan()
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: Sequence[Span]) -> None:
+        ...
+
+    def shutdown(self) -> None:
+        ...
+
+
+class NoOpSpanExporter:
+    """Default exporter, drops every span"""
+
+    def export(self, spans: Sequence[Span]) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in memory, meant for tests"""
+
+    def __init__(self):
+        self._spans: List[Span] = []
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self._spans.extend(spans)
+
+    def get_finished_spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def clear(self) -> None:
+        self._spans.clear()
+
+    def shutdown(self) -> None:
+        self.clear()
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the configured exporter"""
+
+    def __init__(
+        self,
+        exporter: Optional[SpanExporter] = None,
+        sample_rate: float = 1.0,
+    ):
+        self.exporter = exporter or NoOpSpanExporter()
+        self.sample_rate = sample_rate
+
+    def configure(
+        self,
+        exporter: Optional[SpanExporter] = None,
+        sample_rate: Optional[float] = None,
+    ) -> None:
+        """Swap the exporter and/or sample rate at runtime"""
+        if exporter is not None:
+            self.exporter.shutdown()
+            self.exporter = exporter
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 and not isinstance(
+            self.exporter, NoOpSpanExporter
+        )
+
+    @staticmethod
+    def current_span() -> Span:
+        return _current_span.get() or INVALID_SPAN
+
+    def _should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def start_span(
+        self, name: str, attributes: Optional[Dict[str, Any]] = None
+    ) -> Span:
+        """Start a span as child of the current one without making it current.
+        Args:
+            name (str): Span name, `<layer>.<operation>` by convention
+            attributes (dict): Attributes to set on the span upfront
+        Returns:
+            Span: The started span, a non recording one when unsampled
+        """
+        parent = _current_span.get()
+        if parent is None:
+            if not self._should_sample():
+                return INVALID_SPAN
+            return Span(name, random.getrandbits(128), None, attributes)
+        if parent is INVALID_SPAN:
+            return INVALID_SPAN
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+
+    def end_span(self, span: Span) -> None:
+        """End a span and hand it to the exporter"""
+        if span is INVALID_SPAN:
+            return
+        span.end()
+        self.exporter.export((span,))
+
+    @contextmanager
+    def use_span(self, span: Span) -> Iterator[Span]:
+        """Make `span` the current span, recording raised exceptions on it"""
+        if _current_span.get() is span:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_exception(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+
+    @contextmanager
+    def start_as_current_span(
+        self, name: str, attributes: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Span]:
+        """Start a span, make it current and end it on exit.
+        Args:
+            name (str): Span name, `<layer>.<operation>` by convention
+            attributes (dict): Attributes to set on the span upfront
+        Yields:
+            Span: The started span, a non recording one when unsampled
+        """
+        span = self.start_span(name, attributes)
+        try:
+            with self.use_span(span):
+                yield span
+        finally:
+            self.end_span(span)
+
+
+tracer = Tracer(sample_rate=config.TRACING_SAMPLE_RATE)
+if config.TRACING_EXPORTER == "memory":
+    tracer.configure(exporter=InMemorySpanExporter())
+
+
+def traced(name: Optional[str] = None, **attributes: Any) -> Callable:
+    """Decorator wrapping every call of a sync or async function in a span.
+    Args:
+        name (str): Span name, defaults to the function qualified name
+        **attributes: Static attributes set on every span
+    """
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if iscoroutinefunction(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(span_name, attributes):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(span_name, attributes):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request.
+    The root span covers routing, dependency injection and response
+    serialization, so its duration minus the handler span is framework time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        attributes = {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        }
+        tenant = current_namespace()
+        if tenant is not None:
+            attributes["tenant.id"] = tenant
+        name = f"HTTP {scope['method']} {scope['path']}"
+        with tracer.start_as_current_span(name, attributes) as span:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute(
+                        "http.status_code", message["status"]
+                    )
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+class TracingExtension(SchemaExtension):
+    """Strawberry extension wrapping the operation and every resolver in spans"""
+
+    def on_operation(self):
+        name = self.execution_context.operation_name or "anonymous"
+        with tracer.start_as_current_span(
+            f"graphql.{name}",
+            {"graphql.operation.name": name},
+        ):
+            yield
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        if info.parent_type.name not in ("Query", "Mutation"):
+            return _next(root, info, *args, **kwargs)
+
+        span = tracer.start_span(
+            f"graphql.resolve.{info.parent_type.name}.{info.field_name}",
+            {"graphql.field.name": info.field_name},
+        )
+        try:
+            with tracer.use_span(span):
+                result = _next(root, info, *args, **kwargs)
+        except BaseException:
+            tracer.end_span(span)
+            raise
+        if isawaitable(result):
+            return self._await_in_span(span, result)
+        tracer.end_span(span)
+        return result
+
+    @staticmethod
+    async def _await_in_span(span: Span, result):
+        try:
+            with tracer.use_span(span):
+                return await result
+        finally:
+            tracer.end_span(span)
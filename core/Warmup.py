@@ -0,0 +1,241 @@
+"""
+Cache warm-up on startup, gating readiness.
+
+A freshly started instance serves every request from Datastore until its caches fill. On
+shutdown, `save_snapshot` writes the hottest keys of every entity cache and the persisted
+GraphQL queries to `WARMUP_SNAPSHOT_PATH`, and on startup `warm_up` restores them:
+
+1. The entity metadata of every model is computed.
+2. Persisted queries are registered again and their documents parsed and validated, by
+   running the read-only ones once, which also loads what they read.
+3. The hot keys are read in batched lookups into the entity caches. Without snapshot,
+   the first `WARMUP_TOP_N` keys of every cached kind are read instead.
+
+`/ready` answers 503 until warm-up completes, so load balancers only route traffic to
+warm instances. Warm-up failures are logged and counted but do not keep the instance
+unready, a cold cache is slower, not broken.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from graphql import OperationType, get_operation_ast, parse
+
+from config import config
+from core.PersistedQueries import persisted_queries, query_hash
+from datastore import entitycache
+from datastore.database import DB
+from datastore.entity import DatastoreEntity, _metadata
+from datastore.key import DatastoreKey
+
+logger = logging.getLogger(__name__)
+
+
+class State:
+    PENDING = "pending"
+    WARMING = "warming"
+    READY = "ready"
+
+
+@dataclass
+class WarmupProgress:
+    state: str = State.PENDING
+    step: Optional[str] = None
+    models: int = 0
+    queries_total: int = 0
+    queries_loaded: int = 0
+    keys_total: int = 0
+    keys_loaded: int = 0
+    errors: int = 0
+    timed_out: bool = False
+    started: Optional[float] = None
+    duration_ms: float = 0.0
+    steps_ms: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == State.READY
+
+
+progress = WarmupProgress()
+
+
+def metrics() -> dict:
+    return {
+        **vars(progress),
+        "duration_ms": round(progress.duration_ms, 3),
+        "steps_ms": {
+            step: round(ms, 3) for step, ms in progress.steps_ms.items()
+        },
+    }
+
+
+def _snapshot_path(path: Optional[str]) -> str:
+    return path or config.WARMUP_SNAPSHOT_PATH
+
+
+def save_snapshot(path: str = None, limit: int = None) -> int:
+    """Write the hottest cached keys and the persisted queries.
+    Args:
+        path (str): Snapshot file, `WARMUP_SNAPSHOT_PATH` by default
+        limit (int): Keys kept per kind, `WARMUP_MAX_KEYS` by default
+    Returns:
+        int: Number of keys written
+    """
+    limit = limit or config.WARMUP_MAX_KEYS
+    keys = [
+        DatastoreKey.from_path(
+            *key.flat_path, project=key.project, namespace=key.namespace
+        ).urlsafe
+        for cache in entitycache.caches()
+        for key in cache.hot_keys(limit)
+    ]
+    snapshot = {
+        "keys": keys,
+        "queries": [query for _, query in persisted_queries.items()],
+    }
+    path = _snapshot_path(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Written aside then renamed, so a crash never leaves a truncated snapshot
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(orjson.dumps(snapshot))
+    os.replace(f"{path}.tmp", path)
+    return len(keys)
+
+
+def load_snapshot(path: str = None) -> Optional[dict]:
+    try:
+        with open(_snapshot_path(path), "rb") as file:
+            return orjson.loads(file.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError):
+        logger.exception("Unreadable warm-up snapshot, ignored")
+        return None
+
+
+def _is_read_only(query: str) -> bool:
+    operation = get_operation_ast(parse(query))
+    return operation is not None and operation.operation == OperationType.QUERY
+
+
+async def _warm_queries(schema, queries: List[str], context: Callable[[], Any]) -> None:
+    progress.queries_total = len(queries)
+    for query in queries:
+        try:
+            persisted_queries.set(query_hash(query), query)
+            if _is_read_only(query):
+                # Fills the document cache, errors of missing variables included
+                await schema.execute(query, context_value=context())
+        except Exception:
+            progress.errors += 1
+            logger.exception("Warm-up of a persisted query failed")
+        progress.queries_loaded += 1
+
+
+def _hot_keys(
+    snapshot: Optional[dict], models: Sequence[Type[DatastoreEntity]]
+) -> Dict[str, List[DatastoreKey]]:
+    """Keys to load by kind, from the snapshot or the first keys of each kind"""
+    cached = {
+        model.DatastoreConfig.kind: model
+        for model in models
+        if entitycache.is_cached(model.DatastoreConfig)
+    }
+    keys: Dict[str, List[DatastoreKey]] = {kind: [] for kind in cached}
+    if snapshot is not None:
+        for urlsafe in snapshot.get("keys", ()):
+            try:
+                key = DatastoreKey.from_urlsafe(urlsafe)
+            except ValueError:
+                continue
+            if key.kind in keys:
+                keys[key.kind].append(key)
+        return keys
+    for kind, model in cached.items():
+        keys[kind] = DB(model).list_keys(limit=config.WARMUP_TOP_N)
+    return keys
+
+
+def _warm_keys(
+    snapshot: Optional[dict], models: Sequence[Type[DatastoreEntity]]
+) -> None:
+    keys = _hot_keys(snapshot, models)
+    progress.keys_total = sum(map(len, keys.values()))
+    batch_size = config.WARMUP_BATCH_SIZE
+    for kind, kind_keys in keys.items():
+        db = DB(next(m for m in models if m.DatastoreConfig.kind == kind))
+        for start in range(0, len(kind_keys), batch_size):
+            batch = kind_keys[start : start + batch_size]
+            try:
+                db.get_many(batch)
+            except Exception:
+                progress.errors += 1
+                logger.exception("Warm-up of %s keys failed", kind)
+            progress.keys_loaded += len(batch)
+
+
+async def _step(name: str, run: Callable) -> None:
+    progress.step = name
+    started = time.perf_counter()
+    try:
+        await run()
+    except Exception:
+        progress.errors += 1
+        logger.exception("Warm-up step %s failed", name)
+    progress.steps_ms[name] = (time.perf_counter() - started) * 1000
+
+
+async def warm_up(
+    schema,
+    models: Sequence[Type[DatastoreEntity]],
+    context: Callable[[], Any],
+    snapshot_path: str = None,
+) -> None:
+    """Warm the caches, then mark the instance ready.
+    Args:
+        schema: GraphQL schema persisted queries are run against
+        models: Entity models to warm
+        context: Returns the GraphQL context of persisted queries
+        snapshot_path (str): Snapshot file, `WARMUP_SNAPSHOT_PATH` by default
+    """
+    progress.state = State.WARMING
+    progress.started = time.time()
+    started = time.perf_counter()
+    snapshot = load_snapshot(snapshot_path)
+
+    async def metadata():
+        for model in models:
+            _metadata(model)
+        progress.models = len(models)
+
+    async def queries():
+        await _warm_queries(schema, (snapshot or {}).get("queries", []), context)
+
+    async def keys():
+        await run_in_threadpool(_warm_keys, snapshot, models)
+
+    async def steps():
+        await _step("metadata", metadata)
+        await _step("queries", queries)
+        await _step("keys", keys)
+
+    try:
+        await asyncio.wait_for(steps(), config.WARMUP_TIMEOUT)
+    except asyncio.TimeoutError:
+        progress.timed_out = True
+        logger.warning("Warm-up timed out during %s", progress.step)
+    finally:
+        progress.step = None
+        progress.duration_ms = (time.perf_counter() - started) * 1000
+        progress.state = State.READY
+
+
+def skip() -> None:
+    """Mark the instance ready without warming up"""
+    progress.state = State.READY
@@ -0,0 +1,250 @@
+"""
+In-process change feed of Datastore entities.
+
+`DB` publishes a `ChangeEvent` to `change_bus` after every upsert and delete, fanned out
+to the subscribers of its kind. Consumers subscribe from an
+event loop with their own filters, see `ChangeBus.subscribe`, and receive the matching
+events through a bounded buffer: a consumer slower than the writes loses its oldest
+events, counted in `Subscription.dropped`, instead of holding memory or slowing writers.
+
+The last `history` events are kept, whether or not anyone is subscribed, so a consumer
+reconnecting with the sequence of the last event it saw, e.g. the SSE `Last-Event-ID`,
+gets the events it missed meanwhile, even when it was the only subscriber.
+
+Events are only seen by the process that wrote them, subscribers of other instances are
+not notified.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Collection, Deque, Dict, List, Optional
+
+from config import config
+from datastore.namespace import current_namespace
+
+
+class Operation:
+    """Operations published to the change feed"""
+
+    UPSERT = "upsert"
+    DELETE = "delete"
+
+
+@dataclass
+class ChangeEvent:
+    sequence: int
+    kind: str
+    operation: str
+    # Id or name of the entity key
+    id: Any
+    # Namespace of the tenant which made the change, None without tenant
+    namespace: Optional[str]
+    # The record written, None for deletes
+    record: Any = None
+    timestamp: float = field(default_factory=time.time)
+
+    def dict(self) -> dict:
+        return {
+            "sequence": self.sequence,
+            "kind": self.kind,
+            "operation": self.operation,
+            "id": self.id,
+            "namespace": self.namespace,
+            "record": self.record.dict() if self.record is not None else None,
+            "timestamp": self.timestamp,
+        }
+
+
+class TooManySubscribers(Exception):
+    """The bus already has `max_subscribers` subscriptions"""
+
+
+class Subscription:
+    """Bounded buffer of the events matching the filters of one consumer.
+    Events are offered from any thread, read from the event loop it was created on.
+    """
+
+    def __init__(
+        self,
+        bus: "ChangeBus",
+        kind: str,
+        namespace: Optional[str],
+        ids: Optional[Collection[Any]] = None,
+        operations: Optional[Collection[str]] = None,
+        predicate: Optional[Callable[[ChangeEvent], bool]] = None,
+        maxsize: int = None,
+    ):
+        self.bus = bus
+        self.kind = kind
+        self.namespace = namespace
+        # Compared as strings, keys built from key patterns are named after the ids
+        self.ids = {str(id) for id in ids} if ids else None
+        self.operations = set(operations) if operations else None
+        self.predicate = predicate
+        self.maxsize = maxsize or config.CHANGES_BUFFER_SIZE
+        self.dropped = 0
+        self.delivered = 0
+        self._events: Deque[ChangeEvent] = deque()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self.closed = False
+
+    def matches(self, event: ChangeEvent) -> bool:
+        return (
+            event.kind == self.kind
+            and event.namespace == self.namespace
+            and (self.ids is None or str(event.id) in self.ids)
+            and (self.operations is None or event.operation in self.operations)
+            and (self.predicate is None or self.predicate(event))
+        )
+
+    def offer(self, event: ChangeEvent) -> None:
+        if self.closed or not self.matches(event):
+            return
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self._events.popleft()
+                self.dropped += 1
+            self._events.append(event)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop of the consumer is gone
+            self.close()
+
+    async def get(self) -> ChangeEvent:
+        """Next matching event, waiting for one if needed"""
+        while True:
+            with self._lock:
+                if self._events:
+                    self.delivered += 1
+                    return self._events.popleft()
+                self._ready.clear()
+            await self._ready.wait()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> ChangeEvent:
+        return await self.get()
+
+    def close(self) -> None:
+        self.closed = True
+        self.bus.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ChangeBus:
+    """Fans change events out to the subscriptions of their kind"""
+
+    def __init__(self, history: int = None, max_subscribers: int = None):
+        self.max_subscribers = max_subscribers or config.CHANGES_MAX_SUBSCRIBERS
+        self._subscriptions: Dict[str, List[Subscription]] = {}
+        self._history: Deque[ChangeEvent] = deque(
+            maxlen=config.CHANGES_HISTORY_SIZE if history is None else history
+        )
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def has_subscribers(self, kind: str) -> bool:
+        return bool(self._subscriptions.get(kind))
+
+    def publish(
+        self,
+        kind: str,
+        operation: str,
+        id: Any,
+        record: Any = None,
+    ) -> ChangeEvent:
+        """Record a change made by the current tenant and deliver it to the matching
+        subscriptions.
+        Returns:
+            The event
+        """
+        with self._lock:
+            event = ChangeEvent(
+                next(self._sequence), kind, operation, id, current_namespace(), record
+            )
+            self._history.append(event)
+            subscriptions = list(self._subscriptions.get(kind, ()))
+            self.published += 1
+        for subscription in subscriptions:
+            subscription.offer(event)
+        return event
+
+    def subscribe(
+        self,
+        kind: str,
+        ids: Optional[Collection[Any]] = None,
+        operations: Optional[Collection[str]] = None,
+        predicate: Optional[Callable[[ChangeEvent], bool]] = None,
+        since: Optional[int] = None,
+        maxsize: int = None,
+    ) -> Subscription:
+        """Subscribe to the changes of a kind in the namespace of the current tenant.
+        Args:
+            kind (str): Kind of the entities
+            ids: Only the changes of these entity ids
+            operations: Only these operations, see `Operation`
+            predicate: Only the events it returns True for
+            since (int): Replay the kept events following this sequence
+            maxsize (int): Events buffered before the oldest are dropped
+        Raises:
+            TooManySubscribers: The bus is at `max_subscribers`
+        """
+        subscription = Subscription(
+            self,
+            kind,
+            current_namespace(),
+            ids=ids,
+            operations=operations,
+            predicate=predicate,
+            maxsize=maxsize,
+        )
+        with self._lock:
+            if self.subscriber_count >= self.max_subscribers:
+                raise TooManySubscribers(self.max_subscribers)
+            self._subscriptions.setdefault(kind, []).append(subscription)
+            if since is not None:
+                for event in self._history:
+                    if event.sequence > since:
+                        subscription.offer(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.kind, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(map(len, self._subscriptions.values()))
+
+    def metrics(self) -> dict:
+        subscriptions = [
+            subscription
+            for subscriptions in list(self._subscriptions.values())
+            for subscription in list(subscriptions)
+        ]
+        return {
+            "subscribers": len(subscriptions),
+            "published": self.published,
+            "history": len(self._history),
+            "delivered": sum(s.delivered for s in subscriptions),
+            "dropped": sum(s.dropped for s in subscriptions),
+            "buffered": sum(len(s._events) for s in subscriptions),
+        }
+
+
+change_bus = ChangeBus()
@@ -0,0 +1,244 @@
+"""
+Sharded counters for aggregates written more often than a single entity allows.
+
+Datastore sustains about one write per second to an entity, so a count kept on the entity
+it describes and read-modify-written through `DB.upsert` caps there. A `ShardedCounter`
+spreads the count of each item over several `CounterShard` entities: increments update a
+random shard in a transaction and reads sum every shard in a single lookup.
+
+Shard 0 of an item records its shard count. When increments of an item keep conflicting
+the count is doubled, up to `max_shards`, and readers pick it up from shard 0.
+
+Sums are cached per process for `cache_ttl` seconds, increments made by the process are
+added to the cached sums so they are read back at once.
+"""
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from google.api_core.exceptions import Conflict
+from google.cloud.datastore import Entity, Key
+
+from config import config
+from datastore.namespace import current_namespace
+
+SHARD_KIND = "CounterShard"
+# Most keys Datastore accepts in a single lookup
+MAX_LOOKUP_KEYS = 1000
+# Conflicting increments of an item before its shard count is doubled
+GROWTH_CONFLICTS = 3
+# Attempts of an increment, each on a random shard
+MAX_ATTEMPTS = 5
+# Sums kept in the cache of a counter, the oldest are dropped first
+MAX_CACHED_SUMS = 10_000
+
+
+class CounterError(Exception):
+    """An increment kept conflicting on every attempt"""
+
+
+class ShardedCounter:
+    """Counts of many items, each spread over shard entities"""
+
+    def __init__(
+        self,
+        name: str,
+        client=None,
+        shards: int = None,
+        max_shards: int = None,
+        cache_ttl: float = None,
+    ):
+        """
+        Args:
+            name (str): Name of the counter, unique among counters
+            client: Datastore client, the shared `base_client` by default
+            shards (int): Initial shard count of every item
+            max_shards (int): Shard count items never grow past
+            cache_ttl (float): Seconds sums are served from the cache
+        """
+        if client is None:
+            from datastore.database import base_client
+
+            client = base_client
+        self.name = name
+        self.client = client
+        self.shards = shards or config.COUNTER_SHARDS
+        self.max_shards = max(max_shards or config.COUNTER_MAX_SHARDS, self.shards)
+        self.cache_ttl = config.COUNTER_CACHE_TTL if cache_ttl is None else cache_ttl
+        # Items grown past the initial shard count, by (namespace, item)
+        self._shard_counts: Dict[Tuple, int] = {}
+        self._conflicts: Dict[Tuple, int] = {}
+        self._sums: Dict[Tuple, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+        self.increments = 0
+        self.conflicts = 0
+        self.growths = 0
+        self.reads = 0
+        self.cache_hits = 0
+        _counters[name] = self
+
+    def _namespace(self) -> Optional[str]:
+        return current_namespace() or self.client.namespace
+
+    def _key(self, namespace: Optional[str], item: str, index: int) -> Key:
+        return Key(
+            SHARD_KIND,
+            f"{self.name}:{item}:{index}",
+            project=self.client.project,
+            namespace=namespace,
+        )
+
+    def _shard(self, key: Key, item: str) -> Entity:
+        shard = Entity(key=key, exclude_from_indexes=("value", "shards"))
+        shard.update(counter=self.name, item=item, value=0)
+        return shard
+
+    def shard_count(self, item: Any) -> int:
+        """Shard count of an item known to this process"""
+        return self._shard_counts.get((self._namespace(), str(item)), self.shards)
+
+    def increment(self, item: Any, delta: int = 1) -> None:
+        """Add `delta` to the count of an item.
+        Raises:
+            CounterError: Every attempt conflicted with concurrent increments
+        """
+        namespace, item = self._namespace(), str(item)
+        item_key = (namespace, item)
+        for _ in range(MAX_ATTEMPTS):
+            index = random.randrange(self._shard_counts.get(item_key, self.shards))
+            try:
+                self._add(self._key(namespace, item, index), item, delta)
+            except Conflict:
+                self._contended(namespace, item)
+                continue
+            with self._lock:
+                self.increments += 1
+                cached = self._sums.get(item_key)
+                if cached is not None:
+                    self._sums[item_key] = (cached[0], cached[1] + delta)
+            return
+        raise CounterError(f"Increment of {self.name} {item} kept conflicting")
+
+    def _add(self, key: Key, item: str, delta: int) -> None:
+        with self.client.transaction():
+            shard = self.client.get(key) or self._shard(key, item)
+            shard["value"] += delta
+            self.client.put(shard)
+
+    def _contended(self, namespace: Optional[str], item: str) -> None:
+        item_key = (namespace, item)
+        with self._lock:
+            self.conflicts += 1
+            conflicts = self._conflicts[item_key] = self._conflicts.get(item_key, 0) + 1
+        if conflicts >= GROWTH_CONFLICTS:
+            self._grow(namespace, item)
+
+    def _grow(self, namespace: Optional[str], item: str) -> None:
+        """Double the shard count of an item, recorded on its shard 0"""
+        item_key = (namespace, item)
+        shards = self._shard_counts.get(item_key, self.shards)
+        if shards >= self.max_shards:
+            return
+        key = self._key(namespace, item, 0)
+        try:
+            with self.client.transaction():
+                shard = self.client.get(key) or self._shard(key, item)
+                # Another process may have grown it further already
+                shards = max(min(shards * 2, self.max_shards), shard.get("shards", 0))
+                shard["shards"] = shards
+                self.client.put(shard)
+        except Conflict:
+            # Retried after the next conflicts
+            return
+        with self._lock:
+            self._shard_counts[item_key] = shards
+            self._conflicts.pop(item_key, None)
+            self.growths += 1
+
+    def value(self, item: Any) -> int:
+        """Count of an item"""
+        return self.values([item])[item]
+
+    def values(self, items: Iterable[Any]) -> Dict[Any, int]:
+        """Counts of many items, the uncached ones read in batched lookups"""
+        namespace = self._namespace()
+        now = time.monotonic()
+        counts: Dict[Any, int] = {}
+        missing: Dict[str, List[Any]] = {}
+        for item in items:
+            cached = self._sums.get((namespace, str(item)))
+            if cached is not None and now - cached[0] < self.cache_ttl:
+                counts[item] = cached[1]
+                self.cache_hits += 1
+            else:
+                missing.setdefault(str(item), []).append(item)
+
+        if missing:
+            sums = self._read(namespace, list(missing))
+            with self._lock:
+                for item, total in sums.items():
+                    self._sums.pop((namespace, item), None)
+                    self._sums[(namespace, item)] = (now, total)
+                    for original in missing[item]:
+                        counts[original] = total
+                while len(self._sums) > MAX_CACHED_SUMS:
+                    del self._sums[next(iter(self._sums))]
+        return counts
+
+    def _read(self, namespace: Optional[str], items: List[str]) -> Dict[str, int]:
+        sums = dict.fromkeys(items, 0)
+        keys = [
+            (item, self._key(namespace, item, index))
+            for item in items
+            for index in range(self._shard_counts.get((namespace, item), self.shards))
+        ]
+        while keys:
+            grown = []
+            for item, shard in self._lookup(keys):
+                sums[item] += shard["value"]
+                shards = shard.get("shards", 0)
+                known = self._shard_counts.get((namespace, item), self.shards)
+                if shards > known:
+                    # Grown by another process, read the shards added since
+                    self._shard_counts[(namespace, item)] = shards
+                    grown.extend(
+                        (item, self._key(namespace, item, index))
+                        for index in range(known, shards)
+                    )
+            keys = grown
+        return sums
+
+    def _lookup(self, keys: List[Tuple[str, Key]]) -> Iterable[Tuple[str, Entity]]:
+        items = {key.flat_path: item for item, key in keys}
+        for start in range(0, len(keys), MAX_LOOKUP_KEYS):
+            batch = [key for _, key in keys[start : start + MAX_LOOKUP_KEYS]]
+            self.reads += 1
+            for shard in self.client.get_multi(batch):
+                yield items[shard.key.flat_path], shard
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._sums.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "name": self.name,
+            "shards": self.shards,
+            "max_shards": self.max_shards,
+            "grown_items": len(self._shard_counts),
+            "cached_sums": len(self._sums),
+            "increments": self.increments,
+            "conflicts": self.conflicts,
+            "growths": self.growths,
+            "reads": self.reads,
+            "cache_hits": self.cache_hits,
+        }
+
+
+_counters: Dict[str, ShardedCounter] = {}
+
+
+def metrics() -> List[dict]:
+    return [counter.metrics() for counter in list(_counters.values())]
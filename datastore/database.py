@@ -4,16 +4,31 @@ This module exports the class `DB` to be used as the parent class for any class
 database.
 """
 import re
+import time
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 
-from typing import Any, Set, List, Type, Tuple, Union, TypeVar, Iterator, Optional, overload
+from typing import Any, Set, Callable, Dict, List, Sequence, Type, Tuple, Union, TypeVar, Iterator, Optional, overload
 from dataclasses import dataclass
 
 # Installed Packages
-from pydantic import parse_obj_as, ValidationError
+from pydantic import parse_obj_as
 from google.cloud.datastore import Client
 
 from config import config
+from core.MemoryProfiler import memory_profiler
+from core.Tracing import tracer
 from datastore import DatastoreKey, DatastoreEntity
+from datastore.changes import Operation, change_bus
+from datastore.entitycache import get_cache, is_cached
+from datastore.memory import MemoryClient
+from datastore.namespace import namespace_of
+from datastore.offload import offloader, parse_batch
+from datastore.profiler import query_profiler
+from datastore.scan import ParallelScan
+from datastore.writebehind import MAX_BATCH_SIZE, get_buffer
 
 
 Filters = List[Union[tuple, str]]
@@ -47,14 +62,10 @@ class _BaseClient(Client):
         self.credentials = credentials
 
     def __enter__(self) -> Client:
-        """Enter client method"""
-        return Client(
-            project=self.project,
-            namespace=self.namespace,
-            credentials=self.credentials,
-            _http=self._http,
-            _use_grpc=self._use_grpc,
-        )
+        """Enter client method. The client is shared, its HTTP session and
+        credentials are reused by every namespace, which is given per operation.
+        """
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Exit client method"""
@@ -69,6 +80,8 @@ class DatastoreOperators:
     greater_than_or_equal = ">="
     less_than = "<"
     less_than_or_equal = "<="
+    # Matches any value of a list, not available in filter strings
+    is_in = "IN"
 
     @classmethod
     def list_all(cls) -> list:
@@ -101,14 +114,55 @@ def parse_filter_string(filter_string: str) -> tuple:
     return tuple(match)
 
 
+def query_shape(query) -> dict:
+    """Span attributes describing the shape of a query, filter values left out"""
+    return {
+        "db.datastore.kind": query.kind,
+        "db.datastore.filters": [f"{name}{op}" for name, op, _ in query.filters],
+        "db.datastore.order": list(query.order),
+    }
+
+
+KEY_PROPERTY = "__key__"
+# Most keys Datastore accepts in a single lookup
+MAX_LOOKUP_KEYS = 1000
+# Entities `DB.list` parses at once, the raw entities of a page are never all held
+MAX_PARSE_CHUNK = 500
+# Most values Datastore accepts in an `IN` filter
+MAX_IN_VALUES = 30
+
 model_type = TypeVar("model_type", bound="DatastoreEntity")
 
-base_client = _BaseClient(
-    credentials=config.service_credentials,
-    project=config.PROJECT_ID,
-    namespace=config.NAMESPACE,
-    use_grpc=False,
-)
+
+def create_client(backend: str = None) -> Union[_BaseClient, MemoryClient]:
+    """Create the Datastore client of a backend.
+    Args:
+        backend (str): "cloud" for Google Datastore or "memory" for the in-memory
+            backend, defaults to `config.DATASTORE_BACKEND`
+    Returns:
+        The client shared by every `DB` instance
+    """
+    backend = backend or config.DATASTORE_BACKEND
+    if backend == "memory":
+        return MemoryClient(project=config.PROJECT_ID, namespace=config.NAMESPACE)
+    if backend == "cloud":
+        return _BaseClient(
+            credentials=config.service_credentials,
+            project=config.PROJECT_ID,
+            namespace=config.NAMESPACE,
+            use_grpc=False,
+        )
+    raise DatabaseError(f"Unknown datastore backend '{backend}'")
+
+
+base_client = create_client()
+
+
+def _references(value: Any) -> List[Any]:
+    """Foreign keys held by a relationship field, a single one or a list"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
 
 
 class DB(object):
@@ -123,10 +177,23 @@ class DB(object):
         self.model = database_model
         self.model_config = database_model.DatastoreConfig
         self.client = base_client
+        self.write_buffer = (
+            get_buffer(self.client, self.model_config)
+            if self.model_config.write_behind
+            else None
+        )
+        self.entity_cache = (
+            get_cache(self.model_config) if is_cached(self.model_config) else None
+        )
 
     def key(self, **kwargs):
         return self.model_config.key_pattern.format()
 
+    @property
+    def namespace(self) -> Optional[str]:
+        """Namespace of the kind for the current tenant"""
+        return namespace_of(self.model_config)
+
     def _build_query(self, filters: List[tuple] = None, **kwargs):
         """Build query for retrieving entities from database.
         Args:
@@ -143,7 +210,9 @@ class DB(object):
                 kwargs[key] = value.key
             filters.append((key, DatastoreOperators.equals, value))
 
-        query = self.client.query(kind=self.model_config.kind, filters=filters)
+        query = self.client.query(
+            kind=self.model_config.kind, filters=filters, namespace=self.namespace
+        )
         if order:
             query.order = order
         return query
@@ -179,45 +248,256 @@ class DB(object):
         """
         if record is None and not search_args:
             raise ValueError("A `record` or `search_args` are required.")
-        elif record is None and search_args:
-            record = self.get(**search_args)
-        record_data = record.dict() if record else {}
-        record_data.update(data_to_add or {})
-        entity = self._record_to_datastore(record_data).as_entity
-        self.client.put(entity)
-        return self.parse_to_model(entity)
+        with tracer.start_as_current_span(
+            "db.upsert",
+            {"db.system": "datastore", "db.datastore.kind": self.model_config.kind},
+        ), memory_profiler.scope(
+            f"db.upsert {self.model_config.kind}"
+        ):
+            if record is None and search_args:
+                record = self.get(**search_args)
+            record_data = record.dict() if record else {}
+            record_data.update(data_to_add or {})
+            entity = self._record_to_datastore(record_data).as_entity
+            if self.write_buffer:
+                self.write_buffer.enqueue(entity)
+            else:
+                self.client.put(entity)
+            if self.entity_cache is not None:
+                self.entity_cache.set(entity)
+            record = self.parse_to_model(entity)
+            change_bus.publish(
+                self.model_config.kind, Operation.UPSERT, entity.key.id_or_name, record
+            )
+            return record
+
+    def upsert_many(self, records: Sequence[model_type]) -> int:
+        """Write many records in batched commits of at most `MAX_BATCH_SIZE` entities.
+        Args:
+            records (List[DatastoreEntity]): records to write
+        Returns:
+            int: Number of records written
+        """
+        with tracer.start_as_current_span(
+            "db.upsert_many",
+            {
+                "db.system": "datastore",
+                "db.datastore.kind": self.model_config.kind,
+                "db.datastore.entities": len(records),
+            },
+        ), memory_profiler.scope(
+            f"db.upsert_many {self.model_config.kind}"
+        ):
+            entities = offloader.encode_many(records)
+            if self.write_buffer:
+                for entity in entities:
+                    self.write_buffer.enqueue(entity)
+            else:
+                for start in range(0, len(entities), MAX_BATCH_SIZE):
+                    self.client.put_multi(entities[start : start + MAX_BATCH_SIZE])
+            if self.entity_cache is not None:
+                self.entity_cache.set_many(entities)
+            for record, entity in zip(records, entities):
+                change_bus.publish(
+                    self.model_config.kind,
+                    Operation.UPSERT,
+                    entity.key.id_or_name,
+                    record,
+                )
+            return len(entities)
 
     def get(
-        self, key: DatabaseKey = None, *, filters: Filters = None, **kwargs: Any
+        self,
+        key: DatabaseKey = None,
+        *,
+        filters: Filters = None,
+        include: Sequence[str] = None,
+        **kwargs: Any,
     ) -> Optional[DatabaseRecord]:
         """Get a single record from the database.
         Args:
             key (DatastoreKey): Primary Key of Entry
             filters (List[tuple]): List of filters which should be applied in search for entry
+            include (List[str]): Relationships of `foreign_keys` to load along, see `include`
             **kwargs: Any keyword arguments to filter by during the database query
         Returns:
             The record as the provided read_record schema.
         """
         entity = None
-        if key:
-            entity = self.client.get(key)
-        else:
-            query = self._build_query(filters, **kwargs)
-            entities = list(query.fetch(limit=1))
-            if isinstance(entities, list) and len(entities):
-                entity = entities[0]
-        return self.parse_to_model(entity)
-
-    def _parse_entities(self, entities: Iterator) -> Iterator[Type[DatabaseRecord]]:
-        """Try to parse entity to object, yield it if success, otherwise ignore it"""
-
-        for entity in entities:
-            try:
-                yield self.model.parse_obj(entity)
-            except ValidationError:
-                print(
-                    f"{self.model.__class__.__name__} Validation Error"
+        with tracer.start_as_current_span(
+            "db.get",
+            {"db.system": "datastore", "db.datastore.kind": self.model_config.kind},
+        ) as span, memory_profiler.scope(
+            f"db.get {self.model_config.kind}"
+        ):
+            if key:
+                if self.write_buffer:
+                    entity = self.write_buffer.get(key)
+                if entity is None and self.entity_cache is not None:
+                    entity = self.entity_cache.get(key)
+                if entity is None:
+                    entity = self.client.get(key)
+                    if entity is not None and self.entity_cache is not None:
+                        self.entity_cache.set(entity)
+            else:
+                query = self._build_query(filters, **kwargs)
+                if span.is_recording:
+                    span.set_attributes(query_shape(query))
+                started = time.perf_counter()
+                entities = list(query.fetch(limit=1))
+                if isinstance(entities, list) and len(entities):
+                    entity = entities[0]
+                query_profiler.record(
+                    query,
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    fetched=len(entities),
+                    returned=len(entities),
+                    limit=1,
                 )
+            span.set_attribute("db.datastore.result_count", int(entity is not None))
+            record = self.parse_to_model(entity)
+        if record is not None and include:
+            self.include([record], include)
+        return record
+
+    def get_many(self, keys: Sequence[DatabaseKey]) -> List[DatabaseRecord]:
+        """Get many records by key, in batched lookups of at most `MAX_LOOKUP_KEYS`.
+        Args:
+            keys (List[DatastoreKey]): Primary Keys of Entries
+        Returns:
+            The records found, in the order of their keys
+        """
+        with tracer.start_as_current_span(
+            "db.get_many",
+            {
+                "db.system": "datastore",
+                "db.datastore.kind": self.model_config.kind,
+                "db.datastore.keys": len(keys),
+            },
+        ) as span, memory_profiler.scope(
+            f"db.get_many {self.model_config.kind}"
+        ):
+            # By namespace and path, entities may come back with another `Key` class
+            paths = [(key.namespace, key.flat_path) for key in keys]
+            found = {}
+            for key, path in zip(keys, paths):
+                entity = self.write_buffer.get(key) if self.write_buffer else None
+                if entity is None and self.entity_cache is not None:
+                    entity = self.entity_cache.get(key)
+                if entity is not None:
+                    found[path] = entity
+            missing = [key for key, path in zip(keys, paths) if path not in found]
+            for start in range(0, len(missing), MAX_LOOKUP_KEYS):
+                entities = self.client.get_multi(missing[start : start + MAX_LOOKUP_KEYS])
+                if self.entity_cache is not None:
+                    self.entity_cache.set_many(entities)
+                for entity in entities:
+                    found[(entity.key.namespace, entity.key.flat_path)] = entity
+            span.set_attribute("db.datastore.result_count", len(found))
+            return offloader.decode_many(
+                self.model, [found[path] for path in paths if path in found]
+            )
+
+    def list_keys(
+        self, limit: int = None, filters: Filters = None, **kwargs: Any
+    ) -> List[DatabaseKey]:
+        """Keys of the records matching the filters, read with a keys only query.
+        Args:
+            limit (int): Most keys to return
+            filters (List[tuple]): List of filters which should be applied in search for entries
+            **kwargs: Any keyword arguments to filter by during the database query
+        """
+        with tracer.start_as_current_span(
+            "db.list_keys",
+            {"db.system": "datastore", "db.datastore.kind": self.model_config.kind},
+        ) as span, memory_profiler.scope(
+            f"db.list_keys {self.model_config.kind}"
+        ):
+            query = self._build_query(filters, **kwargs)
+            query.keys_only()
+            started = time.perf_counter()
+            keys = [entity.key for entity in query.fetch(limit=limit)]
+            query_profiler.record(
+                query,
+                duration_ms=(time.perf_counter() - started) * 1000,
+                fetched=len(keys),
+                returned=len(keys),
+                limit=limit,
+                keys_only=True,
+            )
+            span.set_attribute("db.datastore.result_count", len(keys))
+        return keys
+
+    def exists(self, key: DatabaseKey) -> bool:
+        """Check whether a record exists without fetching it.
+        Args:
+            key (DatastoreKey): Primary Key of Entry
+        Returns:
+            bool: True if the record exists
+        """
+        return self.exists_many([key])[key]
+
+    def exists_many(self, keys: List[DatabaseKey]) -> Dict[DatabaseKey, bool]:
+        """Check which records exist with keys only queries on `__key__ IN`, one per
+        `MAX_IN_VALUES` keys of a namespace, so no entity body is read from Datastore
+        or deserialized.
+        Args:
+            keys (List[DatastoreKey]): Primary Keys of Entries
+        Returns:
+            dict: Whether each of the keys exists
+        """
+        results = {key: False for key in keys}
+        if self.write_buffer:
+            for key in keys:
+                results[key] = self.write_buffer.get(key) is not None
+
+        with tracer.start_as_current_span(
+            "db.exists_many",
+            {
+                "db.system": "datastore",
+                "db.datastore.kind": self.model_config.kind,
+                "db.datastore.keys": len(keys),
+            },
+        ) as span, memory_profiler.scope(
+            f"db.exists_many {self.model_config.kind}"
+        ):
+            by_namespace: Dict[Optional[str], List[DatabaseKey]] = {}
+            for key, found in results.items():
+                if not found:
+                    by_namespace.setdefault(key.namespace, []).append(key)
+            # By path, entities may come back with another `Key` class
+            paths = {(key.namespace, key.flat_path): key for key in results}
+            for namespace, remaining in by_namespace.items():
+                for start in range(0, len(remaining), MAX_IN_VALUES):
+                    chunk = remaining[start : start + MAX_IN_VALUES]
+                    for found in self._existing_keys(namespace, chunk):
+                        key = paths.get((found.namespace, found.flat_path))
+                        if key is not None:
+                            results[key] = True
+            span.set_attribute("db.datastore.result_count", sum(results.values()))
+        return results
+
+    def _existing_keys(
+        self, namespace: Optional[str], keys: List[DatabaseKey]
+    ) -> List[DatabaseKey]:
+        """Keys of a single `__key__ IN` keys only query which exist"""
+        query = self.client.query(
+            kind=self.model_config.kind,
+            namespace=namespace,
+            filters=[(KEY_PROPERTY, DatastoreOperators.is_in, list(keys))],
+        )
+        query.keys_only()
+        started = time.perf_counter()
+        found = [entity.key for entity in query.fetch(limit=len(keys))]
+        query_profiler.record(
+            query,
+            duration_ms=(time.perf_counter() - started) * 1000,
+            fetched=len(found),
+            returned=len(found),
+            limit=len(keys),
+            keys_only=True,
+        )
+        return found
 
     def list(
         self,
@@ -226,28 +506,191 @@ class DB(object):
         cursor=None,
         limit=100,
         offset=0,
+        include: Sequence[str] = None,
         **kwargs: Any,
     ) -> Union[List[Type[DatabaseRecord]], List[DatabaseKey]]:
         """List all records from the database.
         Args:
             keys_only (bool): if search should include keys only (faster than regular query)
             filters (List[tuple]): List of filters which should be applied in search for entry
+            include (List[str]): Relationships of `foreign_keys` to load along, see `include`
             **kwargs: Any keyword arguments to filter by during the database query
         Returns:
             A list of records as a read_record schema of the model
         """
-        query = self._build_query(filters, **kwargs)
-
-        if keys_only:
-            query.keys_only()
-            return list(query.fetch(start_cursor=cursor, limit=limit, offset=offset))
-        else:
-            query = query.fetch(start_cursor=cursor, limit=limit, offset=offset)
-            entities = list(query)
-            next_cursor = query.next_page_token
-            print(next_cursor)
-            results = list(self._parse_entities(entities))
-            return self.parse_to_model(results)
+        with tracer.start_as_current_span(
+            "db.list",
+            {
+                "db.system": "datastore",
+                "db.datastore.keys_only": keys_only,
+                "db.datastore.limit": limit,
+                "db.datastore.offset": offset,
+            },
+        ) as span, memory_profiler.scope(
+            f"db.list {self.model_config.kind}"
+        ):
+            query = self._build_query(filters, **kwargs)
+            if span.is_recording:
+                span.set_attributes(query_shape(query))
+
+            started = time.perf_counter()
+            if keys_only:
+                query.keys_only()
+                keys = list(query.fetch(start_cursor=cursor, limit=limit, offset=offset))
+                query_profiler.record(
+                    query,
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    fetched=len(keys),
+                    returned=len(keys),
+                    limit=limit,
+                    offset=offset,
+                    keys_only=True,
+                    cursor=cursor,
+                )
+                span.set_attribute("db.datastore.result_count", len(keys))
+                return keys
+            else:
+                # Parsed a chunk at a time as the results stream in, rather than
+                # holding every raw entity until all are parsed
+                entities = iter(query.fetch(start_cursor=cursor, limit=limit, offset=offset))
+                records, fetched = [], 0
+                while chunk := list(islice(entities, MAX_PARSE_CHUNK)):
+                    fetched += len(chunk)
+                    records += offloader.decode_many(self.model, chunk)
+                query_profiler.record(
+                    query,
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    fetched=fetched,
+                    returned=len(records),
+                    limit=limit,
+                    offset=offset,
+                    cursor=cursor,
+                )
+                span.set_attributes(
+                    {
+                        "db.datastore.fetched_count": fetched,
+                        "db.datastore.result_count": len(records),
+                    }
+                )
+        return self.include(records, include) if include else records
+
+    def include(
+        self, records: List[model_type], relationships: Sequence[str]
+    ) -> List[model_type]:
+        """Load the entities the `foreign_keys` relationships of `records` refer to and
+        replace the foreign keys with them. Every referred key across the records is
+        fetched by the same batched lookup, rather than one lookup per record.
+        Args:
+            records (List[DatastoreEntity]): Records of this model, updated in place
+            relationships (List[str]): Fields of `foreign_keys` to load
+        Returns:
+            The records. References to missing entities are dropped.
+        """
+        foreign_keys = self.model_config.foreign_keys
+        unknown = [name for name in relationships if name not in foreign_keys]
+        if unknown:
+            raise DatabaseError(
+                f"{self.model.__name__} has no relationships {', '.join(unknown)}"
+            )
+        if not records:
+            return records
+
+        with tracer.start_as_current_span(
+            "db.include",
+            {
+                "db.system": "datastore",
+                "db.datastore.kind": self.model_config.kind,
+                "db.datastore.include": list(relationships),
+            },
+        ) as span, memory_profiler.scope(
+            f"db.include {self.model_config.kind}"
+        ):
+            # Unique keys in order of first reference
+            keys = {}
+            for name in relationships:
+                model = foreign_keys[name]
+                for record in records:
+                    for reference in _references(getattr(record, name)):
+                        keys[model.reference_key(reference)] = model
+            keys = list(keys.items())
+
+            loaded = {}
+            for start in range(0, len(keys), MAX_LOOKUP_KEYS):
+                batch = dict(keys[start : start + MAX_LOOKUP_KEYS])
+                for entity in self.client.get_multi(list(batch)):
+                    loaded[entity.key] = entity
+            # Parsed once, however many records refer to them
+            loaded = {
+                key: model.from_entity(loaded[key])
+                for key, model in keys
+                if key in loaded
+            }
+            span.set_attributes(
+                {
+                    "db.datastore.keys": len(keys),
+                    "db.datastore.result_count": len(loaded),
+                }
+            )
+
+            for name in relationships:
+                model = foreign_keys[name]
+                for record in records:
+                    value = getattr(record, name)
+                    if isinstance(value, list):
+                        value = [
+                            loaded[key]
+                            for key in map(model.reference_key, value)
+                            if key in loaded
+                        ]
+                    elif value is not None:
+                        value = loaded.get(model.reference_key(value))
+                    setattr(record, name, value)
+        return records
+
+    def scan(
+        self,
+        shards: int = 8,
+        workers: int = 8,
+        batch_size: int = 500,
+        transform: Callable[[model_type], Any] = None,
+        processes: int = None,
+    ) -> Iterator[Any]:
+        """Stream every record of the kind, fetching key range shards concurrently.
+        Meant for reindex and migration jobs, see `datastore.scan`.
+        Args:
+            shards (int): Number of key ranges the kind is split into
+            workers (int): Number of shards fetched at the same time
+            batch_size (int): Entities fetched per query page
+            transform (Callable): Applied to every record, yielded instead of it
+            processes (int): Parse and transform pages on a pool of this many processes,
+                `transform` must then be picklable, i.e. a module level function
+        Returns:
+            Iterator: Records or transformed records, in no particular order
+        """
+        scan = ParallelScan(
+            self.client,
+            self.model_config.kind,
+            shards=shards,
+            workers=workers,
+            batch_size=batch_size,
+            namespace=self.namespace,
+        )
+        if not processes:
+            for batch in scan.batches():
+                yield from offloader.decode_many(self.model, batch, transform)
+            return
+
+        # Spawned rather than forked, forking while the scan threads hold locks is unsafe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+            # Bounded so a slow transform applies backpressure to the fetching
+            pending = deque()
+            for batch in scan.batches():
+                pending.append(pool.submit(parse_batch, self.model, batch, transform))
+                if len(pending) >= processes * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
 
     def delete(self, record: Union[DatabaseRecord, DatabaseKey]) -> bool:
         """Delete a record from the database.
@@ -255,7 +698,18 @@ class DB(object):
             record: The record data as a read_record schema of the model
         """
         key = getattr(record, "key", record)
-        self.client.delete(key)
+        with tracer.start_as_current_span(
+            "db.delete",
+            {"db.system": "datastore", "db.datastore.kind": self.model_config.kind},
+        ), memory_profiler.scope(
+            f"db.delete {self.model_config.kind}"
+        ):
+            if self.write_buffer:
+                self.write_buffer.discard(key)
+            self.client.delete(key)
+            if self.entity_cache is not None:
+                self.entity_cache.discard(key)
+        change_bus.publish(self.model_config.kind, Operation.DELETE, key.id_or_name)
         return True
 
     @overload
@@ -277,10 +731,18 @@ class DB(object):
     def parse_to_model(self, data):
         if not data:
             return data
+        with tracer.start_as_current_span(
+            "db.parse_to_model", {"db.datastore.kind": self.model_config.kind}
+        ):
+            return self._parse_to_model(data)
+
+    def _parse_to_model(self, data):
         if isinstance(data, (list, Iterator)):
             return parse_obj_as(List[self.model], list(data))
         if isinstance(data, set):
             return parse_obj_as(Set[self.model], data)
         if isinstance(data, tuple):
             return parse_obj_as(Tuple[self.model], data)
+        if isinstance(data, dict):
+            return self.model.from_entity(data)
         return parse_obj_as(self.model, data)
\ No newline at end of file
@@ -1,15 +1,19 @@
 import base64
+import re
 from binascii import Error
 from datetime import datetime
 from functools import partial
+from string import Formatter
 from typing import (
     IO,
     Any,
     Callable,
+    Dict,
     List,
     Literal,
     Optional,
     Protocol,
+    Type,
     Union,
     overload,
     runtime_checkable,
@@ -20,10 +24,12 @@ import orjson
 from orjson import orjson
 
 # Installed Packages
+from google.cloud.datastore import Entity
 from pydantic import BaseModel
 
 from config import config
 from datastore.key import DatastoreKey
+from datastore.namespace import namespace_of
 
 orjson_options = (
     # Serialize datetime.datetime objects without a tzinfo as UTC. This has no effect on
@@ -101,9 +107,23 @@ class DatastoreEntity(BaseModel):
         required_field_defaults: dict = {}
         excluded_indexes: List[str] = ()
         embedded_entity_fields: List[str] = []
-        foreign_keys: List[str] = []
+        # Relationships, the model referred to by each field holding foreign keys.
+        # Foreign keys are the values of the referred model's key pattern field,
+        # see `DB.get` and `DB.list` to load the referred entities with `include`
+        foreign_keys: Dict[str, Type["DatastoreEntity"]] = {}
+        # Namespace used when no tenant is set, see `datastore.namespace`
         namespace: str = config.NAMESPACE
+        # Stored in the namespace of the current tenant, disable for kinds shared
+        # by every tenant
+        multi_tenant: bool = True
         project: str = config.PROJECT_ID
+        # Buffer upserts and flush them in batches, see `datastore.writebehind`
+        write_behind: bool = False
+        write_behind_window: float = 0.1
+        write_behind_max_batch: int = 500
+        # Serve key lookups from a per process cache, see `datastore.entitycache`
+        cache: bool = False
+        cache_ttl: float = config.ENTITY_CACHE_TTL
 
     class Mapping:
         pass
@@ -117,23 +137,58 @@ class DatastoreEntity(BaseModel):
     def key(self):
         if self._key:
             return self._key
-        object_data = self.dict(exclude_none=True)
-        return self.make_key(**object_data)
+        # Only the fields of the key pattern, a full `dict()` copies every child
+        values = self.__dict__
+        return self.make_key(
+            **{
+                name: values[name]
+                for name in _metadata(type(self)).key_fields
+                if values.get(name) is not None
+            }
+        )
 
     @classmethod
     def make_key(cls, key_name: Optional[str] = None, **kwargs) -> DatastoreKey:
         if not key_name:
             key_name = cls.DatastoreConfig.key_pattern.format(**kwargs)
 
-        return DatastoreKey(
-            {
-                "name": key_name,
-                "kind": cls.DatastoreConfig.kind,
-                "namespace": cls.DatastoreConfig.namespace,
-                "project": cls.DatastoreConfig.project,
-            }
+        return DatastoreKey.from_path(
+            cls.DatastoreConfig.kind,
+            key_name,
+            namespace=namespace_of(cls.DatastoreConfig),
+            project=cls.DatastoreConfig.project,
         )
 
+    @classmethod
+    def _key_field(cls) -> str:
+        fields = _metadata(cls).key_fields
+        if len(fields) != 1:
+            raise TypeError(
+                f"{cls.__name__} can only be referred to by a single field key pattern"
+            )
+        return fields[0]
+
+    @classmethod
+    def reference_key(cls, reference: Any) -> DatastoreKey:
+        """Key of the entity a foreign key refers to.
+        Args:
+            reference: Foreign key value, key or entity of this model
+        Returns:
+            DatastoreKey: Key of the referred entity
+        """
+        if isinstance(reference, DatastoreEntity):
+            return reference.key
+        if isinstance(reference, DatastoreKey):
+            return reference
+        return cls.make_key(**{cls._key_field(): reference})
+
+    @classmethod
+    def reference_of(cls, record: Any) -> Any:
+        """Foreign key value referring to `record`, returned as is if not an entity"""
+        if isinstance(record, DatastoreEntity):
+            return getattr(record, cls._key_field())
+        return record
+
     def dict(
         self,
         *,
@@ -172,29 +227,16 @@ class DatastoreEntity(BaseModel):
         )
 
     @property
-    def as_entity(self):
-        # Installed Packages
-        from google.cloud.datastore import Entity
-
-        ds_config = self.DatastoreConfig
-        exclude_from_indexes = tuple(ds_config.excluded_indexes) + tuple(
-            ds_config.compressed_fields
-        )
-        entity = Entity(key=self.key, exclude_from_indexes=exclude_from_indexes)
-        data = self.compressed_dict()
-
-        def map_child_property(child: Union[list, object], property_name: str):
-            for field_name in child or []:
-                field = getattr(self, field_name)
-                if isinstance(field, list):
-                    data[field_name] = [getattr(item, property_name) for item in field]
-                elif field:
-                    data[field_name] = getattr(field, property_name)
-
-        map_child_property(ds_config.embedded_entity_fields, "as_entity")
+    def as_entity(self) -> Entity:
+        return _encode(self, self.key)
 
-        entity.update(**data)
-        return entity
+    @classmethod
+    def from_entity(cls, entity: dict) -> "DatastoreEntity":
+        """Parse an entity read from Datastore, the inverse of `as_entity`.
+        Embedded entities and compressed fields are decoded to plain values first,
+        so the whole tree is validated once.
+        """
+        return cls.parse_obj(_decode(cls, entity))
 
     def compressed_dict(self, **kwargs):
         results = self.dict(**kwargs)
@@ -221,4 +263,131 @@ class DatastoreEntity(BaseModel):
                     data[field] = full_decompress(current_value, field)
                 except (OSError, TypeError, Error, error):
                     pass
-        return data
\ No newline at end of file
+        return data
+
+
+class _ModelMetadata:
+    """Facts about a model derived once from its fields and `DatastoreConfig`"""
+
+    __slots__ = ("key_fields", "exclude_from_indexes", "embedded", "compressed", "foreign_keys")
+
+    def __init__(self, model: Type[DatastoreEntity]):
+        ds_config = model.DatastoreConfig
+        key_pattern = getattr(ds_config, "key_pattern", "")
+        self.key_fields = tuple(
+            dict.fromkeys(
+                re.split(r"[.\[]", name)[0]
+                for _, name, _, _ in Formatter().parse(key_pattern)
+                if name
+            )
+        )
+        self.exclude_from_indexes = tuple(ds_config.excluded_indexes) + tuple(
+            ds_config.compressed_fields
+        )
+        # Model of the entities embedded in each field, None when not an entity
+        self.embedded: Dict[str, Optional[Type[DatastoreEntity]]] = {}
+        for name in ds_config.embedded_entity_fields or ():
+            field = model.__fields__.get(name)
+            child = field.type_ if field is not None else None
+            is_entity = isinstance(child, type) and issubclass(child, DatastoreEntity)
+            self.embedded[name] = child if is_entity else None
+        self.compressed = frozenset(ds_config.compressed_fields)
+        self.foreign_keys = dict(ds_config.foreign_keys)
+
+
+_metadata_by_model: Dict[type, _ModelMetadata] = {}
+
+
+def _metadata(model: Type[DatastoreEntity]) -> _ModelMetadata:
+    metadata = _metadata_by_model.get(model)
+    if metadata is None:
+        metadata = _metadata_by_model[model] = _ModelMetadata(model)
+    return metadata
+
+
+# Values `_plain` returns as is, checked first as they are the most common
+_SCALAR_TYPES = frozenset((str, int, float, bool, bytes, datetime, type(None)))
+
+
+def _plain(value: Any) -> Any:
+    """`value` with models replaced by their `dict()`, as `BaseModel.dict` does"""
+    if type(value) in _SCALAR_TYPES:
+        return value
+    if isinstance(value, BaseModel):
+        return value.dict()
+    if isinstance(value, (list, tuple, set)):
+        return type(value)(_plain(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+
+def _encode(
+    record: DatastoreEntity,
+    key: Optional[DatastoreKey],
+    compressed: Optional[Dict[str, bytes]] = None,
+) -> Entity:
+    """Entity of `record` and of its embedded entities, in a single pass over the
+    field values. Embedded entities are stored without key. `compressed` holds the
+    compressed field values when already computed, see `datastore.offload`.
+    """
+    metadata = _metadata(type(record))
+    entity = Entity(key=key, exclude_from_indexes=metadata.exclude_from_indexes)
+    data = {}
+    for name, value in record.__dict__.items():
+        if value is None:
+            data[name] = None
+        elif name in metadata.embedded:
+            if isinstance(value, list):
+                data[name] = [_encode_child(item) for item in value]
+            else:
+                data[name] = _encode_child(value)
+        elif name in metadata.foreign_keys:
+            # Included entities are stored as the foreign keys referring to them
+            model = metadata.foreign_keys[name]
+            if isinstance(value, list):
+                data[name] = [model.reference_of(item) for item in value]
+            else:
+                data[name] = model.reference_of(value)
+        elif name in metadata.compressed:
+            if compressed is not None:
+                data[name] = compressed[name]
+            else:
+                data[name] = compress(
+                    orjson.dumps(_plain(value), default=encoder, option=orjson_options)
+                )
+        else:
+            data[name] = _plain(value)
+    entity.update(data)
+    return entity
+
+
+def _encode_child(value: Any) -> Any:
+    if isinstance(value, DatastoreEntity):
+        return _encode(value, None)
+    return _plain(value)
+
+
+def _decode(model: Type[DatastoreEntity], entity: dict) -> dict:
+    """Plain values of an entity and of its embedded entities, compressed fields
+    decompressed, ready to be validated by `model`.
+    """
+    metadata = _metadata(model)
+    data = dict(entity)
+    for name, child in metadata.embedded.items():
+        value = data.get(name)
+        if child is None or value is None:
+            continue
+        if isinstance(value, list):
+            data[name] = [_decode(child, item) for item in value]
+        elif isinstance(value, dict):
+            data[name] = _decode(child, value)
+    for name in metadata.compressed:
+        value = data.get(name)
+        if isinstance(value, bytes):
+            try:
+                data[name] = orjson.loads(decompress(value))
+            except (error, orjson.JSONDecodeError):
+                # Base64 encoded, decoded by `decompress_values`
+                pass
+    return data
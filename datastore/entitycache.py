@@ -0,0 +1,127 @@
+"""
+Read-through cache of entities by key, for kinds with `DatastoreConfig.cache` enabled
+while `ENTITY_CACHE_ENABLED` is set.
+
+`DB` serves key lookups of cached kinds from the process wide `EntityCache` of their kind
+and writes through it, so upserts and deletes of the process are seen at once. Changes
+made by other instances are seen once the cached entity is older than `cache_ttl`.
+
+Caches are warmed on startup, see `core.Warmup`, from the keys `hot_keys` returned by
+the previous process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from google.cloud.datastore import Entity
+
+from config import config
+
+
+def _cache_key(key) -> Tuple:
+    return (key.namespace, key.flat_path)
+
+
+class EntityCache:
+    """Thread safe LRU store of the entities of a kind, expiring after `ttl` seconds"""
+
+    def __init__(self, kind: str, maxsize: int = None, ttl: float = None):
+        self.kind = kind
+        self.maxsize = maxsize or config.ENTITY_CACHE_SIZE
+        self.ttl = config.ENTITY_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Entity]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key) -> Optional[Entity]:
+        cache_key = _cache_key(key)
+        with self._lock:
+            cached = self._entries.get(cache_key)
+            if cached is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - cached[0] >= self.ttl:
+                del self._entries[cache_key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return cached[1]
+
+    def set_many(self, entities: Iterable[Entity]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for entity in entities:
+                cache_key = _cache_key(entity.key)
+                self._entries[cache_key] = (now, entity)
+                self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set(self, entity: Entity) -> None:
+        self.set_many([entity])
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._entries.pop(_cache_key(key), None)
+
+    def hot_keys(self, limit: int = None) -> List:
+        """Keys of the most recently used entities, most recent first"""
+        with self._lock:
+            entries = list(reversed(self._entries.values()))
+        return [entity.key for _, entity in entries[:limit]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+        }
+
+
+_caches: Dict[str, EntityCache] = {}
+_caches_lock = threading.Lock()
+
+
+def is_cached(ds_config) -> bool:
+    """Whether key lookups of a kind go through its entity cache"""
+    return config.ENTITY_CACHE_ENABLED and ds_config.cache
+
+
+def get_cache(ds_config) -> EntityCache:
+    """Shared entity cache of a kind, created on first use"""
+    cache = _caches.get(ds_config.kind)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(
+                ds_config.kind,
+                EntityCache(ds_config.kind, ttl=ds_config.cache_ttl),
+            )
+    return cache
+
+
+def caches() -> List[EntityCache]:
+    return list(_caches.values())
+
+
+def clear_all() -> None:
+    for cache in caches():
+        cache.clear()
+
+
+def metrics() -> List[dict]:
+    return [cache.metrics() for cache in caches()]
@@ -0,0 +1,283 @@
+"""
+Columnar export of entity kinds, for analytics.
+
+Records are converted to Arrow record batches of `batch_size` rows whose schema is derived
+from the fields of the model, see `arrow_schema`, and written as Parquet or as an Arrow
+IPC stream, to a file with `write` or as chunks of bytes with `stream`. Only one batch
+is held at a time, memory stays bounded whatever the size of the kind.
+
+Records are read by `DB.scan`, so compressed fields come decoded and foreign keys are
+exported as the ids they hold. `DatastoreConfig.private_fields` are never exported.
+
+Requires `pyarrow`, an optional dependency.
+"""
+import datetime
+from typing import IO, Any, Callable, Iterable, Iterator, List, Tuple, Type, Union
+
+import orjson
+from pydantic import BaseModel
+from pydantic.fields import (
+    SHAPE_DEQUE,
+    SHAPE_FROZENSET,
+    SHAPE_LIST,
+    SHAPE_SEQUENCE,
+    SHAPE_SET,
+    SHAPE_SINGLETON,
+    SHAPE_TUPLE_ELLIPSIS,
+    ModelField,
+)
+
+from config import config
+from datastore.entity import DatastoreEntity, _metadata, _plain
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET = "parquet"
+ARROW = "arrow"
+MEDIA_TYPES = {
+    PARQUET: "application/vnd.apache.parquet",
+    ARROW: "application/vnd.apache.arrow.stream",
+}
+# Field shapes exported as Arrow lists, mappings and fixed tuples are exported as JSON
+SEQUENCE_SHAPES = {
+    SHAPE_LIST,
+    SHAPE_SET,
+    SHAPE_FROZENSET,
+    SHAPE_SEQUENCE,
+    SHAPE_TUPLE_ELLIPSIS,
+    SHAPE_DEQUE,
+}
+
+
+class ExportError(Exception):
+    """Export Error default Class"""
+
+
+def is_available() -> bool:
+    return pa is not None
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ExportError("Columnar exports require the pyarrow package")
+
+
+def _value_type(annotation: Any) -> "pa.DataType":
+    """Arrow type of a plain annotation, JSON encoded strings for anything else"""
+    if isinstance(annotation, type):
+        # bool subclasses int, datetime subclasses date
+        if issubclass(annotation, bool):
+            return pa.bool_()
+        if issubclass(annotation, int):
+            return pa.int64()
+        if issubclass(annotation, float):
+            return pa.float64()
+        if issubclass(annotation, str):
+            return pa.string()
+        if issubclass(annotation, bytes):
+            return pa.binary()
+        if issubclass(annotation, datetime.datetime):
+            return pa.timestamp("us", tz="UTC")
+        if issubclass(annotation, datetime.date):
+            return pa.date32()
+        if issubclass(annotation, BaseModel):
+            return pa.struct(_fields(annotation))
+    return pa.string()
+
+
+def _field_type(field: ModelField) -> "pa.DataType":
+    if field.shape == SHAPE_SINGLETON:
+        if field.sub_fields:
+            # Unions, exported as their single Arrow type or as JSON
+            types = {_field_type(sub_field) for sub_field in field.sub_fields}
+            return types.pop() if len(types) == 1 else pa.string()
+        return _value_type(field.type_)
+    if field.shape in SEQUENCE_SHAPES and field.sub_fields:
+        return pa.list_(_field_type(field.sub_fields[0]))
+    return pa.string()
+
+
+def _reference_type(model: Type[DatastoreEntity], field: ModelField) -> "pa.DataType":
+    """Arrow type of a field holding foreign keys to `model`"""
+    key_type = _field_type(model.__fields__[model._key_field()])
+    return key_type if field.shape == SHAPE_SINGLETON else pa.list_(key_type)
+
+
+def _exported(model: Type[BaseModel]) -> List[ModelField]:
+    ds_config = getattr(model, "DatastoreConfig", None)
+    private = set(getattr(ds_config, "private_fields", ()) or ())
+    return [field for name, field in model.__fields__.items() if name not in private]
+
+
+def _fields(model: Type[BaseModel]) -> List["pa.Field"]:
+    foreign_keys = (
+        _metadata(model).foreign_keys if issubclass(model, DatastoreEntity) else {}
+    )
+    return [
+        pa.field(
+            field.name,
+            _reference_type(foreign_keys[field.name], field)
+            if field.name in foreign_keys
+            else _field_type(field),
+            nullable=not field.required or field.allow_none,
+        )
+        for field in _exported(model)
+    ]
+
+
+def arrow_schema(model: Type[DatastoreEntity]) -> "pa.Schema":
+    """Arrow schema of the exported fields of a model"""
+    _require_pyarrow()
+    return pa.schema(
+        _fields(model), metadata={"kind": model.DatastoreConfig.kind}
+    )
+
+
+def _json(value: Any) -> Any:
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(_plain(value), default=str).decode()
+
+
+def _converters(
+    model: Type[DatastoreEntity], schema: "pa.Schema"
+) -> List[Tuple[str, Callable[[Any], Any]]]:
+    """Conversion of each field value to the value of its column"""
+    foreign_keys = _metadata(model).foreign_keys
+    converters = []
+    for field in schema:
+        if field.name in foreign_keys:
+            reference_of = foreign_keys[field.name].reference_of
+            if pa.types.is_list(field.type):
+                convert = lambda value, reference_of=reference_of: (
+                    None if value is None else [reference_of(item) for item in value]
+                )
+            else:
+                convert = reference_of
+        elif pa.types.is_string(field.type):
+            convert = _json
+        elif pa.types.is_struct(field.type) or pa.types.is_list(field.type):
+            convert = _plain
+        else:
+            convert = None
+        converters.append((field.name, convert))
+    return converters
+
+
+def record_batches(
+    model: Type[DatastoreEntity],
+    records: Iterable[DatastoreEntity],
+    batch_size: int = None,
+) -> Iterator["pa.RecordBatch"]:
+    """Arrow record batches of `batch_size` records"""
+    schema = arrow_schema(model)
+    converters = _converters(model, schema)
+    batch_size = batch_size or config.EXPORT_BATCH_SIZE
+
+    def to_batch(rows: List[DatastoreEntity]) -> "pa.RecordBatch":
+        columns = []
+        for name, convert in converters:
+            values = [row.__dict__.get(name) for row in rows]
+            if convert is not None:
+                values = [convert(value) for value in values]
+            columns.append(values)
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+    rows = []
+    for record in records:
+        rows.append(record)
+        if len(rows) >= batch_size:
+            yield to_batch(rows)
+            rows = []
+    if rows:
+        yield to_batch(rows)
+
+
+def _writer(sink: Union[str, IO], schema: "pa.Schema", format: str):
+    compression = config.EXPORT_COMPRESSION or None
+    if format == PARQUET:
+        return pq.ParquetWriter(sink, schema, compression=compression or "none")
+    if format == ARROW:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        return pa.ipc.new_stream(sink, schema, options=options)
+    raise ExportError(f"Unknown export format '{format}'")
+
+
+def write(
+    model: Type[DatastoreEntity],
+    records: Iterable[DatastoreEntity],
+    sink: Union[str, IO],
+    format: str = PARQUET,
+    batch_size: int = None,
+) -> int:
+    """Write records to a file.
+    Args:
+        model: Model of the records
+        records: Records to export, e.g. `DB.scan()`
+        sink: Path or binary file object
+        format (str): `PARQUET` or `ARROW` (IPC stream)
+        batch_size (int): Records per record batch, and Parquet row group
+    Returns:
+        int: Number of records written
+    """
+    _require_pyarrow()
+    rows = 0
+    with _writer(sink, arrow_schema(model), format) as writer:
+        for batch in record_batches(model, records, batch_size):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+class _ChunkSink:
+    """Write-only file object whose written bytes are taken out after every batch"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def stream(
+    model: Type[DatastoreEntity],
+    records: Iterable[DatastoreEntity],
+    format: str = PARQUET,
+    batch_size: int = None,
+) -> Iterator[bytes]:
+    """Export records as chunks of bytes, one per record batch, e.g. for a response.
+    See `write` for the arguments."""
+    _require_pyarrow()
+    sink = _ChunkSink()
+    writer = _writer(pa.PythonFile(sink, mode="w"), arrow_schema(model), format)
+    try:
+        for batch in record_batches(model, records, batch_size):
+            writer.write_batch(batch)
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
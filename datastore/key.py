@@ -1,64 +1,360 @@
-from typing import Any, Type, Union, Optional
+import base64
+from typing import Any, Dict, Optional, Tuple, Type, Union
+
+import orjson
 
 # Installed Packages
 from pydantic import BaseModel
 from google.cloud.datastore import Key
+from google.cloud.datastore_v1.types import entity as entity_pb2
 
 from config import config
 
+# Complete keys by serialized form, so parsing the same key string again returns the
+# same instance. Cleared once full, which is cheaper than tracking recency or weak refs.
+_interned: Dict[Tuple[type, str], "DatastoreKey"] = {}
+INTERN_CACHE_SIZE = 65536
+# `DatastoreKey[kind]` subclasses by kind
+_kind_classes: Dict[Tuple[type, str], type] = {}
+# Raw protobuf class behind the proto-plus `Key` message
+_KeyPb = entity_pb2.Key.pb()
+
+
+def _serialize(
+    project: str, namespace: Optional[str], database: Optional[str], flat_path: Tuple
+) -> str:
+    payload = orjson.dumps((project, namespace, database, *flat_path))
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode("ascii")
 
-class DatastoreKey(str, Key):
+
+class DatastoreKey(Key):
     """
-    Google Datastore Key as a string.
+    Google Datastore Key built without going through `Key.__init__`.
+    Stores the flat path, project, namespace and database, and computes the path
+    dictionaries of `Key` on demand. The hash is computed once, equal keys
+    hash like `google.cloud.datastore.Key`, and `str(key)` is a cached url-safe
+    serialization which round-trips through `DatastoreKey.from_urlsafe`, so keys can
+    be used in URLs, caches and DataLoader lookups. Parsed key strings are interned.
     """
 
+    # `Key` has no `__slots__`, so instances still carry an (empty) `__dict__`
+    __slots__ = (
+        "_flat_path",
+        "_project",
+        "_namespace",
+        "_database",
+        "_parent",
+        "_hash",
+        "_urlsafe",
+    )
+
     _kind: str = ""
-    _project: str = config.PROJECT_ID
-    _parent: Optional[Any] = None
-    _namespace: Optional[str] = config.NAMESPACE
-
-    def __init__(self, value: Union[Key, dict, Type[BaseModel]]):
-        _config = config
-        if getattr(self, "DatastoreConfig", None):
-            self = value.key
-        elif isinstance(value, Key):
-            self._kind = value.kind
-            self._name = value.id_or_name
-            self._parent = value.parent
-            self._project = value.project
-            self._namespace = value.namespace
-        elif isinstance(value, dict):
-            self._kind = value.get("kind", self._kind)
-            self._name = value.get("id") or value.get("name")
-            self._parent = value.get("parent")
-            self._project = value.get("project", self._project)
-            self._namespace = value.get("namespace", self._namespace)
-
-        super().__init__(
-            self._kind,
-            self._name,
-            parent=self._parent,
-            namespace=self._namespace,
-            project=self._project,
+    default_project: str = config.PROJECT_ID
+    default_namespace: Optional[str] = config.NAMESPACE
+
+    def __new__(
+        cls,
+        *args: Any,
+        project: str = None,
+        namespace: str = None,
+        database: str = None,
+        parent: Key = None,
+    ):
+        if len(args) != 1 or project or namespace or database or parent:
+            return cls.from_path(
+                *args,
+                project=project,
+                namespace=namespace,
+                database=database,
+                parent=parent,
+            )
+
+        value = args[0]
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, Key):
+            return cls._make(
+                value.flat_path, value.project, value.namespace, value.database
+            )
+        if isinstance(value, dict):
+            id_or_name = value.get("id") or value.get("name")
+            path = (value.get("kind", cls._kind),)
+            if id_or_name is not None:
+                path += (id_or_name,)
+            return cls.from_path(
+                *path,
+                parent=value.get("parent"),
+                project=value.get("project", cls.default_project),
+                namespace=value.get("namespace", cls.default_namespace),
+            )
+        if isinstance(value, str):
+            return cls.from_urlsafe(value)
+        if getattr(value, "DatastoreConfig", None):
+            return cls(value.key)
+        raise TypeError("dict, Datastore Key or serialized key required")
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """All state is set up by `__new__`"""
+
+    @classmethod
+    def from_path(
+        cls,
+        *path: Union[str, int],
+        project: str = None,
+        namespace: str = None,
+        database: str = None,
+        parent: Key = None,
+    ) -> "DatastoreKey":
+        """Build a key from alternating kinds and ids/names, like `Key(*path)`"""
+        if parent is not None:
+            path = parent.flat_path + path
+            project = project or parent.project
+            namespace = namespace or parent.namespace
+            database = database or parent.database
+        return cls._make(
+            path,
+            project or cls.default_project,
+            namespace if namespace is not None else cls.default_namespace,
+            database,
+        )
+
+    @classmethod
+    def _make(
+        cls,
+        flat_path: Tuple,
+        project: str,
+        namespace: Optional[str],
+        database: Optional[str],
+    ) -> "DatastoreKey":
+        if not flat_path:
+            raise ValueError("Key path must not be empty.")
+        if not project:
+            raise ValueError("A Key must have a project set.")
+        for kind in flat_path[::2]:
+            if not isinstance(kind, str):
+                raise ValueError(f"Kind was not a string: {kind!r}")
+        for id_or_name in flat_path[1::2]:
+            if not isinstance(id_or_name, (str, int)):
+                raise ValueError(f"ID/name was not a string or integer: {id_or_name!r}")
+
+        key = object.__new__(cls)
+        key._flat_path = flat_path
+        key._project = project
+        key._namespace = namespace
+        key._database = database
+        key._parent = None
+        key._urlsafe = None
+        # Same formula as `Key.__hash__`
+        key._hash = hash(flat_path) + hash(project) + hash(namespace)
+        if database:
+            key._hash += hash(database)
+        return key
+
+    @classmethod
+    def from_urlsafe(cls, urlsafe: str) -> "DatastoreKey":
+        """Parse the serialized form produced by `DatastoreKey.urlsafe`"""
+        key = _interned.get((cls, urlsafe))
+        if key is not None:
+            return key
+        try:
+            padding = "=" * (-len(urlsafe) % 4)
+            project, namespace, database, *path = orjson.loads(
+                base64.urlsafe_b64decode(urlsafe + padding)
+            )
+        except (ValueError, TypeError) as error:
+            raise ValueError(f"Invalid serialized key {urlsafe!r}") from error
+        key = cls._make(tuple(path), project, namespace, database)
+        if not key.is_partial:
+            key._urlsafe = urlsafe
+            if len(_interned) >= INTERN_CACHE_SIZE:
+                _interned.clear()
+            _interned[(cls, urlsafe)] = key
+        return key
+
+    @classmethod
+    def from_protobuf(cls, pb) -> "DatastoreKey":
+        """Build a key from a `Key` protobuf, without going through `google.cloud.datastore.Key`"""
+        pb = getattr(pb, "_pb", pb)
+        path = []
+        for element in pb.path:
+            path.append(element.kind)
+            if element.id:
+                path.append(element.id)
+            elif element.name:
+                path.append(element.name)
+        partition = pb.partition_id
+        return cls._make(
+            tuple(path),
+            partition.project_id,
+            partition.namespace_id or None,
+            partition.database_id or None,
+        )
+
+    def to_protobuf(self) -> entity_pb2.Key:
+        # Filling the raw protobuf and wrapping it once is an order of magnitude
+        # faster than going through the proto-plus message fields
+        key = _KeyPb()
+        partition = key.partition_id
+        partition.project_id = self._project
+        if self._database:
+            partition.database_id = self._database
+        if self._namespace:
+            partition.namespace_id = self._namespace
+
+        flat_path = self._flat_path
+        for position in range(0, len(flat_path), 2):
+            element = key.path.add()
+            element.kind = flat_path[position]
+            if position + 1 < len(flat_path):
+                id_or_name = flat_path[position + 1]
+                if isinstance(id_or_name, int):
+                    element.id = id_or_name
+                else:
+                    element.name = id_or_name
+        return entity_pb2.Key.wrap(key)
+
+    @property
+    def urlsafe(self) -> str:
+        if self._urlsafe is None:
+            self._urlsafe = _serialize(
+                self._project, self._namespace, self._database, self._flat_path
+            )
+        return self._urlsafe
+
+    def __str__(self) -> str:
+        return self.urlsafe
+
+    def __json__(self) -> str:
+        return self.urlsafe
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if self is other:
+            return not self.is_partial
+        if isinstance(other, DatastoreKey):
+            return (
+                self._hash == other._hash
+                and self._flat_path == other._flat_path
+                and self._project == other._project
+                and self._namespace == other._namespace
+                and self._database == other._database
+                and not self.is_partial
+            )
+        return Key.__eq__(self, other)
+
+    def __ne__(self, other) -> bool:
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    @property
+    def flat_path(self) -> Tuple:
+        return self._flat_path
+
+    @property
+    def path(self) -> list:
+        flat_path = self._flat_path
+        path = []
+        for position in range(0, len(flat_path), 2):
+            element = {"kind": flat_path[position]}
+            if position + 1 < len(flat_path):
+                id_or_name = flat_path[position + 1]
+                element["id" if isinstance(id_or_name, int) else "name"] = id_or_name
+            path.append(element)
+        return path
+
+    @property
+    def project(self) -> str:
+        return self._project
+
+    @property
+    def namespace(self) -> Optional[str]:
+        return self._namespace
+
+    @property
+    def database(self) -> Optional[str]:
+        return self._database
+
+    @property
+    def is_partial(self) -> bool:
+        return len(self._flat_path) % 2 == 1
+
+    @property
+    def kind(self) -> str:
+        return self._flat_path[-1 if self.is_partial else -2]
+
+    @property
+    def id_or_name(self) -> Optional[Union[int, str]]:
+        return None if self.is_partial else self._flat_path[-1]
+
+    @property
+    def id(self) -> Optional[int]:
+        id_or_name = self.id_or_name
+        return id_or_name if isinstance(id_or_name, int) else None
+
+    @property
+    def name(self) -> Optional[str]:
+        id_or_name = self.id_or_name
+        return id_or_name if isinstance(id_or_name, str) else None
+
+    @property
+    def parent(self) -> Optional["DatastoreKey"]:
+        if self._parent is None:
+            parent_path = self._flat_path[: -1 if self.is_partial else -2]
+            if parent_path:
+                self._parent = DatastoreKey._make(
+                    parent_path, self._project, self._namespace, self._database
+                )
+        return self._parent
+
+    def completed_key(self, id_or_name: Union[int, str]) -> "DatastoreKey":
+        if not self.is_partial:
+            raise ValueError("Only a partial key can be completed.")
+        return self._make(
+            self._flat_path + (id_or_name,),
+            self._project,
+            self._namespace,
+            self._database,
         )
 
+    def _clone(self) -> "DatastoreKey":
+        return self
+
+    def __copy__(self) -> "DatastoreKey":
+        return self
+
+    def __deepcopy__(self, memo) -> "DatastoreKey":
+        return self
+
+    def __reduce__(self):
+        cls = type(self)
+        if _kind_classes.get((cls.__base__, cls._kind)) is cls:
+            # Kind classes are built on demand, pickled as their base and kind
+            return _from_urlsafe, (cls.__base__, cls._kind, self.urlsafe)
+        return cls.from_urlsafe, (self.urlsafe,)
+
     @classmethod
     def __get_validators__(cls):
         yield cls.validate
 
     @classmethod
     def validate(cls, v):
-        if isinstance(v, dict) or isinstance(v, Key):
+        if isinstance(v, (dict, Key, str)):
             return cls(v)
-        raise TypeError("dict or Datastore Key required")
+        raise TypeError("dict, Datastore Key or serialized key required")
 
     def __repr__(self):
-        return f"DatastoreKey('{self._kind.title()}', '{self.id_or_name})'"
+        return f"DatastoreKey('{self.kind}', {self.id_or_name!r})"
+
+    def __class_getitem__(cls, name: str) -> Type["DatastoreKey"]:
+        kind_class = _kind_classes.get((cls, name))
+        if kind_class is None:
+            kind_class = type(cls.__name__, (cls,), {"__slots__": (), "_kind": name})
+            kind_class = _kind_classes.setdefault((cls, name), kind_class)
+        return kind_class
 
-    def __class_getitem__(cls, name):
-        class DatastoreKey(cls):
-            def __init__(self, *args, **kwargs):
-                super(DatastoreKey, self).__init__(*args, **kwargs)
 
-        DatastoreKey._kind = name
-        return DatastoreKey
\ No newline at end of file
+def _from_urlsafe(base: Type[DatastoreKey], kind: str, urlsafe: str) -> DatastoreKey:
+    """Unpickle a key of the `base[kind]` class"""
+    return base[kind].from_urlsafe(urlsafe)
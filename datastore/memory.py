@@ -0,0 +1,349 @@
+"""
+In-memory Datastore backend.
+This module exports `MemoryClient`, a drop in replacement for the subset of
+`google.cloud.datastore.Client` used by `DB`. Entities live in a dict per (namespace, kind)
+next to sorted per-property indexes, so equality and range filters are answered by
+bisecting an index instead of scanning the kind. It is meant for local runs, CI and
+load tests where Datastore network latency would hide the application overhead.
+"""
+import base64
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import datetime
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from google.cloud.datastore import Entity, Key
+
+KEY_PROPERTY = "__key__"
+SCATTER_PROPERTY = "__scatter__"
+
+_OPERATORS = {
+    "=": lambda a, b: a == b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+}
+
+
+class _Top:
+    """Sorts after every other value, used as upper bisection bound"""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_TOP = _Top()
+
+
+def key_order(key: Key) -> Tuple:
+    """Sort tuple of a key, Datastore orders numeric ids before names"""
+    path = key.flat_path
+    return tuple(
+        (path[i], (0, path[i + 1]) if isinstance(path[i + 1], int) else (1, path[i + 1]))
+        for i in range(0, len(path), 2)
+    )
+
+
+def sort_value(value: Any) -> Optional[Tuple]:
+    """Comparable representation of an indexed value following Datastore type ordering.
+    Returns:
+        tuple: (type rank, value), `None` when the value type is not indexable
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, Key):
+        return (6, key_order(value))
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, datetime):
+        return (3, value.timestamp())
+    if isinstance(value, str):
+        return (4, value)
+    if isinstance(value, bytes):
+        return (5, value)
+    return None
+
+
+def _key_entity(entity: Entity) -> Entity:
+    return Entity(key=entity.key)
+
+
+def _copy_entity(entity: Entity) -> Entity:
+    copied = Entity(key=entity.key, exclude_from_indexes=tuple(entity.exclude_from_indexes))
+    copied.update(
+        (name, list(value) if isinstance(value, list) else value)
+        for name, value in entity.items()
+    )
+    return copied
+
+
+class _Kind:
+    """Entities of one kind in one namespace with their property indexes"""
+
+    def __init__(self):
+        self.entities: Dict[Tuple, Entity] = {}
+        self.indexes: Dict[str, List[Tuple]] = {KEY_PROPERTY: []}
+
+    def _index_entries(self, order: Tuple, entity: Entity) -> Iterator[Tuple[str, Tuple]]:
+        yield KEY_PROPERTY, ((6, order), order)
+        for name, value in entity.items():
+            if name in entity.exclude_from_indexes:
+                continue
+            for item in value if isinstance(value, list) else (value,):
+                indexed = sort_value(item)
+                if indexed is not None:
+                    yield name, (indexed, order)
+
+    def put(self, order: Tuple, entity: Entity) -> None:
+        self.remove(order)
+        self.entities[order] = entity
+        for name, entry in self._index_entries(order, entity):
+            insort(self.indexes.setdefault(name, []), entry)
+
+    def remove(self, order: Tuple) -> None:
+        entity = self.entities.pop(order, None)
+        if entity is None:
+            return
+        for name, entry in self._index_entries(order, entity):
+            index = self.indexes[name]
+            position = bisect_left(index, entry)
+            if position < len(index) and index[position] == entry:
+                del index[position]
+
+    def lookup(self, name: str, operator: str, value: Any) -> Optional[List[Tuple]]:
+        """Entity keys matching a single filter, in index order"""
+        if operator == "IN":
+            matches = [self.lookup(name, "=", item) for item in value]
+            if any(m is None for m in matches):
+                return None
+            return sorted({order for m in matches for order in m})
+        index = self.indexes.get(name)
+        indexed = sort_value(value)
+        if index is None or indexed is None:
+            return []
+        low, high = 0, len(index)
+        if operator == "=":
+            low = bisect_left(index, (indexed,))
+            high = bisect_right(index, (indexed, _TOP))
+        elif operator in (">", ">="):
+            bound = (indexed, _TOP) if operator == ">" else (indexed,)
+            low = bisect_left(index, bound)
+            high = bisect_left(index, ((indexed[0] + 1,),))
+        elif operator in ("<", "<="):
+            bound = (indexed, _TOP) if operator == "<=" else (indexed,)
+            high = bisect_left(index, bound)
+            low = bisect_left(index, ((indexed[0],),))
+        else:
+            return None
+        return [order for _, order in index[low:high]]
+
+
+def _matches(entity: Entity, order: Tuple, name: str, operator: str, value: Any) -> bool:
+    if operator == "IN":
+        return any(_matches(entity, order, name, "=", item) for item in value)
+    if name == KEY_PROPERTY:
+        candidates = [(6, order)]
+    else:
+        if name not in entity or name in entity.exclude_from_indexes:
+            return False
+        current = entity[name]
+        candidates = [sort_value(v) for v in (current if isinstance(current, list) else (current,))]
+    expected = sort_value(value)
+    compare = _OPERATORS[operator]
+    return any(
+        c is not None and c[0] == expected[0] and compare(c, expected) for c in candidates
+    )
+
+
+class MemoryIterator:
+    """Result page of a `MemoryQuery`, mirroring the Datastore iterator.
+    Entities are copied as they are iterated, so a consumer going through the page
+    does not hold a copy of all of it at once."""
+
+    def __init__(
+        self,
+        page: List[Entity],
+        next_page_token: Optional[bytes],
+        copy: Callable[[Entity], Entity] = None,
+    ):
+        self._page = page
+        self._copy = copy or _copy_entity
+        self.next_page_token = next_page_token
+        self.num_results = len(page)
+
+    def __iter__(self) -> Iterator[Entity]:
+        return map(self._copy, self._page)
+
+
+class MemoryQuery:
+    """Query over a `MemoryClient`, mirroring `google.cloud.datastore.Query`"""
+
+    def __init__(
+        self,
+        client: "MemoryClient",
+        kind: str = None,
+        namespace: str = None,
+        filters: Iterable[tuple] = (),
+        order: Iterable[str] = (),
+        **kwargs: Any,
+    ):
+        self._client = client
+        self.kind = kind
+        self.namespace = namespace or client.namespace
+        self.filters = [tuple(f) for f in filters]
+        self.order = list(order)
+        self.projection: List[str] = []
+
+    def add_filter(self, property_name: str, operator: str, value: Any) -> "MemoryQuery":
+        self.filters.append((property_name, operator, value))
+        return self
+
+    def key_filter(self, key: Key, operator: str = "=") -> "MemoryQuery":
+        return self.add_filter(KEY_PROPERTY, operator, key)
+
+    def keys_only(self) -> None:
+        self.projection = [KEY_PROPERTY]
+
+    def _candidates(self, kind: _Kind) -> List[Tuple]:
+        """Narrow down candidates with the most selective indexed filter"""
+        best = None
+        for name, operator, value in self.filters:
+            matches = kind.lookup(name, operator, value)
+            if matches is not None and (best is None or len(matches) < len(best)):
+                best = matches
+        if best is None:
+            return [order for _, order in kind.indexes[KEY_PROPERTY]]
+        return sorted(set(best))
+
+    def _sort(self, kind: _Kind, orders: List[Tuple]) -> List[Tuple]:
+        for name in reversed(self.order):
+            prop = name.lstrip("-")
+            if prop == KEY_PROPERTY:
+                orders.sort(reverse=name.startswith("-"))
+                continue
+            if prop == SCATTER_PROPERTY:
+                # Stable pseudo random order, like the sampling property of Datastore
+                orders.sort(key=lambda o: hash(o) & 0xFFFFFFFF)
+                continue
+            orders = [o for o in orders if prop in kind.entities[o]]
+            orders.sort(
+                key=lambda o: sort_value(kind.entities[o][prop]) or (9,),
+                reverse=name.startswith("-"),
+            )
+        return orders
+
+    def fetch(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        start_cursor: Optional[bytes] = None,
+        end_cursor: Optional[bytes] = None,
+        **kwargs: Any,
+    ) -> MemoryIterator:
+        """Run the query.
+        Args:
+            limit (int): Maximum number of results
+            offset (int): Number of results to skip after the start cursor
+            start_cursor (bytes): `next_page_token` of a previous page
+            end_cursor (bytes): Cursor to stop at
+        Returns:
+            MemoryIterator: Results and the cursor of the next page
+        """
+        with self._client._lock:
+            kind = self._client._kind(self.namespace, self.kind)
+            orders = [
+                order
+                for order in self._candidates(kind)
+                if all(_matches(kind.entities[order], order, *f) for f in self.filters)
+            ]
+            orders = self._sort(kind, orders)
+            start = _decode_cursor(start_cursor) + (offset or 0)
+            end = min(len(orders), _decode_cursor(end_cursor) or len(orders))
+            stop = min(end, start + limit) if limit is not None else end
+            page = [kind.entities[order] for order in orders[start:stop]]
+
+        next_page_token = _encode_cursor(stop) if stop < end else None
+        if self.projection == [KEY_PROPERTY]:
+            return MemoryIterator(page, next_page_token, _key_entity)
+        return MemoryIterator(page, next_page_token)
+
+
+def _encode_cursor(position: int) -> bytes:
+    return base64.urlsafe_b64encode(str(position).encode())
+
+
+def _decode_cursor(cursor: Optional[bytes]) -> int:
+    if not cursor:
+        return 0
+    return int(base64.urlsafe_b64decode(cursor))
+
+
+class MemoryClient:
+    """Dictionary backed replacement of `google.cloud.datastore.Client`"""
+
+    def __init__(self, project: str = None, namespace: str = None, **kwargs: Any):
+        self.project = project
+        self.namespace = namespace
+        self._kinds: Dict[Tuple[Optional[str], str], _Kind] = {}
+        self._lock = RLock()
+
+    def __enter__(self) -> "MemoryClient":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def _kind(self, namespace: Optional[str], kind: str) -> _Kind:
+        try:
+            return self._kinds[(namespace, kind)]
+        except KeyError:
+            return self._kinds.setdefault((namespace, kind), _Kind())
+
+    @contextmanager
+    def transaction(self, **kwargs: Any) -> Iterator["MemoryClient"]:
+        """Run the block alone, operations of other threads wait for it to end.
+        Transactions are serialized, so they never conflict"""
+        with self._lock:
+            yield self
+
+    def query(self, **kwargs: Any) -> MemoryQuery:
+        return MemoryQuery(self, **kwargs)
+
+    def put(self, entity: Entity) -> None:
+        self.put_multi([entity])
+
+    def put_multi(self, entities: Iterable[Entity]) -> None:
+        with self._lock:
+            for entity in entities:
+                key = entity.key
+                self._kind(key.namespace, key.kind).put(
+                    key_order(key), _copy_entity(entity)
+                )
+
+    def get(self, key: Key, **kwargs: Any) -> Optional[Entity]:
+        with self._lock:
+            entity = self._kind(key.namespace, key.kind).entities.get(key_order(key))
+            return _copy_entity(entity) if entity is not None else None
+
+    def get_multi(self, keys: Iterable[Key], **kwargs: Any) -> List[Entity]:
+        return [entity for entity in map(self.get, keys) if entity is not None]
+
+    def delete(self, key: Key) -> None:
+        self.delete_multi([key])
+
+    def delete_multi(self, keys: Iterable[Key]) -> None:
+        with self._lock:
+            for key in keys:
+                self._kind(key.namespace, key.kind).remove(key_order(key))
+
+    def flush(self) -> None:
+        """Drop every stored entity"""
+        with self._lock:
+            self._kinds.clear()
@@ -0,0 +1,264 @@
+"""
+Resumable schema migrations and backfills.
+Migrations are versioned transforms of the entities of a kind, registered with the
+`migration` decorator. `MigrationRunner` streams the kind page by page in key order,
+applies every migration newer than the last completed version, writes changed entities
+in batched commits and stores a checkpoint after each commit, so an interrupted run
+resumes from its last cursor. Transforms may see an entity twice after a crash between
+a commit and its checkpoint and must therefore be idempotent.
+"""
+import base64
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Type
+
+from google.cloud.datastore import Entity
+
+from datastore.entity import _encode
+from datastore.namespace import use_namespace
+from datastore.profiler import query_profiler
+from datastore.writebehind import MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+KEY_PROPERTY = "__key__"
+
+# Returns the entity to write, or None to leave it unchanged
+Transform = Callable[[Entity], Optional[Entity]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Versioned transform of the entities of a kind"""
+
+    kind: str
+    version: int
+    transform: Transform
+    description: str = ""
+
+
+_migrations: Dict[str, Dict[int, Migration]] = {}
+
+
+def migration(kind: str, version: int, description: str = "") -> Callable[[Transform], Transform]:
+    """Register a transform as migration `version` of `kind`.
+    Args:
+        kind (str): Kind of the migrated entities
+        version (int): Version the transform migrates to, unique per kind
+        description (str): Shown in progress reports
+    """
+
+    def register(transform: Transform) -> Transform:
+        versions = _migrations.setdefault(kind, {})
+        if version in versions:
+            raise ValueError(f"Migration {version} of {kind} is already registered")
+        versions[version] = Migration(
+            kind, version, transform, description or transform.__doc__ or ""
+        )
+        return transform
+
+    return register
+
+
+def migrations_of(kind: str) -> List[Migration]:
+    """Registered migrations of a kind, by version"""
+    return sorted(_migrations.get(kind, {}).values(), key=lambda m: m.version)
+
+
+def rewrite_with(model: Type) -> Transform:
+    """Transform re-saving entities through the current model, e.g. after a field was
+    added to `compressed_fields` or `excluded_indexes`. The key read is kept, so
+    entities stay in the namespace they were read from."""
+
+    def rewrite(entity: Entity) -> Entity:
+        return _encode(model.from_entity(entity), entity.key)
+
+    return rewrite
+
+
+@dataclass
+class Checkpoint:
+    """Progress of a kind's migrations, stored as JSON"""
+
+    kind: str
+    version: int = 0
+    target_version: Optional[int] = None
+    cursor: Optional[str] = None
+    processed: int = 0
+    written: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def load(cls, path: str, kind: str) -> "Checkpoint":
+        if not os.path.exists(path):
+            return cls(kind=kind)
+        with open(path) as file:
+            return cls(**json.load(file))
+
+    def save(self, path: str) -> None:
+        self.updated_at = time.time()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, a crash never leaves a truncated checkpoint
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(asdict(self), file)
+        os.replace(f"{path}.tmp", path)
+
+
+@dataclass
+class MigrationProgress:
+    kind: str
+    target_version: int
+    processed: int
+    written: int
+    elapsed: float
+
+    @property
+    def rate(self) -> float:
+        """Entities written per second"""
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.kind} -> v{self.target_version}: {self.processed} processed, "
+            f"{self.written} written, {self.rate:.1f}/s"
+        )
+
+
+class MigrationRunner:
+    """Applies the pending migrations of a kind"""
+
+    def __init__(
+        self,
+        client,
+        kind: str,
+        migrations: List[Migration] = None,
+        checkpoint_path: str = None,
+        batch_size: int = MAX_BATCH_SIZE,
+        rate: Optional[float] = None,
+        dry_run: bool = False,
+        on_progress: Callable[[MigrationProgress], None] = None,
+        namespace: Optional[str] = None,
+    ):
+        """
+        Args:
+            client: Datastore client
+            kind (str): Kind to migrate
+            migrations (List[Migration]): Defaults to the registered migrations of `kind`
+            checkpoint_path (str): JSON checkpoint file, defaults to `.migrations/<kind>.json`,
+                or `.migrations/<namespace>/<kind>.json` for a namespace
+            batch_size (int): Entities read and committed at once, at most 500
+            rate (float): Target writes per second, unthrottled when not set
+            dry_run (bool): Apply the transforms without writing or checkpointing
+            on_progress (Callable): Called after every batch
+            namespace (str): Namespace of the tenant to migrate, the client's by default
+        """
+        self.client = client
+        self.kind = kind
+        self.namespace = namespace
+        self.migrations = migrations if migrations is not None else migrations_of(kind)
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            ".migrations", *([namespace] if namespace else []), f"{kind}.json"
+        )
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.rate = rate
+        self.dry_run = dry_run
+        self.on_progress = on_progress or (lambda progress: logger.info("%s", progress))
+
+    def pending(self, checkpoint: Checkpoint, to_version: int = None) -> List[Migration]:
+        return [
+            m
+            for m in self.migrations
+            if m.version > checkpoint.version
+            and (to_version is None or m.version <= to_version)
+        ]
+
+    def _apply(self, entity: Entity, migrations: List[Migration]) -> Optional[Entity]:
+        changed = None
+        for m in migrations:
+            result = m.transform(changed or entity)
+            if result is not None:
+                changed = result
+        return changed
+
+    def _fetch(self, cursor: Optional[bytes]):
+        query = self.client.query(
+            kind=self.kind, namespace=self.namespace, order=[KEY_PROPERTY]
+        )
+        started = time.perf_counter()
+        iterator = query.fetch(start_cursor=cursor, limit=self.batch_size)
+        entities = list(iterator)
+        query_profiler.record(
+            query,
+            duration_ms=(time.perf_counter() - started) * 1000,
+            fetched=len(entities),
+            returned=len(entities),
+            limit=self.batch_size,
+            cursor=cursor,
+        )
+        return entities, iterator.next_page_token
+
+    def run(self, to_version: int = None) -> MigrationProgress:
+        """Migrate the kind up to `to_version`, the latest registered one by default.
+        Returns:
+            MigrationProgress: Totals of the run, including resumed progress
+        """
+        checkpoint = Checkpoint.load(self.checkpoint_path, self.kind)
+        pending = self.pending(checkpoint, to_version)
+        target = pending[-1].version if pending else checkpoint.version
+        if checkpoint.target_version != target:
+            # A different target restarts the scan, finished versions stay finished
+            checkpoint.target_version = target
+            checkpoint.cursor = None
+            checkpoint.processed = checkpoint.written = 0
+
+        started = time.monotonic()
+        written_before = checkpoint.written
+        progress = MigrationProgress(self.kind, target, checkpoint.processed, checkpoint.written, 0.0)
+        if not pending:
+            return progress
+
+        for m in pending:
+            logger.info("Migrating %s to v%s: %s", self.kind, m.version, m.description)
+
+        cursor = base64.b64decode(checkpoint.cursor) if checkpoint.cursor else None
+        while True:
+            entities, cursor = self._fetch(cursor)
+            # Keys built by the transforms belong to the migrated tenant
+            with use_namespace(self.namespace):
+                changed = [
+                    result
+                    for result in (self._apply(entity, pending) for entity in entities)
+                    if result is not None
+                ]
+            if changed and not self.dry_run:
+                self.client.put_multi(changed)
+
+            checkpoint.processed += len(entities)
+            checkpoint.written += len(changed)
+            done = not cursor or len(entities) < self.batch_size
+            if done:
+                checkpoint.version, checkpoint.cursor = target, None
+            else:
+                checkpoint.cursor = base64.b64encode(cursor).decode("ascii")
+            if not self.dry_run:
+                checkpoint.save(self.checkpoint_path)
+
+            elapsed = time.monotonic() - started
+            progress = MigrationProgress(
+                self.kind, target, checkpoint.processed, checkpoint.written, elapsed
+            )
+            self.on_progress(progress)
+            if done:
+                return progress
+            self._throttle(checkpoint.written - written_before, elapsed)
+
+    def _throttle(self, written: int, elapsed: float) -> None:
+        if self.rate:
+            ahead = written / self.rate - elapsed
+            if ahead > 0:
+                time.sleep(ahead)
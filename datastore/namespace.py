@@ -0,0 +1,53 @@
+"""
+Namespace of the current tenant.
+
+A process serves many tenants, each stored in its own Datastore namespace. The tenant of
+the current request is kept in a context variable, set by `core.Tenancy.TenantMiddleware`
+or with `use_namespace`, and every key and query built by `DB` for a multi-tenant kind
+uses it. Operations run on the shared client, which takes the namespace per call.
+"""
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Namespace names Datastore accepts, names starting with "__" are reserved
+NAMESPACE_PATTERN = re.compile(r"(?!__)[0-9A-Za-z._-]{1,100}")
+
+_current_namespace: ContextVar[Optional[str]] = ContextVar("namespace", default=None)
+
+
+def current_namespace() -> Optional[str]:
+    """Namespace of the current tenant, None when no tenant is set"""
+    return _current_namespace.get()
+
+
+def is_valid_namespace(namespace: str) -> bool:
+    return bool(NAMESPACE_PATTERN.fullmatch(namespace))
+
+
+@contextmanager
+def use_namespace(namespace: Optional[str]) -> Iterator[None]:
+    """Run the block as the tenant of `namespace`"""
+    if namespace is not None and not is_valid_namespace(namespace):
+        raise ValueError(f"Invalid namespace '{namespace}'")
+    token = _current_namespace.set(namespace)
+    try:
+        yield
+    finally:
+        _current_namespace.reset(token)
+
+
+def namespace_of(ds_config) -> Optional[str]:
+    """Namespace of a kind for the current tenant.
+    Args:
+        ds_config: `DatastoreConfig` of the kind
+    Returns:
+        The tenant namespace for multi-tenant kinds, `ds_config.namespace` otherwise
+        or when no tenant is set
+    """
+    if getattr(ds_config, "multi_tenant", True):
+        namespace = _current_namespace.get()
+        if namespace is not None:
+            return namespace
+    return ds_config.namespace
@@ -0,0 +1,309 @@
+"""
+Process pool offload of CPU heavy entity encoding and decoding.
+
+Serializing compressed fields (orjson + zlib) and validating parsed entities hold the GIL,
+so a request writing or reading large compressed entities stalls every other request of
+the process. Batches whose compressed values reach `OFFLOAD_MIN_BYTES` are processed on a
+pool of `OFFLOAD_PROCESSES` processes instead, split in one chunk per process:
+
+- `Offloader.decode_many` parses entities read, used by `DB.get_many`, `DB.list` and
+  `DB.scan`.
+- `Offloader.encode_many` serializes and compresses the compressed fields of records
+  written, used by `DB.upsert_many`.
+
+Compressed values are handed over in a single shared memory segment instead of being
+pickled with the task: the values read are copied once into a segment the workers
+decompress from in place, the values written are returned the same way.
+
+The pool is spawned on first use, not forked, as for `DB.scan`. While it is broken or
+shared memory is unavailable, batches are processed inline.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+from zlib import compress, decompress, error
+
+import orjson
+from google.cloud.datastore import Entity
+from pydantic import ValidationError
+
+from config import config
+from datastore.entity import (
+    DatastoreEntity,
+    _encode,
+    _metadata,
+    _plain,
+    encoder,
+    orjson_options,
+)
+
+logger = logging.getLogger(__name__)
+
+# Offset and length of each buffer within a shared memory segment
+Layout = List[Tuple[int, int]]
+
+
+def parse_batch(
+    model: Type[DatastoreEntity], entities: List, transform: Callable = None
+) -> List[Any]:
+    """Parse a page of entities, skipping invalid ones, and apply `transform`.
+    Module level so it can run on a process pool.
+    """
+    records = []
+    for entity in entities:
+        try:
+            records.append(model.from_entity(entity))
+        except ValidationError as error:
+            logger.warning("Skipped invalid %s entity: %s", model.__name__, error)
+    if transform is None:
+        return records
+    return [transform(record) for record in records]
+
+
+def _share(buffers: Sequence[bytes]) -> Tuple[SharedMemory, Layout]:
+    """Shared memory segment holding `buffers` one after the other"""
+    segment = SharedMemory(create=True, size=max(sum(map(len, buffers)), 1))
+    layout, position = [], 0
+    for buffer in buffers:
+        segment.buf[position : position + len(buffer)] = buffer
+        layout.append((position, len(buffer)))
+        position += len(buffer)
+    return segment, layout
+
+
+def _release(segment: SharedMemory, unlink: bool = True) -> None:
+    segment.close()
+    if unlink:
+        segment.unlink()
+
+
+def _decode_chunk(
+    model: Type[DatastoreEntity],
+    rows: List[dict],
+    fields: List[Tuple[int, str]],
+    name: str,
+    layout: Layout,
+) -> List[DatastoreEntity]:
+    """Parse rows whose compressed `fields` are read from the segment `name`"""
+    segment = SharedMemory(name=name)
+    try:
+        for (row, field), (offset, length) in zip(fields, layout):
+            with segment.buf[offset : offset + length] as value:
+                try:
+                    rows[row][field] = orjson.loads(decompress(value))
+                except (error, orjson.JSONDecodeError):
+                    # Base64 encoded, decoded by `decompress_values`
+                    rows[row][field] = bytes(value)
+        return parse_batch(model, rows)
+    finally:
+        _release(segment, unlink=False)
+
+
+def _encode_chunk(values: List[Any]) -> Tuple[str, Layout]:
+    """Serialize and compress values into a new segment, unlinked by the caller"""
+    segment, layout = _share(
+        [
+            compress(orjson.dumps(value, default=encoder, option=orjson_options))
+            for value in values
+        ]
+    )
+    _release(segment, unlink=False)
+    return segment.name, layout
+
+
+def _discard_segments(futures: List[Future]) -> None:
+    """Unlink the segments of `_encode_chunk` tasks whose results were not read"""
+    for future in futures:
+        if future.cancel() or not future.done() or future.exception() is not None:
+            continue
+        name, _ = future.result()
+        try:
+            _release(SharedMemory(name=name))
+        except FileNotFoundError:
+            pass
+
+
+def _chunks(size: int, count: int) -> List[range]:
+    """Split `range(size)` into at most `count` contiguous ranges"""
+    step = -(-size // max(count, 1))
+    return [range(start, min(start + step, size)) for start in range(0, size, step)]
+
+
+class Offloader:
+    """Runs the encoding and decoding of large batches on a shared process pool"""
+
+    def __init__(self, processes: int = None, min_bytes: int = None):
+        self.processes = config.OFFLOAD_PROCESSES if processes is None else processes
+        self.min_bytes = config.OFFLOAD_MIN_BYTES if min_bytes is None else min_bytes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.offloaded = 0
+        self.offloaded_bytes = 0
+        self.inline = 0
+        self.fallbacks = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def _discard_pool(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _offloads(self, size: int) -> bool:
+        if self.processes > 0 and size >= self.min_bytes:
+            return True
+        self.inline += 1
+        return False
+
+    def _failed(self, what: str) -> None:
+        self.fallbacks += 1
+        logger.exception("Offloaded %s failed, processed inline", what)
+
+    def decode_many(
+        self,
+        model: Type[DatastoreEntity],
+        entities: Sequence[dict],
+        transform: Callable = None,
+    ) -> List[Any]:
+        """Parse entities, skipping invalid ones, see `parse_batch`.
+        `transform` is applied in the calling process, it does not need to be picklable.
+        """
+        compressed = _metadata(model).compressed
+        size = sum(
+            len(value)
+            for entity in entities
+            for value in map(entity.get, compressed)
+            if isinstance(value, bytes)
+        )
+        if not self._offloads(size):
+            return parse_batch(model, entities, transform)
+
+        # Compressed values go through shared memory, the rest is pickled
+        rows, fields, buffers = [], [], []
+        for index, entity in enumerate(entities):
+            row = dict(entity)
+            for field in compressed:
+                if isinstance(row.get(field), bytes):
+                    fields.append((index, field))
+                    buffers.append(row.pop(field))
+            rows.append(row)
+        records = []
+        segment = None
+        try:
+            segment, layout = _share(buffers)
+            pool = self._get_pool()
+            futures = []
+            for chunk in _chunks(len(rows), self.processes):
+                selected = [i for i, (row, _) in enumerate(fields) if row in chunk]
+                futures.append(
+                    pool.submit(
+                        _decode_chunk,
+                        model,
+                        rows[chunk.start : chunk.stop],
+                        [(fields[i][0] - chunk.start, fields[i][1]) for i in selected],
+                        segment.name,
+                        [layout[i] for i in selected],
+                    )
+                )
+            for future in futures:
+                records.extend(future.result())
+        except (BrokenProcessPool, OSError):
+            self._failed("decoding")
+            self._discard_pool()
+            return parse_batch(model, entities, transform)
+        finally:
+            if segment is not None:
+                _release(segment)
+        self.offloaded += 1
+        self.offloaded_bytes += size
+        if transform is None:
+            return records
+        return [transform(record) for record in records]
+
+    def encode_many(self, records: Sequence[DatastoreEntity]) -> List[Entity]:
+        """Entities of records, see `DatastoreEntity.as_entity`"""
+        if not records:
+            return []
+        compressed = _metadata(type(records[0])).compressed
+        values, fields = [], []
+        for index, record in enumerate(records):
+            for field in compressed:
+                value = record.__dict__.get(field)
+                if value is not None:
+                    fields.append((index, field))
+                    values.append(_plain(value))
+        if not values or not self._offloads(self._estimated_size(values)):
+            return [record.as_entity for record in records]
+
+        blobs: List[Dict[str, bytes]] = [{} for _ in records]
+        futures = []
+        try:
+            pool = self._get_pool()
+            chunks = _chunks(len(values), self.processes)
+            futures = [
+                pool.submit(_encode_chunk, values[chunk.start : chunk.stop])
+                for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                name, layout = future.result()
+                segment = SharedMemory(name=name)
+                try:
+                    for i, (offset, length) in zip(chunk, layout):
+                        index, field = fields[i]
+                        with segment.buf[offset : offset + length] as value:
+                            blobs[index][field] = bytes(value)
+                finally:
+                    _release(segment)
+        except (BrokenProcessPool, OSError):
+            self._failed("encoding")
+            self._discard_pool()
+            return [record.as_entity for record in records]
+        finally:
+            _discard_segments(futures)
+        self.offloaded += 1
+        self.offloaded_bytes += sum(len(blob) for row in blobs for blob in row.values())
+        return [
+            _encode(record, record.key, blobs[index])
+            for index, record in enumerate(records)
+        ]
+
+    def _estimated_size(self, values: List[Any]) -> int:
+        """Compressed size of the values, extrapolated from the first one"""
+        if self.processes <= 0:
+            return 0
+        sample = compress(
+            orjson.dumps(values[0], default=encoder, option=orjson_options)
+        )
+        return len(sample) * len(values)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def metrics(self) -> dict:
+        return {
+            "processes": self.processes,
+            "min_bytes": self.min_bytes,
+            "running": self._pool is not None,
+            "offloaded": self.offloaded,
+            "offloaded_bytes": self.offloaded_bytes,
+            "inline": self.inline,
+            "fallbacks": self.fallbacks,
+        }
+
+
+offloader = Offloader()
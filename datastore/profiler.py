@@ -0,0 +1,188 @@
+"""
+Query profiler for the DB layer.
+Every query built through `DB._build_query` is recorded into a fixed size ring buffer
+together with its shape, wall time and fetched/returned entity counts, so expensive
+access patterns can be inspected at runtime without external tooling.
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryProfile:
+    """A single profiled query"""
+
+    kind: str
+    filters: List[str]
+    order: List[str]
+    limit: Optional[int]
+    offset: int
+    keys_only: bool
+    has_cursor: bool
+    duration_ms: float
+    fetched: int
+    returned: int
+    offset_scan: bool = False
+    slow: bool = False
+    namespace: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+    @property
+    def shape(self) -> Tuple:
+        """Identifies the access pattern, independent of filter values"""
+        return (
+            self.namespace,
+            self.kind,
+            tuple(self.filters),
+            tuple(self.order),
+            self.keys_only,
+            self.offset_scan,
+        )
+
+    def dict(self) -> dict:
+        return asdict(self)
+
+
+def normalize_filters(filters: List[tuple]) -> List[str]:
+    """Drop filter values and sort, so `("id", ">", 3)` and `("id", ">", 4)` match"""
+    return sorted(f"{name}{operator}" for name, operator, *_ in filters)
+
+
+class QueryProfiler:
+    """Ring buffer of the most recent query profiles"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        slow_threshold_ms: float = 100.0,
+        buffer_size: int = 1000,
+    ):
+        self.enabled = enabled
+        self.slow_threshold_ms = slow_threshold_ms
+        self._profiles: Deque[QueryProfile] = deque(maxlen=buffer_size)
+        self._lock = Lock()
+
+    def record(
+        self,
+        query,
+        *,
+        duration_ms: float,
+        fetched: int,
+        returned: int,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        keys_only: bool = False,
+        cursor=None,
+    ) -> Optional[QueryProfile]:
+        """Record one executed query.
+        Args:
+            query: The Datastore query which was run
+            duration_ms (float): Wall time spent fetching and parsing the results
+            fetched (int): Number of entities returned by Datastore
+            returned (int): Number of entities left once invalid ones are skipped
+            limit (int): Query limit
+            offset (int): Query offset, any offset is flagged as an offset scan since
+                Datastore reads and discards the skipped entities
+            keys_only (bool): Whether it was a keys only query
+            cursor: Start cursor of the query
+        Returns:
+            QueryProfile: The recorded profile, `None` when profiling is disabled
+        """
+        if not self.enabled:
+            return None
+
+        profile = QueryProfile(
+            kind=query.kind,
+            filters=normalize_filters(query.filters),
+            order=list(query.order),
+            limit=limit,
+            offset=offset or 0,
+            keys_only=keys_only,
+            has_cursor=cursor is not None,
+            duration_ms=round(duration_ms, 3),
+            fetched=fetched,
+            returned=returned,
+            offset_scan=bool(offset),
+            slow=duration_ms >= self.slow_threshold_ms,
+            namespace=query.namespace,
+        )
+        with self._lock:
+            self._profiles.append(profile)
+        if profile.slow:
+            logger.warning(
+                "Slow query on %s (%.1fms): filters=%s order=%s limit=%s offset=%s",
+                profile.kind,
+                profile.duration_ms,
+                profile.filters,
+                profile.order,
+                profile.limit,
+                profile.offset,
+            )
+        return profile
+
+    def profiles(
+        self,
+        slow_only: bool = False,
+        limit: Optional[int] = None,
+        namespace: Optional[str] = None,
+    ) -> List[QueryProfile]:
+        """Most recent profiles first, of every namespace unless `namespace` is given"""
+        with self._lock:
+            profiles = list(reversed(self._profiles))
+        if namespace is not None:
+            profiles = [p for p in profiles if p.namespace == namespace]
+        if slow_only:
+            profiles = [p for p in profiles if p.slow or p.offset_scan]
+        return profiles[:limit] if limit else profiles
+
+    def summary(self, namespace: Optional[str] = None) -> List[dict]:
+        """Profiles aggregated per namespace and query shape, most total time first"""
+        shapes: Dict[Tuple, dict] = {}
+        for profile in self.profiles(namespace=namespace):
+            entry = shapes.setdefault(
+                profile.shape,
+                {
+                    "namespace": profile.namespace,
+                    "kind": profile.kind,
+                    "filters": profile.filters,
+                    "order": profile.order,
+                    "keys_only": profile.keys_only,
+                    "offset_scan": profile.offset_scan,
+                    "count": 0,
+                    "slow_count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "fetched": 0,
+                    "returned": 0,
+                },
+            )
+            entry["count"] += 1
+            entry["slow_count"] += profile.slow
+            entry["total_ms"] += profile.duration_ms
+            entry["max_ms"] = max(entry["max_ms"], profile.duration_ms)
+            entry["fetched"] += profile.fetched
+            entry["returned"] += profile.returned
+
+        for entry in shapes.values():
+            entry["total_ms"] = round(entry["total_ms"], 3)
+            entry["avg_ms"] = round(entry["total_ms"] / entry["count"], 3)
+        return sorted(shapes.values(), key=lambda e: e["total_ms"], reverse=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._profiles.clear()
+
+
+query_profiler = QueryProfiler(
+    enabled=config.QUERY_PROFILER_ENABLED,
+    slow_threshold_ms=config.SLOW_QUERY_THRESHOLD_MS,
+    buffer_size=config.QUERY_PROFILER_BUFFER_SIZE,
+)
@@ -0,0 +1,171 @@
+"""
+Parallel full-kind scans.
+A kind is split into `__key__` range shards using the `__scatter__` sampling Datastore
+maintains for this purpose, the shards are paged concurrently on a bounded thread pool
+and their pages are merged into a single stream as they arrive. Results are not ordered.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional, Tuple
+
+from google.cloud.datastore import Entity, Key
+
+from datastore.memory import key_order
+from datastore.profiler import query_profiler
+
+KEY_PROPERTY = "__key__"
+SCATTER_PROPERTY = "__scatter__"
+# Sampled keys per shard, more samples give evenly sized shards
+OVERSAMPLING = 32
+
+KeyRange = Tuple[Optional[Key], Optional[Key]]
+
+
+def split_points(
+    client,
+    kind: str,
+    shards: int,
+    oversampling: int = OVERSAMPLING,
+    namespace: Optional[str] = None,
+) -> List[Key]:
+    """Keys splitting a kind into roughly even ranges.
+    Args:
+        client: Datastore client
+        kind (str): Kind to split
+        shards (int): Wanted number of ranges
+        oversampling (int): Number of sampled keys per range
+        namespace (str): Namespace of the kind, the client's by default
+    Returns:
+        list: Up to `shards - 1` ascending split keys, fewer for small kinds
+    """
+    if shards <= 1:
+        return []
+    query = client.query(kind=kind, namespace=namespace, order=[SCATTER_PROPERTY])
+    query.keys_only()
+    sample = sorted(
+        (entity.key for entity in query.fetch(limit=shards * oversampling)),
+        key=key_order,
+    )
+    if len(sample) < shards:
+        return sample[1:]
+    step = len(sample) / shards
+    points = []
+    for shard in range(1, shards):
+        point = sample[int(shard * step)]
+        if not points or point != points[-1]:
+            points.append(point)
+    return points
+
+
+def key_ranges(points: List[Key]) -> List[KeyRange]:
+    """Half open `[start, end)` key ranges between split points, open ended at both sides"""
+    bounds = [None, *points, None]
+    return list(zip(bounds, bounds[1:]))
+
+
+class _Done:
+    """Marks the end of a shard in the results queue"""
+
+
+class ParallelScan:
+    """Concurrent scan of a kind over `__key__` range shards"""
+
+    def __init__(
+        self,
+        client,
+        kind: str,
+        shards: int = 8,
+        workers: int = 8,
+        batch_size: int = 500,
+        keys_only: bool = False,
+        namespace: Optional[str] = None,
+    ):
+        self.client = client
+        self.kind = kind
+        self.namespace = namespace
+        self.shards = shards
+        self.workers = max(1, min(workers, shards))
+        self.batch_size = batch_size
+        self.keys_only = keys_only
+
+    def _fetch_range(
+        self, key_range: KeyRange, results: queue.Queue, stopped: threading.Event
+    ) -> None:
+        start, end = key_range
+        filters = []
+        if start is not None:
+            filters.append((KEY_PROPERTY, ">=", start))
+        if end is not None:
+            filters.append((KEY_PROPERTY, "<", end))
+
+        cursor = None
+        try:
+            while not stopped.is_set():
+                query = self.client.query(
+                    kind=self.kind, namespace=self.namespace, filters=filters
+                )
+                if self.keys_only:
+                    query.keys_only()
+                started = time.perf_counter()
+                iterator = query.fetch(start_cursor=cursor, limit=self.batch_size)
+                batch = list(iterator)
+                query_profiler.record(
+                    query,
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    fetched=len(batch),
+                    returned=len(batch),
+                    limit=self.batch_size,
+                    keys_only=self.keys_only,
+                    cursor=cursor,
+                )
+                cursor = iterator.next_page_token
+                if batch:
+                    self._put(results, batch, stopped)
+                if not cursor or len(batch) < self.batch_size:
+                    break
+        except Exception as error:
+            self._put(results, error, stopped)
+        finally:
+            self._put(results, _Done, stopped)
+
+    @staticmethod
+    def _put(results: queue.Queue, item: Any, stopped: threading.Event) -> None:
+        # Wait for the consumer, but give up once it went away
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def batches(self) -> Iterator[List[Entity]]:
+        """Pages of entities, as soon as any shard fetched one"""
+        ranges = key_ranges(
+            split_points(self.client, self.kind, self.shards, namespace=self.namespace)
+        )
+        results: queue.Queue = queue.Queue(maxsize=self.workers * 2)
+        stopped = threading.Event()
+        pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix=f"datastore-scan-{self.kind}"
+        )
+        try:
+            for key_range in ranges:
+                pool.submit(self._fetch_range, key_range, results, stopped)
+            remaining = len(ranges)
+            while remaining:
+                item = results.get()
+                if item is _Done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def __iter__(self) -> Iterator[Entity]:
+        for batch in self.batches():
+            yield from batch
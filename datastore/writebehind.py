@@ -0,0 +1,199 @@
+"""
+Write-behind buffering for kinds with `DatastoreConfig.write_behind` enabled.
+Upserts are queued in memory and coalesced per key, a background thread then flushes
+them in batched commits every `write_behind_window` seconds. Reads by key see pending
+writes, and writes being flushed until their commit succeeds, queries may lag behind by
+up to one window.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud.datastore import Entity
+
+logger = logging.getLogger(__name__)
+
+# Datastore rejects commits with more than 500 mutations
+MAX_BATCH_SIZE = 500
+
+
+def _buffer_key(key) -> Tuple:
+    return (key.namespace, key.flat_path)
+
+
+class WriteBehindBuffer:
+    """Coalescing write queue of a single kind"""
+
+    def __init__(
+        self,
+        client,
+        kind: str,
+        window: float = 0.1,
+        max_batch: int = MAX_BATCH_SIZE,
+    ):
+        self.client = client
+        self.kind = kind
+        self.window = window
+        self.max_batch = min(max_batch, MAX_BATCH_SIZE)
+        self._pending: Dict[Tuple, Entity] = {}
+        # Writes of the flush in progress, readable until committed
+        self._inflight: Dict[Tuple, Entity] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def enqueue(self, entity: Entity) -> None:
+        """Queue an entity write, replacing any pending write of the same key"""
+        with self._lock:
+            key = _buffer_key(entity.key)
+            self.coalesced += key in self._pending
+            self._pending[key] = entity
+            self.enqueued += 1
+            depth = len(self._pending)
+        self.start()
+        if depth >= self.max_batch:
+            self._wakeup.set()
+
+    def get(self, key) -> Optional[Entity]:
+        """Pending or in-flight write of a key, if any"""
+        key = _buffer_key(key)
+        with self._lock:
+            entity = self._pending.get(key)
+            return self._inflight.get(key) if entity is None else entity
+
+    def discard(self, key) -> None:
+        """Drop the pending write of a key, waiting for an in-flight flush first,
+        so a subsequent delete cannot be overtaken by a buffered write"""
+        with self._flush_lock, self._lock:
+            self._pending.pop(_buffer_key(key), None)
+
+    def flush(self) -> int:
+        """Write every pending entity in batched commits.
+        Returns:
+            int: Number of entities written
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._inflight, self._pending = self._pending, {}
+            if not self._inflight:
+                return 0
+
+            started = time.perf_counter()
+            entities: List[Entity] = list(self._inflight.values())
+            written = 0
+            try:
+                for start in range(0, len(entities), self.max_batch):
+                    self.client.put_multi(entities[start : start + self.max_batch])
+                    written += len(entities[start : start + self.max_batch])
+            except Exception:
+                self.errors += 1
+                logger.exception("Write-behind flush of %s failed, requeueing", self.kind)
+                with self._lock:
+                    for entity in entities[written:]:
+                        # Newer writes queued during the flush take precedence
+                        self._pending.setdefault(_buffer_key(entity.key), entity)
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                elapsed = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.flushed += written
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+                self.total_flush_ms += elapsed
+            return written
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Start the background flusher, if not running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name=f"write-behind-{self.kind}", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background flusher and flush whatever is still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "kind": self.kind,
+            "queue_depth": self.queue_depth,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3)
+            if self.flushes
+            else 0.0,
+        }
+
+
+_buffers: Dict[str, WriteBehindBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_buffer(client, ds_config) -> WriteBehindBuffer:
+    """Shared write-behind buffer of a kind, created on first use"""
+    buffer = _buffers.get(ds_config.kind)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.setdefault(
+                ds_config.kind,
+                WriteBehindBuffer(
+                    client,
+                    ds_config.kind,
+                    window=ds_config.write_behind_window,
+                    max_batch=ds_config.write_behind_max_batch,
+                ),
+            )
+    return buffer
+
+
+def flush_all() -> int:
+    """Flush every write-behind buffer"""
+    return sum(buffer.flush() for buffer in list(_buffers.values()))
+
+
+def stop_all() -> None:
+    """Stop every background flusher, flushing pending writes, used on shutdown"""
+    for buffer in list(_buffers.values()):
+        buffer.stop()
+
+
+def metrics() -> List[dict]:
+    return [buffer.metrics() for buffer in list(_buffers.values())]
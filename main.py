@@ -1,29 +1,138 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
+from fastapi.concurrency import run_in_threadpool
 from strawberry import Schema
-from strawberry.fastapi import GraphQLRouter
 
 from configs.Environment import get_environment_variables
 from configs.GraphQL import get_graphql_context
+from core.Admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    AdmissionRule,
+    Priority,
+)
+from core import QueryCost, Warmup
+from core.Compression import CompressionMiddleware
+from core.MemoryProfiler import MemoryProfilerMiddleware, memory_profiler
+from core.ResponseCache import CacheRule, ResponseCacheMiddleware
+from core.PersistedQueries import DocumentCache, PersistedQueryRouter
+from core.Tenancy import TenantMiddleware
+from core.Tracing import TracingExtension, TracingMiddleware
+from datastore import writebehind
+from datastore.offload import offloader
 from metadata.Tags import Tags
+from repositories.AuthorRepository import AuthorRepository
+from routers.HealthRouter import HealthRouter
+from routers.v1.AdminRouter import AdminRouter
 from routers.v1.AuthorRouter import AuthorRouter
 from schemas.graphql.Query import Query
 from schemas.graphql.Mutation import Mutation
+from schemas.graphql.Subscription import Subscription
+from schemas.pydantic.AuthorSchema import Author
+from schemas.pydantic.BookSchema import Book
+from services.AuthorService import CACHE_TAG, AuthorService
 from config import config
 # Application Environment Configuration
 
+
+# Application Lifecycle
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.MEMORY_PROFILING:
+        memory_profiler.start()
+    # Warm caches in the background, /ready answers 503 until done
+    warmup = None
+    if config.WARMUP_ENABLED:
+        warmup = asyncio.create_task(
+            Warmup.warm_up(
+                schema,
+                [Author, Book],
+                lambda: {"authorService": AuthorService(AuthorRepository())},
+            )
+        )
+    else:
+        Warmup.skip()
+    yield
+    if warmup is not None:
+        warmup.cancel()
+        # Hot keys and queries warm the next instance
+        await run_in_threadpool(Warmup.save_snapshot)
+    # Never lose buffered writes on shutdown
+    await run_in_threadpool(writebehind.stop_all)
+    await run_in_threadpool(offloader.shutdown)
+
+
 # Core Application Instance
 app = FastAPI(
     title="test",
     version="0.0.0",
     openapi_tags=Tags,
+    lifespan=lifespan,
 )
 
+# Admission Control, first matching rule applies
+app.state.admission = AdmissionController(
+    [
+        AdmissionRule("admin", r"/v1/admin/", priority=None),
+        AdmissionRule(
+            "authors.bulk",
+            r"/v1/authors/(import|export)",
+            priority=Priority.BULK,
+            rate=1,
+            burst=5,
+        ),
+        # Long lived streams, bounded by CHANGES_MAX_SUBSCRIBERS instead
+        AdmissionRule("authors.changes", r"/v1/authors/changes", priority=None),
+        AdmissionRule(
+            "authors.read",
+            r"/v1/authors",
+            methods=("GET", "HEAD"),
+            priority=Priority.READ,
+        ),
+        AdmissionRule(
+            "authors.write", r"/v1/authors", priority=Priority.WRITE
+        ),
+        AdmissionRule("graphql", r"/graphql", priority=Priority.READ),
+    ]
+)
+
+# Add Middlewares, the last added one runs first
+app.add_middleware(
+    ResponseCacheMiddleware,
+    rules=[
+        CacheRule(
+            "authors.list", r"/v1/authors/?$", tags=(CACHE_TAG,)
+        ),
+    ],
+)
+if config.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+app.add_middleware(
+    AdmissionMiddleware, controller=app.state.admission
+)
+app.add_middleware(MemoryProfilerMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(TenantMiddleware)
+
 # Add Routers
 app.include_router(AuthorRouter)
+app.include_router(AdminRouter)
+app.include_router(HealthRouter)
 
 # GraphQL Schema and Application Instance
-schema = Schema(query=Query, mutation=Mutation)
-graphql = GraphQLRouter(
+schema = Schema(
+    query=Query,
+    mutation=Mutation,
+    subscription=Subscription,
+    extensions=[
+        TracingExtension,
+        DocumentCache,
+        *QueryCost.extensions(),
+    ],
+)
+graphql = PersistedQueryRouter(
     schema,
     graphiql=True,
     context_getter=get_graphql_context,
@@ -3,4 +3,12 @@ Tags = [
         "name": "author",
         "description": "Contains CRUD operation on Authors",
     },
+    {
+        "name": "health",
+        "description": "Liveness and readiness of the instance",
+    },
+    {
+        "name": "admin",
+        "description": "Operational insight into the running instance",
+    },
 ]
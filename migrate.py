@@ -0,0 +1,53 @@
+"""
+Datastore migration runner.
+
+    $ python migrate.py Author
+    $ python migrate.py Author --to 2 --rate 200 --batch-size 250
+    $ python migrate.py Author --dry-run
+    $ python migrate.py Author --namespace acme
+
+Applies the migrations registered in the `migrations` package which are newer than the
+version recorded in the checkpoint file, resuming an interrupted run where it stopped.
+"""
+import argparse
+import importlib
+import logging
+import sys
+
+from datastore import database
+from datastore.migration import MigrationRunner, migrations_of
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python migrate.py")
+    parser.add_argument("kind")
+    parser.add_argument("--to", type=int, help="Version to migrate to, latest by default")
+    parser.add_argument("--migrations", default="migrations", help="Module registering the migrations")
+    parser.add_argument("--checkpoint", help="Checkpoint file, .migrations/<kind>.json by default")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rate", type=float, help="Target writes per second")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--namespace", help="Namespace of the tenant to migrate")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    importlib.import_module(args.migrations)
+    if not migrations_of(args.kind):
+        print(f"No migrations registered for {args.kind}")
+        return 1
+
+    runner = MigrationRunner(
+        database.base_client,
+        args.kind,
+        checkpoint_path=args.checkpoint,
+        batch_size=args.batch_size,
+        rate=args.rate,
+        dry_run=args.dry_run,
+        namespace=args.namespace,
+    )
+    print(runner.run(to_version=args.to))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+from datastore.migration import migration, rewrite_with
+from schemas.pydantic.AuthorSchema import Author
+
+
+@migration("Author", 1)
+def fill_books(entity):
+    """Add an empty `books` list to authors stored before it existed"""
+    if "books" in entity:
+        return None
+    entity["books"] = []
+    return entity
+
+
+# Re-save through the current model, so changes of `compressed_fields` or
+# `excluded_indexes` reach existing entities
+migration("Author", 2, "Rewrite authors with the current model")(rewrite_with(Author))
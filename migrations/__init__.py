@@ -0,0 +1,4 @@
+"""
+Registered Datastore migrations, one module per kind, see `datastore.migration`.
+"""
+from migrations import AuthorMigrations
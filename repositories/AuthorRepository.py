@@ -18,6 +18,13 @@ class AuthorRepository(DB):
     ) -> Author:
         return super().upsert(record, data_to_add, **search_args)
 
+    def update(self, id: int, author: Author) -> Optional[Author]:
+        """Update the name of an author, None when it does not exist"""
+        current = super().get(Author.make_key(id=id))
+        if current is None:
+            return None
+        return super().upsert(current, {"name": author.name})
+
     def get(
         self,
         key: Optional[DatabaseKey] = None,
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from core import Warmup
+
+HealthRouter = APIRouter(tags=["health"])
+
+
+@HealthRouter.get("/ready", response_model=dict)
+def ready():
+    """200 once warm-up completed, 503 before"""
+    return JSONResponse(
+        {"ready": Warmup.progress.ready, "warmup": Warmup.metrics()},
+        status_code=200 if Warmup.progress.ready else 503,
+    )
@@ -0,0 +1,149 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Request, status
+
+from core import Compression, Tenancy, Warmup
+from core.MemoryProfiler import memory_profiler
+from core.PersistedQueries import documents, persisted_queries
+from core.ResponseCache import response_cache
+from datastore import counter, entitycache, writebehind
+from datastore.changes import change_bus
+from datastore.offload import offloader
+from datastore.profiler import query_profiler
+
+AdminRouter = APIRouter(
+    prefix="/v1/admin", tags=["admin"]
+)
+
+
+@AdminRouter.get("/queries", response_model=List[dict])
+def queries(
+    slowOnly: Optional[bool] = False,
+    limit: Optional[int] = 100,
+    namespace: Optional[str] = None,
+):
+    return [
+        profile.dict()
+        for profile in query_profiler.profiles(
+            slow_only=slowOnly,
+            limit=limit,
+            namespace=namespace,
+        )
+    ]
+
+
+@AdminRouter.get(
+    "/queries/summary", response_model=List[dict]
+)
+def queries_summary(namespace: Optional[str] = None):
+    return query_profiler.summary(namespace=namespace)
+
+
+@AdminRouter.delete(
+    "/queries", status_code=status.HTTP_204_NO_CONTENT
+)
+def clear_queries():
+    query_profiler.clear()
+
+
+@AdminRouter.get("/write-behind", response_model=List[dict])
+def write_behind():
+    return writebehind.metrics()
+
+
+@AdminRouter.get("/admission", response_model=dict)
+def admission(request: Request):
+    return request.app.state.admission.metrics()
+
+
+@AdminRouter.get("/graphql-cache", response_model=dict)
+def graphql_cache():
+    return {
+        "persisted_queries": persisted_queries.metrics(),
+        "documents": documents.metrics(),
+    }
+
+
+@AdminRouter.get("/compression", response_model=dict)
+def compression():
+    return Compression.metrics()
+
+
+@AdminRouter.get("/response-cache", response_model=dict)
+def response_cache_metrics():
+    return response_cache.metrics()
+
+
+@AdminRouter.delete(
+    "/response-cache", status_code=status.HTTP_204_NO_CONTENT
+)
+def clear_response_cache():
+    response_cache.clear()
+
+
+@AdminRouter.get("/tenants", response_model=dict)
+def tenants():
+    return Tenancy.metrics()
+
+
+@AdminRouter.get("/counters", response_model=List[dict])
+def counters():
+    return counter.metrics()
+
+
+@AdminRouter.get("/changes", response_model=dict)
+def changes():
+    return change_bus.metrics()
+
+
+@AdminRouter.get("/entity-cache", response_model=List[dict])
+def entity_cache():
+    return entitycache.metrics()
+
+
+@AdminRouter.delete(
+    "/entity-cache", status_code=status.HTTP_204_NO_CONTENT
+)
+def clear_entity_cache():
+    entitycache.clear_all()
+
+
+@AdminRouter.get("/warmup", response_model=dict)
+def warmup():
+    return Warmup.metrics()
+
+
+@AdminRouter.get("/offload", response_model=dict)
+def offload():
+    return offloader.metrics()
+
+
+@AdminRouter.get("/memory", response_model=dict)
+def memory():
+    return memory_profiler.metrics()
+
+
+@AdminRouter.get("/memory/top", response_model=List[dict])
+def memory_top(limit: Optional[int] = 20, groupBy: Optional[str] = "lineno"):
+    if not memory_profiler.enabled:
+        raise HTTPException(status.HTTP_409_CONFLICT, "Memory profiling is not started")
+    if groupBy not in ("lineno", "filename", "traceback"):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "Expected groupBy lineno, filename or traceback"
+        )
+    return memory_profiler.top_allocations(limit, groupBy)
+
+
+@AdminRouter.post("/memory/start", status_code=status.HTTP_204_NO_CONTENT)
+def start_memory_profiling(frames: Optional[int] = None):
+    memory_profiler.start(frames)
+
+
+@AdminRouter.post("/memory/stop", status_code=status.HTTP_204_NO_CONTENT)
+def stop_memory_profiling():
+    memory_profiler.stop()
+
+
+@AdminRouter.delete("/memory", status_code=status.HTTP_204_NO_CONTENT)
+def clear_memory_profile():
+    memory_profiler.reset()
@@ -1,6 +1,23 @@
-from typing import List, Optional
+import asyncio
+from typing import AsyncIterator, List, Optional
 
-from fastapi import APIRouter, Depends, status
+import orjson
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+
+from config import config
+from core import BulkImport
+from core.Tracing import traced
+from datastore import export
+from datastore.changes import Operation, Subscription, TooManySubscribers
 
 from schemas.pydantic.AuthorSchema import (
     Author,
@@ -12,23 +29,147 @@ AuthorRouter = APIRouter(
 )
 
 
+def parse_include(
+    include: Optional[str] = None,
+) -> Optional[List[str]]:
+    """Comma separated relationships to load, e.g. `include=books`"""
+    if not include:
+        return None
+    names = [name.strip() for name in include.split(",")]
+    unknown = set(names) - set(Author.DatastoreConfig.foreign_keys)
+    if unknown:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            f"Unknown relationships: {', '.join(sorted(unknown))}",
+        )
+    return names
+
+
 @AuthorRouter.get("/", response_model=List[Author])
+@traced("router.AuthorRouter.index")
 def index(
     name: Optional[str] = None,
     pageSize: Optional[int] = 100,
     startIndex: Optional[int] = 0,
+    include: Optional[List[str]] = Depends(parse_include),
     authorService: AuthorService = Depends(),
 ):
     return [
         author
-        for author in authorService.list(pageSize=pageSize
+        for author in authorService.list(
+            pageSize=pageSize, include=include
         )
     ]
 
 
+async def _event_stream(subscription: Subscription) -> AsyncIterator[bytes]:
+    """Server-sent events of a subscription, with keep-alive comments when idle"""
+    with subscription:
+        dropped = 0
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), config.CHANGES_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if subscription.dropped != dropped:
+                # Changes were lost, the client should refetch what it shows
+                yield b"event: lagged\ndata: %d\n\n" % (subscription.dropped - dropped)
+                dropped = subscription.dropped
+            yield b"id: %d\nevent: %s\ndata: %s\n\n" % (
+                event.sequence,
+                event.operation.encode(),
+                orjson.dumps(event.dict()),
+            )
+
+
+@AuthorRouter.get(
+    "/changes",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+)
+async def changes(
+    request: Request,
+    ids: Optional[List[int]] = Query(None),
+    operations: Optional[List[str]] = Query(None),
+    authorService: AuthorService = Depends(),
+):
+    """Stream the changes of authors as server-sent events, instead of polling.
+    Filter by author `ids` and `operations`, "upsert" or "delete". Reconnecting clients
+    sending `Last-Event-ID` receive the recent changes they missed."""
+    unknown = set(operations or ()) - {Operation.UPSERT, Operation.DELETE}
+    if unknown:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            f"Unknown operations: {', '.join(sorted(unknown))}",
+        )
+    last_event_id = request.headers.get("last-event-id", "")
+    try:
+        subscription = authorService.subscribe(
+            ids,
+            operations,
+            since=int(last_event_id) if last_event_id.isdigit() else None,
+        )
+    except TooManySubscribers:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Too many subscribers")
+    return StreamingResponse(
+        _event_stream(subscription),
+        media_type="text/event-stream",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
+
+
+@AuthorRouter.get(
+    "/export",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in export.MEDIA_TYPES.values()}}
+    },
+)
+@traced("router.AuthorRouter.export")
+def export_authors(
+    format: str = export.PARQUET,
+    authorService: AuthorService = Depends(),
+):
+    """Export every author for analytics, as Parquet or as an Arrow IPC stream with
+    `format=arrow`. Streamed one record batch at a time, in bounded memory."""
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            f"Expected format {' or '.join(export.MEDIA_TYPES)}",
+        )
+    if not export.is_available():
+        raise HTTPException(
+            status.HTTP_501_NOT_IMPLEMENTED, "Exports require the pyarrow package"
+        )
+    extension = "parquet" if format == export.PARQUET else "arrows"
+    return StreamingResponse(
+        authorService.export(format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "content-disposition": f'attachment; filename="authors.{extension}"'
+        },
+    )
+
+
 @AuthorRouter.get("/{id}", response_model=Author)
-def get(id: int, authorService: AuthorService = Depends()):
-    return authorService.get(id)
+@traced("router.AuthorRouter.get")
+def get(
+    id: int,
+    include: Optional[List[str]] = Depends(parse_include),
+    authorService: AuthorService = Depends(),
+):
+    return authorService.get(id, include)
+
+
+@AuthorRouter.head("/{id}")
+@traced("router.AuthorRouter.exists")
+def exists(id: int, authorService: AuthorService = Depends()):
+    if not authorService.exists(id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return Response(status_code=status.HTTP_200_OK)
 
 
 @AuthorRouter.post(
@@ -36,6 +177,7 @@ def get(id: int, authorService: AuthorService = Depends()):
     response_model=Author,
     status_code=status.HTTP_201_CREATED,
 )
+@traced("router.AuthorRouter.create")
 def create(
     author: Author,
     authorService: AuthorService = Depends(),
@@ -43,19 +185,62 @@ def create(
     return authorService.create(author)
 
 
+class ImportResponse(StreamingResponse):
+    """Streamed while the request body is still being read.
+    `StreamingResponse` listens for the client disconnecting on the receive channel,
+    which would swallow the body of the upload, so this one only sends."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@AuthorRouter.post(
+    "/import",
+    response_class=ImportResponse,
+    responses={200: {"content": {BulkImport.NDJSON: {}}}},
+)
+@traced("router.AuthorRouter.import_authors")
+async def import_authors(
+    request: Request,
+    authorService: AuthorService = Depends(),
+):
+    """Import NDJSON or CSV authors, the body is streamed in constant memory.
+    Responds with one NDJSON report per chunk of rows written, then a summary."""
+    parser = BulkImport.parser_of(request.headers.get("content-type", ""))
+    if parser is None:
+        raise HTTPException(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            f"Expected {BulkImport.NDJSON} or {BulkImport.CSV}",
+        )
+    reports = authorService.import_rows(request.stream(), parser)
+    return ImportResponse(
+        (orjson.dumps(report) + b"\n" async for report in reports),
+        media_type=BulkImport.NDJSON,
+    )
+
+
 @AuthorRouter.patch("/{id}", response_model=Author)
+@traced("router.AuthorRouter.update")
 def update(
     id: int,
     author: Author,
     authorService: AuthorService = Depends(),
 ):
-    return authorService.update(id, author)
+    updated = authorService.update(id, author)
+    if updated is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return updated
 
 
 @AuthorRouter.delete(
     "/{id}", status_code=status.HTTP_204_NO_CONTENT
 )
+@traced("router.AuthorRouter.delete")
 def delete(
     id: int, authorService: AuthorService = Depends()
 ):
-    return authorService.delete(id)
\ No newline at end of file
+    if not authorService.delete(id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
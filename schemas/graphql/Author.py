@@ -1,13 +1,38 @@
-from typing import List
+from enum import Enum
+from typing import List, Optional
 import strawberry
 
+from datastore.changes import Operation
+
+
+@strawberry.type(description="Book Schema")
+class BookSchema:
+    id: int
+    name: str
+
 
 @strawberry.type(description="Author Schema")
 class AuthorSchema:
     id: int
     name: str
+    books: List[BookSchema]
 
 
 @strawberry.input(description="Author Mutation Schema")
 class AuthorMutationSchema:
     name: str
+
+
+@strawberry.enum(description="Change Operation")
+class ChangeOperation(Enum):
+    UPSERT = Operation.UPSERT
+    DELETE = Operation.DELETE
+
+
+@strawberry.type(description="Author Change Schema")
+class AuthorChangeSchema:
+    sequence: int
+    operation: ChangeOperation
+    id: int
+    # The author written, null for deletes
+    author: Optional[AuthorSchema]
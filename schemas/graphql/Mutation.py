@@ -8,33 +8,42 @@ from schemas.graphql.Author import (
     AuthorMutationSchema,
     AuthorSchema,
 )
+from schemas.graphql.Query import get_includes
 
 @strawberry.type(description="Mutate all Entity")
 class Mutation:
     @strawberry.field(description="Adds a new Author")
-    def add_author(
+    async def add_author(
         self, author: AuthorMutationSchema, info: Info
     ) -> AuthorSchema:
         authorService = get_AuthorService(info)
-        return authorService.create(author)
+        created = await authorService.create_async(author)
+        # Written authors hold book ids, loaded when `books` is selected
+        await authorService.include_async([created], get_includes(info))
+        return created
 
     @strawberry.field(
         description="Delets an existing Author"
     )
-    def delete_author(
+    async def delete_author(
         self, author_id: int, info: Info
-    ) -> None:
+    ) -> bool:
         authorService = get_AuthorService(info)
-        return authorService.delete(author_id)
+        return await authorService.delete_async(author_id)
 
     @strawberry.field(
         description="Updates an existing Author"
     )
-    def update_author(
+    async def update_author(
         self,
         author_id: int,
         author: AuthorMutationSchema,
         info: Info,
     ) -> AuthorSchema:
         authorService = get_AuthorService(info)
-        return authorService.update(author_id, author)
\ No newline at end of file
+        updated = await authorService.update_async(
+            author_id, author
+        )
+        if updated is not None:
+            await authorService.include_async([updated], get_includes(info))
+        return updated
\ No newline at end of file
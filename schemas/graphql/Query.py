@@ -1,24 +1,63 @@
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import strawberry
 from strawberry.types import Info
+from strawberry.types.nodes import SelectedField
 from configs.GraphQL import (
     get_AuthorService,
 )
 
 from schemas.graphql.Author import AuthorSchema
+from schemas.pydantic.AuthorSchema import Author
+
+
+def _selected_fields(selections) -> Iterator[SelectedField]:
+    for selection in selections:
+        if isinstance(selection, SelectedField):
+            yield selection
+        else:
+            # Fragments, whose fields belong to the same object
+            yield from _selected_fields(selection.selections)
+
+
+def get_includes(info: Info, field: Optional[str] = None) -> Optional[List[str]]:
+    """Relationships selected in the query, loaded in one batch by the resolver.
+    Args:
+        field (str): Selected field holding the authors, the resolved field by default
+    """
+    relationships = Author.DatastoreConfig.foreign_keys
+    selections = [
+        selection
+        for selected in info.selected_fields
+        for selection in _selected_fields(selected.selections)
+    ]
+    if field is not None:
+        selections = [
+            selection
+            for selected in selections
+            if selected.name == field
+            for selection in _selected_fields(selected.selections)
+        ]
+    names = {selection.name for selection in selections if selection.name in relationships}
+    return sorted(names) or None
 
 
 @strawberry.type(description="Query all entities")
 class Query:
     @strawberry.field(description="Get an Author")
-    def author(
+    async def author(
         self, id: int, info: Info
     ) -> Optional[AuthorSchema]:
         authorService = get_AuthorService(info)
-        return authorService.get(id)
+        return await authorService.get_async(
+            id, get_includes(info)
+        )
 
     @strawberry.field(description="List all Authors")
-    def authors(self, info: Info) -> List[AuthorSchema]:
+    async def authors(
+        self, info: Info, page_size: Optional[int] = 100
+    ) -> List[AuthorSchema]:
         authorService = get_AuthorService(info)
-        return authorService.list()
\ No newline at end of file
+        return await authorService.list_async(
+            pageSize=page_size, include=get_includes(info)
+        )
\ No newline at end of file
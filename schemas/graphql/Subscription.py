@@ -0,0 +1,44 @@
+from typing import AsyncGenerator, List, Optional
+
+import strawberry
+from strawberry.types import Info
+from configs.GraphQL import (
+    get_AuthorService,
+)
+
+from schemas.graphql.Author import (
+    AuthorChangeSchema,
+    ChangeOperation,
+)
+from schemas.graphql.Query import get_includes
+
+
+@strawberry.type(description="Subscribe to Entity changes")
+class Subscription:
+    @strawberry.subscription(
+        description="Changes of Authors, as they are written"
+    )
+    async def author_changes(
+        self,
+        info: Info,
+        ids: Optional[List[int]] = None,
+        operations: Optional[List[ChangeOperation]] = None,
+    ) -> AsyncGenerator[AuthorChangeSchema, None]:
+        authorService = get_AuthorService(info)
+        includes = get_includes(info, "author")
+        with authorService.subscribe(
+            ids,
+            [operation.value for operation in operations or ()],
+        ) as subscription:
+            async for event in subscription:
+                author = event.record
+                if author is not None and includes:
+                    # Records are shared by every subscriber, load into a copy
+                    author = author.copy()
+                    await authorService.include_async([author], includes)
+                yield AuthorChangeSchema(
+                    sequence=event.sequence,
+                    operation=ChangeOperation(event.operation),
+                    id=int(event.id),
+                    author=author,
+                )
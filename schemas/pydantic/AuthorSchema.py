@@ -1,4 +1,7 @@
+from typing import List, Union
+
 from datastore import DatastoreEntity
+from schemas.pydantic.BookSchema import Book
 
 
 
@@ -6,9 +9,11 @@ class Author(DatastoreEntity):
 
     id: int
     name: str
-    books: list = []
+    # Book ids, or the books themselves when loaded with `include=["books"]`
+    books: List[Union[int, Book]] = []
 
     class DatastoreConfig(DatastoreEntity.DatastoreConfig):
         kind = "Author"
         key_pattern = "{id}"
-
+        foreign_keys = {"books": Book}
+        cache = True
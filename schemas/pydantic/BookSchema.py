@@ -0,0 +1,12 @@
+from datastore import DatastoreEntity
+
+
+
+class Book(DatastoreEntity):
+
+    id: int
+    name: str
+
+    class DatastoreConfig(DatastoreEntity.DatastoreConfig):
+        kind = "Book"
+        key_pattern = "{id}"
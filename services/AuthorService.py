@@ -1,9 +1,40 @@
-from typing import List, Optional
+from typing import (
+    AsyncIterator,
+    Callable,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
 
 from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+
+from core import BulkImport
+from core.ResponseCache import response_cache
+from core.Tracing import traced
+from datastore.changes import Subscription, change_bus
+from datastore import export
+from datastore.counter import ShardedCounter
 from repositories.AuthorRepository import AuthorRepository
 from schemas.pydantic.AuthorSchema import Author
 
+# Tag of the cached responses listing authors
+CACHE_TAG = "authors"
+
+# Per author aggregates, written too often to be kept on the Author entity
+COUNTERS = {
+    "books": ShardedCounter("Author.books"),
+    "views": ShardedCounter("Author.views"),
+}
+
+
+def _counter(name: str) -> ShardedCounter:
+    try:
+        return COUNTERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown author counter '{name}'") from None
 
 
 class AuthorService:
@@ -14,30 +45,169 @@ class AuthorService:
     ) -> None:
         self.db = authorRepository
 
+    @traced("service.AuthorService.create")
     def create(self, author: Author) -> Author:
-        return self.db.create(
-            author
-        )
+        created = self.db.create(author)
+        response_cache.invalidate(CACHE_TAG)
+        return created
 
-    def delete(self, author_id: int) -> None:
-        return self.db.delete(id=author_id
+    def write_many(self, authors: List[Author]) -> int:
+        written = self.db.upsert_many(authors)
+        response_cache.invalidate(CACHE_TAG)
+        return written
+
+    def import_rows(
+        self, chunks: AsyncIterator[bytes], parser: Callable
+    ) -> AsyncIterator[dict]:
+        """Import a stream of authors, see `core.BulkImport`.
+        Args:
+            chunks: Body of the upload
+            parser: `BulkImport.parse_ndjson` or `BulkImport.parse_csv`
+        Returns:
+            The report of every chunk written, then a summary
+        """
+        return BulkImport.import_rows(
+            parser(chunks),
+            Author,
+            self.write_many,
+            csv_rows=parser is BulkImport.parse_csv,
         )
 
-    def get(self, author_id: int) -> Author:
-        return self.db.get(id=author_id
+    def export(self, format: str = export.PARQUET) -> Iterator[bytes]:
+        """Every author as Parquet or Arrow IPC, see `datastore.export`.
+        Blocking, the chunks are produced as the kind is scanned"""
+        return export.stream(Author, self.db.scan(), format)
+
+    @traced("service.AuthorService.delete")
+    def delete(self, author_id: int) -> bool:
+        key = Author.make_key(id=author_id)
+        if not self.db.exists(key):
+            return False
+        deleted = self.db.delete(key)
+        response_cache.invalidate(CACHE_TAG)
+        return deleted
+
+    @traced("service.AuthorService.exists")
+    def exists(self, author_id: int) -> bool:
+        return self.db.exists(Author.make_key(id=author_id))
+
+    @traced("service.AuthorService.get")
+    def get(
+        self, author_id: int, include: Optional[List[str]] = None
+    ) -> Author:
+        return self.db.get(
+            Author.make_key(id=author_id), include=include
         )
 
+    @traced("service.AuthorService.list")
     def list(
         self,
         name: Optional[str] = None,
         pageSize: Optional[int] = 100,
         startIndex: Optional[int] = 0,
+        include: Optional[List[str]] = None,
     ) -> List[Author]:
-        return self.db.list(limit=pageSize)
+        return self.db.list(limit=pageSize, include=include)
 
+    @traced("service.AuthorService.include")
+    def include(
+        self, authors: List[Author], include: Optional[List[str]] = None
+    ) -> List[Author]:
+        """Load the relationships of authors in one batch, see `DB.include`"""
+        if not include:
+            return authors
+        return self.db.include(authors, include)
+
+    @traced("service.AuthorService.update")
     def update(
         self, author_id: int, author_body: Author
+    ) -> Optional[Author]:
+        updated = self.db.update(author_id, author_body)
+        if updated is not None:
+            response_cache.invalidate(CACHE_TAG)
+        return updated
+
+    def subscribe(
+        self,
+        author_ids: Optional[Collection[int]] = None,
+        operations: Optional[Collection[str]] = None,
+        since: Optional[int] = None,
+    ) -> Subscription:
+        """Subscribe to the changes of authors, from an event loop.
+        Args:
+            author_ids: Only the changes of these authors
+            operations: Only these operations, see `datastore.changes.Operation`
+            since (int): Replay the kept changes following this sequence
+        """
+        return change_bus.subscribe(
+            Author.DatastoreConfig.kind,
+            ids=author_ids,
+            operations=operations,
+            since=since,
+        )
+
+    @traced("service.AuthorService.increment")
+    def increment(
+        self, author_id: int, counter: str, delta: int = 1
+    ) -> None:
+        _counter(counter).increment(author_id, delta)
+
+    @traced("service.AuthorService.counts")
+    def counts(
+        self, author_ids: List[int], counter: str
+    ) -> Dict[int, int]:
+        return _counter(counter).values(author_ids)
+
+    # Non-blocking variants for async callers, the Datastore client is
+    # blocking so each call runs on the threadpool
+    async def create_async(self, author: Author) -> Author:
+        return await run_in_threadpool(self.create, author)
+
+    async def delete_async(self, author_id: int) -> bool:
+        return await run_in_threadpool(self.delete, author_id)
+
+    async def get_async(
+        self, author_id: int, include: Optional[List[str]] = None
     ) -> Author:
-        return self.db.update(
-            author_id, Author(name=author_body.name)
-        )
\ No newline at end of file
+        return await run_in_threadpool(
+            self.get, author_id, include
+        )
+
+    async def list_async(
+        self,
+        name: Optional[str] = None,
+        pageSize: Optional[int] = 100,
+        startIndex: Optional[int] = 0,
+        include: Optional[List[str]] = None,
+    ) -> List[Author]:
+        return await run_in_threadpool(
+            self.list, name, pageSize, startIndex, include
+        )
+
+    async def include_async(
+        self, authors: List[Author], include: Optional[List[str]] = None
+    ) -> List[Author]:
+        if not include:
+            return authors
+        return await run_in_threadpool(self.include, authors, include)
+
+    async def update_async(
+        self, author_id: int, author_body: Author
+    ) -> Optional[Author]:
+        return await run_in_threadpool(
+            self.update, author_id, author_body
+        )
+
+    async def increment_async(
+        self, author_id: int, counter: str, delta: int = 1
+    ) -> None:
+        return await run_in_threadpool(
+            self.increment, author_id, counter, delta
+        )
+
+    async def counts_async(
+        self, author_ids: List[int], counter: str
+    ) -> Dict[int, int]:
+        return await run_in_threadpool(
+            self.counts, author_ids, counter
+        )